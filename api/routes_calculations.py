@@ -1,9 +1,19 @@
 
 
-from fastapi import APIRouter, FastAPI, HTTPException
-from pydantic import BaseModel, Field
+import asyncio
+from typing import Dict, List, Optional, Tuple
 
-from maths_engine.configuration import Configuration
+from fastapi import APIRouter, FastAPI, HTTPException, Request
+from pydantic import BaseModel, Field, validator
+
+from maths_engine.configuration import Configuration, DEFAULT_WEIGHT_RESOLUTION, check_weight_resolution
+from maths_engine.exact_rtp import ExactRtpCalculator
+from maths_engine.free_spins_solver import FreeSpinsSolver
+from maths_engine.payout_distribution import DEFAULT_WIN_THRESHOLDS, PayoutDistribution
+from maths_engine.result_cache import canonical_configuration, canonical_key
+from maths_engine.simulation_pool import build_configuration, exact_distribution_task
+from maths_engine.slot_machine_engine import SlotMachineEngine
+from maths_engine.state_manager import StateManager
 
 app = FastAPI()
 
@@ -46,6 +56,125 @@ async def calculate_paytable_and_weights(request: CalculationRequest):
     except Exception as e:
         raise Exception(str(e)) from None
 
+
+class ExactRtpRequest(BaseModel):
+    rows: int = Field(3, description="Number of rows in the slot machine.")
+    columns: int = Field(5, description="Number of columns in the slot machine.")
+    symbols: int = Field(10, description="Number of different symbols in the slot machine.")
+    wild_symbol: int = Field(9, description="The symbol that acts as the wild.")
+    weight_formula: str = Field("math.exp(-x / 15)", description="Formula for symbol weight distribution.")
+    payout_formula: str = Field("1.5 * x", description="Formula for payout calculation.")
+    weight_resolution: int = Field(DEFAULT_WEIGHT_RESOLUTION, gt=0,
+                                   description="Integer units each reel's symbol weights are apportioned onto.")
+    custom_symbol_payouts: Optional[Dict[int, float]] = Field({}, description="Custom payouts for each symbol.")
+    custom_paylines: Optional[Dict[str, List[Tuple[int, int]]]] = Field(None, description="Custom paylines.")
+    scatter_symbol: Optional[int] = Field(None, description="Scatter icon used by the line rules, if any.")
+    icon: Optional[int] = Field(None, description="Icon removed from the blocked reels.")
+    blocked_reels: List[int] = Field([], description="Reels on which the icon is blocked.")
+
+    @validator("weight_resolution")
+    def weight_resolution_fits_draw(cls, value, values):
+        check_weight_resolution(values.get("symbols", 10), value)
+        return value
+
+
+class ExactRtpResponse(BaseModel):
+    rtp: float = Field(..., description="Exact base-game RTP in percent.")
+    line_contributions: list = Field(..., description="RTP share and hit probability per payline.")
+    symbol_contributions: dict = Field(..., description="RTP share per paying symbol.")
+
+
+def build_exact_engine(request: ExactRtpRequest) -> SlotMachineEngine:
+    # The same configuration a simulation of this request would play
+    config = build_configuration(request.model_dump())
+    return SlotMachineEngine(config=config, state_manager=StateManager(initial_state={"config": config}))
+
+
+@calculations_router.post("/exact_rtp", response_model=ExactRtpResponse)
+async def exact_rtp(request: ExactRtpRequest):
+    engine = build_exact_engine(request)
+    try:
+        result = ExactRtpCalculator(
+            engine,
+            scatter_symbol=request.scatter_symbol,
+            icon=request.icon,
+            blocked_reels=request.blocked_reels,
+        ).calculate()
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e)) from e
+    return ExactRtpResponse(**result)
+
+
+class ExactDistributionRequest(ExactRtpRequest):
+    win_thresholds: List[float] = Field(list(DEFAULT_WIN_THRESHOLDS),
+                                        description="Win sizes, in multiples of the bet, to report P(win >= k x bet) for.")
+
+
+class ExactDistributionResponse(BaseModel):
+    rtp: float = Field(..., description="Exact base-game RTP in percent.")
+    hit_frequency: float = Field(..., description="Percentage of spins that win anything.")
+    variance: float = Field(..., description="Variance of the spin payout, in squared multiples of the bet.")
+    standard_deviation: float = Field(..., description="Standard deviation of the spin payout in multiples of the bet.")
+    volatility_index: float = Field(..., description="Volatility index at 90% confidence.")
+    win_probabilities: Dict[float, float] = Field(..., description="P(win >= k x bet) per requested k.")
+    histogram: list = Field(..., description="Probability of every distinct payout, in multiples of the bet.")
+
+
+async def solve_exact_distribution(app_request: Request, params: dict) -> PayoutDistribution:
+    """
+    Exact spin payout distribution for request-named ``params`` (the fields of
+    ``ExactDistributionRequest``). Full-size games take minutes of pure-Python
+    work, so the solve runs in a worker of the app's process pool and its
+    result is kept in the app's result cache.
+    """
+    key = canonical_key({
+        "purpose": "exact_distribution",
+        "config": canonical_configuration(build_configuration(params)),
+        **{field: params.get(field) for field in ("scatter_symbol", "icon", "blocked_reels")},
+    })
+    cache = app_request.app.state.result_cache
+    distribution = cache.get(key)
+    if distribution is None:
+        distribution = await asyncio.wrap_future(
+            app_request.app.state.simulation_pool.submit_task(exact_distribution_task, params))
+        cache.put(key, distribution)
+    return distribution
+
+
+@calculations_router.post("/exact_distribution", response_model=ExactDistributionResponse)
+async def exact_distribution(request: ExactDistributionRequest, app_request: Request):
+    try:
+        distribution = await solve_exact_distribution(app_request, request.model_dump())
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e)) from e
+    return ExactDistributionResponse(**distribution.summary(request.win_thresholds))
+
+
+class FreeSpinsValueRequest(ExactRtpRequest):
+    icon: int = Field(10, description="Symbol that triggers free spins.")
+    blocked_reels: List[int] = Field([0, 4], description="Reels that cannot trigger free spins.")
+
+
+class FreeSpinsValueResponse(BaseModel):
+    rtp: float = Field(..., description="Base game plus feature RTP per paid spin, in percent.")
+    base_rtp: float = Field(..., description="RTP share of the paid spins.")
+    feature_rtp: float = Field(..., description="RTP share of the free-spins feature.")
+    trigger_probability: float = Field(..., description="Probability that a paid spin triggers the feature.")
+    retrigger_probabilities: Dict[int, float] = Field(..., description="Probability of each award during free spins.")
+    expected_retrigger_spins: float = Field(..., description="Expected free spins awarded per free spin.")
+    expected_feature_spins: float = Field(..., description="Expected free spins played per feature.")
+    expected_feature_payout: float = Field(..., description="Expected feature payout in multiples of the bet.")
+
+
+@calculations_router.post("/free_spins_value", response_model=FreeSpinsValueResponse)
+async def free_spins_value(request: FreeSpinsValueRequest):
+    engine = build_exact_engine(request)
+    try:
+        result = FreeSpinsSolver(engine, icon=request.icon, blocked_reels=request.blocked_reels).calculate()
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e)) from e
+    return FreeSpinsValueResponse(**result)
+
 app.include_router(calculations_router, prefix="/api/v1")
 
 
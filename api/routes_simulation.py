@@ -1,26 +1,41 @@
 # routes_simulation.py
 # DO NOT DELETE THIS!!!
+import json
 import logging
+import os
+import random
 import requests
 import traceback
+import uuid
 
-from typing import Dict, List, Optional, Tuple, Union, Any
+from typing import ClassVar, Dict, List, Optional, Tuple, Union, Any
 from fastapi import APIRouter, HTTPException, Request
-from fastapi.responses import StreamingResponse, PlainTextResponse
+from fastapi.responses import FileResponse, StreamingResponse, PlainTextResponse
 from pydantic import BaseModel, Field, validator
-from maths_engine.configuration import Configuration
-from maths_engine.simulation import Simulation, run_simulation_async
+from maths_engine.configuration import DEFAULT_WEIGHT_RESOLUTION, check_weight_resolution
+from maths_engine.isaac_rng_v2 import substream_seed
+from maths_engine.detail_capture import (DEFAULT_CAPTURE_SIZE, MAX_DETAIL_STREAMS, DetailCapture, detail_stream_path,
+                                         prune_detail_streams)
+from maths_engine.importance_sampling import (DEFAULT_TAIL_MULTIPLIERS, MAX_IMPORTANCE_SPINS,
+                                              run_importance_sampling_task)
+from maths_engine.parameter_sweep import MAX_SWEEP_SPINS, SWEEP_FIELDS, run_sweep_task, sweep_variants
+from maths_engine.simulation import (MAX_FAST_SIMULATION_SPINS, MAX_SIMULATION_SPINS, Simulation,
+                                     run_simulation_async)
+from maths_engine.simulation_jobs import MAX_JOB_SPINS, SimulationJob
+from maths_engine.simulation_pool import build_configuration, build_simulation, cacheable, simulation_cache_key
+from maths_engine.spin_statistics import (DEFAULT_CONFIDENCE, merge_moments, new_moments, return_statistics,
+                                          rtp_half_width, z_value)
 from maths_engine.state_manager import StateManager
 from maths_engine.plugin_manager import PluginManager  # Import PluginManager
 from api.routes_calculations import CalculationResponse, CalculationRequest, calculate_paytable_and_weights
-import concurrent.futures
 import asyncio
 import requests
 import matplotlib.pyplot as plt
 import numpy as np
 import io
 import math
-from api.routes_calculations import CalculationRequest, calculate_paytable_and_weights, CalculationResponse
+from api.routes_calculations import (CalculationRequest, calculate_paytable_and_weights, CalculationResponse,
+                                     solve_exact_distribution)
 from api.routes_spin import SpinRequest, spin
 
 # from icecream import ic
@@ -68,8 +83,14 @@ class RunSimulationRequest(BaseModel):
         description="The amount of the bet for each spin.",
         examples=[100])
     num_spins: int = Field(...,
-                           description="The number of spins to simulate.",
-                           examples=[10000], le=1_200_000)
+                           description="The number of spins to simulate: at most 1.2M, or 50M with fast. Extend "
+                                       "a stored run or submit a simulation job for more.",
+                           examples=[10000], gt=0)
+    seed: Optional[int] = Field(
+        None,
+        description="Seed for the Isaac RNG stream. A random seed is drawn and reported when omitted.",
+        examples=[123456789],
+    )
     starting_capital: float = Field(
         ...,
         description="The initial capital before starting the simulation.",
@@ -102,11 +123,68 @@ class RunSimulationRequest(BaseModel):
         description="Formula for symbol weight distribution.")
     payout_formula: Optional[str] = Field(
         "1.5 * x", description="Formula for payout calculation.")
+    weight_resolution: int = Field(
+        DEFAULT_WEIGHT_RESOLUTION,
+        description="Integer units each reel's symbol weights are apportioned onto.",
+        gt=0)
     detail_level: str = Field(
         "basic",
         description="Level of detail for the simulation results.",
         examples=["basic", "detailed"],
     )
+    detail_capture: str = Field(
+        "none",
+        description="Per-spin detail to keep: none, ring (last detail_capture_size spins), every "
+                    "(every detail_capture_every-th spin), threshold (wins of at least "
+                    "detail_capture_threshold times the bet) or stream (every spin, written to a file "
+                    "downloaded from GET /detailed-results/{detailed_results_id}).",
+        examples=["none", "ring", "every", "threshold", "stream"],
+    )
+    detail_capture_size: int = Field(
+        DEFAULT_CAPTURE_SIZE, description="Most per-spin records kept in memory.", gt=0)
+    detail_capture_every: int = Field(
+        1000, description="Spacing of the spins kept by the every mode.", gt=0)
+    detail_capture_threshold: float = Field(
+        0.0, description="Smallest win, in multiples of the bet, kept by the threshold mode; losing spins are "
+                         "never kept.", ge=0)
+    fast: bool = Field(
+        False,
+        description="Run the batch simulation kernel (no plugins or free_spins only; no per-spin detail).")
+    target_rtp_half_width: Optional[float] = Field(
+        None,
+        description="Stop /run_simulation as soon as the confidence interval of the RTP is at most this many "
+                    "percentage points either side; num_spins is then the spin budget.",
+        examples=[0.1],
+        gt=0)
+    confidence_level: float = Field(
+        DEFAULT_CONFIDENCE,
+        description="Confidence of the target_rtp_half_width interval and of the confidence level report.",
+        examples=[0.95],
+        gt=0, lt=1)
+    control_variate: bool = Field(
+        False,
+        description="Also estimate the RTP with the line returns as a control variate, whose expectation is "
+                    "computed exactly (no plugins or free_spins only); /run_simulation reports it under "
+                    "additional_results.control_variate.")
+    stratified_reels: int = Field(
+        0,
+        description="Stratify the base game grids on the column outcomes of their first 1 or 2 reels, in "
+                    "proportion to their exact probabilities (fast runs only); /run_simulation reports the "
+                    "standard errors under additional_results.stratified_sampling.",
+        ge=0, le=2)
+    exact_reference: bool = Field(
+        False,
+        description="Also solve the base game's exact payout distribution (minutes for full-size games, then "
+                    "cached) and report its RTP, spread, win probabilities and exact margin of error next to "
+                    "the profile point and confidence level reports' estimates.")
+    store_run: bool = Field(
+        False,
+        description="Keep the finished run so POST /run_simulation/{run_id}/extend can add spins to it; the "
+                    "run_id is returned in additional_results.")
+    cache: Optional[bool] = Field(
+        None,
+        description="Use the result cache. Seeded requests are cached unless this is false; unseeded ones only "
+                    "when it is true, and then reuse the results of the first unseeded run of the same request.")
     custom_symbol_payouts: Optional[Dict[int, float]] = Field(
         {},
         description="Custom payouts for each symbol in the slot machine.",
@@ -140,6 +218,23 @@ class RunSimulationRequest(BaseModel):
         }],
     )
 
+    # Most spins a request may ask for, without and with the batch kernel
+    max_spins: ClassVar[int] = MAX_SIMULATION_SPINS
+    max_fast_spins: ClassVar[int] = MAX_FAST_SIMULATION_SPINS
+
+    @validator("weight_resolution")
+    def weight_resolution_fits_draw(cls, value, values):
+        check_weight_resolution(values.get("symbols", 10), value)
+        return value
+
+    @validator("fast", always=True)
+    def num_spins_fit_kernel(cls, value, values):
+        limit = cls.max_fast_spins if value else cls.max_spins
+        if values.get("num_spins", 0) > limit:
+            raise ValueError(f"num_spins is at most {limit} {'with' if value else 'without'} fast; extend a stored "
+                             f"run or submit a simulation job for more")
+        return value
+
 
 class RunSimulationResponse(BaseModel):
     total_bets: float = Field(..., examples=[17.0])
@@ -160,6 +255,8 @@ class RunSimulationResponse(BaseModel):
 class RunSimulationReportResponse(BaseModel):
     result_across_all_batches: List[RunSimulationResponse]
     profile_range: List
+    master_seed: Optional[int] = None
+    exact_base_game: Optional[dict] = None
 
 
 class AggregatedSimulationResult(BaseModel):
@@ -174,6 +271,7 @@ class AggregatedSimulationResult(BaseModel):
     current_free_spins: int
     calculations: Optional[CalculationResponse]
     all_additional_results: Optional[Any]
+    master_seed: Optional[int] = None
 
     @validator("total_bets", pre=True, allow_reuse=True)
     def convert_float_to_int(cls, value):
@@ -194,6 +292,35 @@ class RunSimulationReportFinalResponse(BaseModel):
 #     max_rounds: Optional[int] = 1000  # Optional max rounds to prevent infinite loops
 
 
+def build_detail_capture(request: RunSimulationRequest) -> DetailCapture:
+    """
+    Detail capture for a request; streamed runs get a fresh stream id, whose
+    file GET /detailed-results/{stream_id} serves, and the oldest streams are
+    deleted to make room.
+    """
+    stream_id = None
+    if request.detail_capture == "stream":
+        prune_detail_streams(keep=MAX_DETAIL_STREAMS - 1)
+        stream_id = uuid.uuid4().hex
+    return DetailCapture(mode=request.detail_capture,
+                         size=request.detail_capture_size,
+                         every=request.detail_capture_every,
+                         threshold=request.detail_capture_threshold,
+                         stream_id=stream_id)
+
+
+@simulation_router.get("/detailed-results/{stream_id}")
+async def download_detailed_results(stream_id: str):
+    """Per-spin records of a run with detail_capture=stream, as newline-delimited JSON."""
+    try:
+        path = detail_stream_path(stream_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail=f"Detailed results {stream_id} not found")
+    return FileResponse(path, media_type="application/x-ndjson", filename=f"detailed_results_{stream_id}.jsonl")
+
+
 def fetch_plugin_code(url: str) -> str:
     try:
         response = requests.get(url)
@@ -205,15 +332,8 @@ def fetch_plugin_code(url: str) -> str:
                             detail=f"Error fetching plugin: {e}")
 
 
-@simulation_router.post(
-    "/run_simulation",
-    summary="Run a slot machine simulation",
-    description=
-    "Simulates a series of slot machine spins and returns the results.",
-    response_model=RunSimulationResponse,
-)
-async def run_simulation(request: RunSimulationRequest):
-    # Fetch and execute the plugin code if a URL is provided
+def execute_plugin_url(request: RunSimulationRequest):
+    """Fetch and execute the plugin code if a URL is provided."""
     if request.plugin_url:
         plugin_code = fetch_plugin_code(request.plugin_url)
 
@@ -226,33 +346,30 @@ async def run_simulation(request: RunSimulationRequest):
             raise HTTPException(status_code=500,
                                 detail=f"Error executing plugin: {e}")
 
-    weight_formula = request.weight_formula
-    if weight_formula is None:
-        weight_formula = ""
-
-    payout_formula = request.payout_formula
-    if payout_formula is None:
-        payout_formula = ""
 
-    config = Configuration(
-        rows=request.rows,
-        columns=request.columns,
-        symbols=request.symbols,
-        wild_symbol=request.wild_symbol,
-        weight_formula=weight_formula,
-        payout_formula=payout_formula,
-        symbol_payouts=request.custom_symbol_payouts
-        if request.custom_symbol_payouts else {},
-        custom_paylines=request.custom_paylines,
-    )
-    config.sticky_options = {
-        "duration": request.sticky_duration,
-        "expand": request.expand_stickies,
-        "multiplier": request.sticky_multiplier,
-        "until_bonus": request.until_bonus,
-        "bonus_symbol": request.bonus_symbol,
-    }
-    config.cascading_reels = request.cascading_reels
+@simulation_router.post(
+    "/run_simulation",
+    summary="Run a slot machine simulation",
+    description=
+    "Simulates a series of slot machine spins and returns the results.",
+    response_model=RunSimulationResponse,
+)
+async def run_simulation(request: RunSimulationRequest, app_request: Request):
+    execute_plugin_url(request)
+
+    # Unseeded requests opting in share the entry of the first unseeded run
+    params = request.model_dump()
+    cache = app_request.app.state.result_cache
+    cache_key = None
+    if not request.store_run and cacheable({**params, "seed": 0 if request.cache else request.seed}):
+        cache_key = simulation_cache_key(params, endpoint="run_simulation", detail_level=request.detail_level,
+                                         target_half_width=request.target_rtp_half_width,
+                                         confidence=request.confidence_level)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    config = build_configuration(request.model_dump())
 
     state_manager = StateManager(initial_state={"config": config})
 
@@ -262,20 +379,91 @@ async def run_simulation(request: RunSimulationRequest):
 
     bet_amount = request.bet_amount
 
-    simulation = Simulation(
-        config=config,
-        bet_amount=bet_amount,
-        num_spins=request.num_spins,
-        capital=request.starting_capital,
-        plugins_with_params=request.plugins,
-        state_manager=state_manager,
-        demo_params=request.demo_params,
+    try:
+        simulation = Simulation(
+            config=config,
+            bet_amount=bet_amount,
+            num_spins=request.num_spins,
+            capital=request.starting_capital,
+            plugins_with_params=request.plugins,
+            state_manager=state_manager,
+            demo_params=request.demo_params,
+            seed=request.seed,
+            fast=request.fast,
+            detail_capture=build_detail_capture(request),
+            target_half_width=request.target_rtp_half_width,
+            confidence=request.confidence_level,
+            control_variate=request.control_variate,
+            stratified_reels=request.stratified_reels,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    await run_simulation_async(simulation)
+
+    extra_results = {}
+    if request.store_run:
+        extra_results["run_id"] = store_run(app_request, params, simulation)
+    response = simulation_response(simulation, request.detail_level, await request_calculations(request),
+                                   **extra_results)
+    if cache_key is not None and not response.errors:
+        cache.put(cache_key, response)
+    return response
+
+
+class ExtendSimulationRequest(BaseModel):
+    num_spins: int = Field(..., description="The number of spins to add to the stored run.",
+                           examples=[100000], gt=0)
+    detail_level: str = Field(
+        "basic",
+        description="Level of detail for the simulation results.",
+        examples=["basic", "detailed"],
     )
 
+
+@simulation_router.post(
+    "/run_simulation/{run_id}/extend",
+    summary="Add spins to a stored simulation",
+    description=
+    "Continues a run stored with store_run for num_spins more spins and returns the combined results, as if "
+    "the run had been asked for all of its spins at once. The extended run is stored under a new run_id.",
+    response_model=RunSimulationResponse,
+)
+async def extend_simulation(run_id: str, request: ExtendSimulationRequest, app_request: Request):
+    stored = app_request.app.state.run_store.get(run_id)
+    if stored is None:
+        raise HTTPException(status_code=404, detail=f"Stored simulation run {run_id} not found")
+    params, checkpoint = stored["params"], stored["checkpoint"]
+    limit = MAX_FAST_SIMULATION_SPINS if params.get("fast") else MAX_SIMULATION_SPINS
+    if request.num_spins > limit:
+        raise HTTPException(status_code=422, detail=f"An extension adds at most {limit} spins; extend the run "
+                                                    f"again for more.")
+
+    try:
+        simulation = build_simulation(params, num_spins=request.num_spins, seed=checkpoint["seed"])
+        simulation.restore(checkpoint)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
     await run_simulation_async(simulation)
 
+    params = {**params, "num_spins": params["num_spins"] + request.num_spins}
+    calculations = await request_calculations(RunSimulationRequest.model_construct(**params))
+    return simulation_response(simulation, request.detail_level, calculations,
+                               run_id=store_run(app_request, params, simulation), extended_from=run_id)
+
+
+def store_run(app_request: Request, params: dict, simulation: Simulation) -> str:
+    """Keep a finished run's request and checkpoint for /run_simulation/{run_id}/extend; returns its run_id."""
+    run_id = uuid.uuid4().hex
+    app_request.app.state.run_store.put(run_id, {"params": params, "checkpoint": simulation.checkpoint()})
+    return run_id
+
+
+def simulation_response(simulation: Simulation, detail_level: str, calculations: CalculationResponse,
+                        **extra_results) -> RunSimulationResponse:
     # Fetch results from the simulation with the given detail level
-    raw_results = simulation.get_results(detail_level=request.detail_level)
+    raw_results = simulation.get_results(detail_level=detail_level)
 
     known_keys = [
         "total_bets", "total_winnings", "rtp", "hit_frequency", "errors"
@@ -285,15 +473,7 @@ async def run_simulation(request: RunSimulationRequest):
         for key in raw_results
         if key not in known_keys and raw_results.get(key) is not None
     }
-
-    body_calculate = CalculationRequest(symbols=request.symbols,
-                                        columns=request.columns,
-                                        weight_formula=request.weight_formula,
-                                        payout_formula=request.payout_formula,
-                                        free_spins_icon=10,
-                                        free_spins_trigger=3)
-
-    calculate_payout = await calculate_paytable_and_weights(body_calculate)
+    additional_results.update(extra_results)
 
     converted_rtp = raw_results.get("rtp", 0.0)
     formatted_rtp = float(f"{converted_rtp:.1f}")
@@ -305,10 +485,90 @@ async def run_simulation(request: RunSimulationRequest):
         hit_frequency=raw_results.get("hit_frequency", 0.0),
         additional_results=additional_results,
         errors=raw_results.get("errors", []),
-        calculations=calculate_payout
+        calculations=calculations
     )
 
 
+class ImportanceSamplingRequest(RunSimulationRequest):
+    num_spins: int = Field(..., description="The number of spins to sample.", examples=[1_000_000], gt=0,
+                           le=MAX_IMPORTANCE_SPINS)
+    # The sampler draws its own grids, whether or not fast is set
+    max_spins: ClassVar[int] = MAX_IMPORTANCE_SPINS
+    max_fast_spins: ClassVar[int] = MAX_IMPORTANCE_SPINS
+    tilt: Dict[int, float] = Field(
+        {},
+        description="Factor each symbol's reel weights are multiplied by while sampling, such as the wild and the "
+                    "high symbols of the wins of interest; every spin is weighted back to the game's weights.",
+        examples=[{9: 3.0, 8: 2.0}])
+    tail_multipliers: List[float] = Field(
+        list(DEFAULT_TAIL_MULTIPLIERS),
+        description="Win sizes, in multiples of the bet, to estimate P(win >= k x bet) and its RTP share for.")
+
+
+@simulation_router.post(
+    "/run_importance_sampling",
+    summary="Estimate rare win probabilities by importance sampling",
+    description=
+    "Draws num_spins base game spins from reel weights tilted by tilt and weighs each by its likelihood ratio, "
+    "returning unbiased estimates of the RTP and of P(win >= k x bet) for every tail multiplier, with "
+    "confidence_level intervals. Games with plugins are refused.",
+)
+async def run_importance_sampling(request: ImportanceSamplingRequest, app_request: Request):
+    if request.plugins:
+        raise HTTPException(status_code=422, detail="Importance sampling covers the base game only; "
+                                                    f"got plugins {sorted(request.plugins)}")
+    # Sampling is CPU-bound for minutes, so run it in a worker process
+    try:
+        return await asyncio.wrap_future(app_request.app.state.simulation_pool.submit_task(
+            run_importance_sampling_task, request.model_dump(), request.tilt, request.num_spins,
+            request.tail_multipliers, request.confidence_level))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+class SweepRequest(RunSimulationRequest):
+    # The sweep draws its own grids; run_sweep bounds num_spins times the variants
+    max_spins: ClassVar[int] = MAX_SWEEP_SPINS
+    max_fast_spins: ClassVar[int] = MAX_SWEEP_SPINS
+    grid: Dict[str, List[Any]] = Field(
+        {},
+        description="Values to try for each swept field (" + ", ".join(SWEEP_FIELDS) + "); every combination is "
+                    "a variant of the game the other fields describe.",
+        examples=[{"payout_formula": ["1.4 * x", "1.6 * x"], "weight_formula": ["math.exp(-x / 10)"]}])
+
+
+@simulation_router.post(
+    "/sweep",
+    summary="Compare paytable and weight variants on common random numbers",
+    description=
+    "Plays num_spins base game spins of the request's game and of every combination of the grid's values, all "
+    "from the same random numbers, and returns each variant's RTP and its paired difference from the base "
+    "game's, with confidence_level intervals. Games with plugins are refused.",
+)
+async def run_sweep(request: SweepRequest, app_request: Request):
+    if request.plugins:
+        raise HTTPException(status_code=422, detail=f"A sweep covers the base game only; "
+                                                    f"got plugins {sorted(request.plugins)}")
+    base = request.model_dump(exclude={"grid"})
+    try:
+        # Validated like the request's own fields, so overrides take the same types
+        fields = request.model_dump(exclude={"grid"}, exclude_none=True)
+        variants = [{field: getattr(RunSimulationRequest(**{**fields, **overrides}), field) for field in overrides}
+                    for overrides in sweep_variants(request.grid)]
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if request.num_spins * len(variants) > MAX_SWEEP_SPINS:
+        raise HTTPException(status_code=422, detail=f"A sweep plays at most {MAX_SWEEP_SPINS} spins over all its "
+                                                    f"variants; got {request.num_spins} spins of {len(variants)}")
+
+    # Sweeps are CPU-bound for minutes, so run them in a worker process
+    try:
+        return await asyncio.wrap_future(app_request.app.state.simulation_pool.submit_task(
+            run_sweep_task, base, variants, request.num_spins, request.confidence_level))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
 # @simulation_router.post("/handle_action")
 # async def handle_action(action: dict):
 #     if not simulation_instance.plugin_manager.has_pending_actions():
@@ -324,120 +584,60 @@ async def run_simulation(request: RunSimulationRequest):
 #     return results
 
 
-async def call_run_simulation(request):
-    # Fetch and execute the plugin code if a URL is provided
-    if request.plugin_url:
-        plugin_code = fetch_plugin_code(request.plugin_url)
-
-        # Execute the plugin code in a controlled environment
-        try:
-            exec(plugin_code,
-                 globals())  # Executes the plugin code, adding it to globals()
-        except Exception as e:
-            logger.error(f"Error executing plugin code from URL: {e}")
-            raise HTTPException(status_code=500,
-                                detail=f"Error executing plugin: {e}")
-
-    weight_formula = request.weight_formula
-    if weight_formula is None:
-        weight_formula = ""
-
-    payout_formula = request.payout_formula
-    if payout_formula is None:
-        payout_formula = ""
-
-    config = Configuration(
-
-        rows=request.rows,
-        columns=request.columns,
-        symbols=request.symbols,
-        wild_symbol=request.wild_symbol,
-        weight_formula=weight_formula,
-        payout_formula=payout_formula,
-        symbol_payouts=request.custom_symbol_payouts
-        if request.custom_symbol_payouts else {},
-        custom_paylines=request.custom_paylines,
-    )
-    config.sticky_options = {
-        "duration": request.sticky_duration,
-        "expand": request.expand_stickies,
-        "multiplier": request.sticky_multiplier,
-        "until_bonus": request.until_bonus,
-        "bonus_symbol": request.bonus_symbol,
-    }
-    config.cascading_reels = request.cascading_reels
-
-    state_manager = StateManager(initial_state={"config": config})
-
-    # Initialize plugin manager and load plugins
-    plugin_manager = PluginManager(config=config, state_manager=state_manager)
-    plugin_manager.load_plugins(request.plugins)
+def batch_seed(master_seed: int, index: int) -> int:
+    """
+    Seed of batch ``index`` of a parallel run: its own Isaac substream of the
+    run's master seed. It depends on the batch index only, never on the worker
+    that runs the batch, so a batch rerun alone through /run_simulation with
+    this seed, its spins and its capital reproduces it bit for bit.
+    """
+    return substream_seed(master_seed, "batch", index)
 
-    bet_amount = request.bet_amount
 
-    simulation = Simulation(
-        config=config,
-        bet_amount=bet_amount,
-        num_spins=request.num_spins,
-        capital=request.starting_capital,
-        plugins_with_params=request.plugins,
-        state_manager=state_manager,
-        demo_params=request.demo_params,
-    )
-    # TODO: WIP
-    await run_simulation_async(simulation)
-
-    # Fetch results from the simulation with the given detail level
-    raw_results = simulation.get_results(detail_level=request.detail_level)
-    known_keys = [
-        "total_bets", "total_winnings", "rtp", "hit_frequency", "errors"
-    ]
-    additional_results = {
-        key: raw_results.get(key, None)
-        for key in raw_results
-        if key not in known_keys and raw_results.get(key) is not None
-    }
-
-    body_calculate = CalculationRequest(
-        symbols=request.symbols,
-        columns=request.columns,
-        weight_formula=request.weight_formula,
-        payout_formula=request.payout_formula,
-        free_spins_icon=10,
-        free_spins_trigger=3
-    )
-    calculate_payout = await calculate_paytable_and_weights(body_calculate)
-
-    run_simulation_response = RunSimulationResponse(
-        total_bets=raw_results.get("total_bets", 0.0),
-        total_winnings=raw_results.get("total_winnings", 0.0),
-        rtp=raw_results.get("rtp", 0.0),
-        hit_frequency=raw_results.get("hit_frequency", 0.0),
-        additional_results=additional_results,
-        errors=raw_results.get("errors", []),
-        calculations=calculate_payout,
-    )
-
-    return run_simulation_response
-
-
-def run_multi_simulation_async(request):
-    return asyncio.run(call_run_simulation(request))
-
-
-def merge_results(results: List[RunSimulationResponse]) -> RunSimulationResponse:
+def merged_totals(results: List[RunSimulationResponse]) -> dict:
+    """
+    Exact totals over batches: RTP is total winnings over total bets and the
+    hit frequency total hits over total spins, not averages of batch ratios.
+    The per-spin and per-round return moments and win multiplier histograms
+    are pooled too.
+    """
     total_bets = sum(result.total_bets for result in results)
     total_winnings = sum(result.total_winnings for result in results)
+    hits = sum(result.additional_results.get("hits", 0) for result in results)
+    spin_count = sum(result.additional_results.get("spin_count", 0) for result in results)
+    return_histogram = {}
+    for result in results:
+        for bucket, spins in result.additional_results.get("return_histogram", {}).items():
+            return_histogram[int(bucket)] = return_histogram.get(int(bucket), 0) + spins
+    return {
+        "total_bets": total_bets,
+        "total_winnings": total_winnings,
+        "rtp": total_winnings / total_bets * 100 if total_bets > 0 else 0.0,
+        "hits": hits,
+        "spin_count": spin_count,
+        "hit_frequency": hits / spin_count * 100 if spin_count > 0 else 0.0,
+        "return_moments": merge_moments(*(result.additional_results.get("return_moments", new_moments())
+                                          for result in results)),
+        "round_moments": merge_moments(*(result.additional_results.get("round_moments", new_moments())
+                                         for result in results)),
+        "return_histogram": dict(sorted(return_histogram.items())),
+    }
 
-    total_rtp = sum(result.rtp for result in results)
-    average_rtp = total_rtp / len(results) if results else 0.0
 
-    total_hit_frequency = sum(result.hit_frequency for result in results)
-    average_hit_frequency = total_hit_frequency / len(results) if results else 0.0
+def merge_results(results: List[RunSimulationResponse]) -> RunSimulationResponse:
+    totals = merged_totals(results)
 
     # Aggregate additional results
     total_free_spins_won = sum(result.additional_results.get("total_free_spins_won", 0) for result in results)
     total_bonus_rounds_triggered = sum(result.additional_results.get("bonus_rounds_triggered", 0) for result in results)
+    free_spins_counters = {
+        key: sum(result.additional_results.get(key, 0) for result in results)
+        for key in ("free_spins_triggers", "free_spins_retriggers", "free_spins_played")
+    }
+    free_spins_icon_counts = {}
+    for result in results:
+        for count, spins in result.additional_results.get("free_spins_icon_counts", {}).items():
+            free_spins_icon_counts[int(count)] = free_spins_icon_counts.get(int(count), 0) + spins
 
     # Aggregate paytable
     merged_paytable = {}
@@ -462,17 +662,25 @@ def merge_results(results: List[RunSimulationResponse]) -> RunSimulationResponse
 
     # Create the merged result
     merged_result = RunSimulationResponse(
-        total_bets=total_bets,
-        total_winnings=total_winnings,
-        rtp=average_rtp,
-        hit_frequency=average_hit_frequency,
+        total_bets=totals["total_bets"],
+        total_winnings=totals["total_winnings"],
+        rtp=totals["rtp"],
+        hit_frequency=totals["hit_frequency"],
         additional_results={
             "pending_actions": {},
+            "hits": totals["hits"],
+            "spin_count": totals["spin_count"],
             "multiplier_used": 3,
             "multiplier_effect_applied": 0.0,
             "total_free_spins_won": total_free_spins_won,
             "current_free_spins": 0,
-            "bonus_rounds_triggered": total_bonus_rounds_triggered
+            "bonus_rounds_triggered": total_bonus_rounds_triggered,
+            **free_spins_counters,
+            "free_spins_icon_counts": dict(sorted(free_spins_icon_counts.items())),
+            "return_moments": totals["return_moments"],
+            "round_moments": totals["round_moments"],
+            "return_histogram": totals["return_histogram"],
+            "return_statistics": return_statistics(totals["return_moments"], totals["return_histogram"]),
         },
         errors=[],
         calculations=CalculationResponse(paytable=merged_paytable, symbol_weights=merged_symbol_weights),
@@ -481,35 +689,197 @@ def merge_results(results: List[RunSimulationResponse]) -> RunSimulationResponse
     return merged_result
 
 
+def summary_response(summary: dict, calculations: CalculationResponse) -> RunSimulationResponse:
+    """RunSimulationResponse for a pool worker's compact simulation summary."""
+    totals = dict(zip(summary["count_names"], summary["counts"].tolist()))
+    totals.update(zip(summary["amount_names"], summary["amounts"].tolist()))
+    total_bets = totals.pop("total_bets", 0)
+    total_winnings = totals.pop("total_winnings", 0)
+    # Hits and spins stay in the additional results so batches merge exactly
+    hits = totals.get("hits", 0)
+    spin_count = totals.get("spin_count", 0)
+    additional_results = {
+        "pending_actions": {},
+        "status": "error" if summary["errors"] else "success",
+        **totals,
+    }
+    # Merged summaries have no single seed
+    if summary["seed"] is not None:
+        additional_results["seed"] = summary["seed"]
+    for name, histogram in summary["histograms"].items():
+        additional_results[name] = {bucket: count for bucket, count in enumerate(histogram.tolist()) if count}
+    # The moments stay next to the statistics so merge_results can pool them
+    additional_results["return_moments"] = summary.get("return_moments", new_moments())
+    additional_results["round_moments"] = summary.get("round_moments", new_moments())
+    additional_results["return_statistics"] = return_statistics(additional_results["return_moments"],
+                                                                additional_results.get("return_histogram", {}))
+
+    return RunSimulationResponse(
+        total_bets=total_bets,
+        total_winnings=total_winnings,
+        rtp=total_winnings / total_bets * 100 if total_bets > 0 else 0.0,
+        hit_frequency=hits / spin_count * 100 if spin_count > 0 else 0.0,
+        additional_results=additional_results,
+        errors=summary["errors"],
+        calculations=calculations,
+    )
+
+
+def request_master_seed(app_request: Request, request: RunSimulationRequest) -> int:
+    """
+    Master seed of a parallel run: the request's seed, else a random one. An
+    unseeded request opting into the cache reuses the seed drawn for the first
+    such request, so its batches are found in the cache.
+    """
+    if request.seed is not None:
+        return request.seed
+    if not request.cache or not cacheable({**request.model_dump(), "seed": 0}):
+        return random.getrandbits(64)
+    cache = app_request.app.state.result_cache
+    key = simulation_cache_key(request.model_dump(), purpose="master_seed")
+    master_seed = cache.get(key)
+    if master_seed is None:
+        master_seed = random.getrandbits(64)
+        cache.put(key, master_seed)
+    return master_seed
+
+
+async def request_calculations(request: RunSimulationRequest) -> CalculationResponse:
+    return await calculate_paytable_and_weights(CalculationRequest(
+        symbols=request.symbols,
+        columns=request.columns,
+        weight_formula=request.weight_formula,
+        payout_formula=request.payout_formula,
+        free_spins_icon=10,
+        free_spins_trigger=3
+    ))
+
+
+async def run_pooled_simulations(app_request: Request, request: RunSimulationRequest,
+                                 batches: List[dict]) -> Tuple[int, List[RunSimulationResponse]]:
+    """
+    Run one simulation per entry of ``batches`` (request fields to override)
+    on the app's shared worker pool; results come back in the same order.
+
+    Batch ``index`` is seeded with ``batch_seed(master_seed, index)``, the
+    master seed being the request's seed or a random one drawn here. Returns
+    the master seed and the results; each result's additional results record
+    the master seed, batch index, spins and starting capital needed to rerun
+    that batch alone.
+    """
+    execute_plugin_url(request)
+    pool = app_request.app.state.simulation_pool
+    params = request.model_dump()
+    master_seed = request_master_seed(app_request, request)
+    batches = [{**params, **batch, "seed": batch_seed(master_seed, index)} for index, batch in enumerate(batches)]
+    summaries = await asyncio.gather(*[asyncio.wrap_future(pool.submit(batch)) for batch in batches])
+    calculations = await request_calculations(request)
+    results = [summary_response(summary, calculations) for summary in summaries]
+    for index, (batch, result) in enumerate(zip(batches, results)):
+        result.additional_results.update(master_seed=master_seed, batch_index=index,
+                                         num_spins=batch["num_spins"], starting_capital=batch["starting_capital"])
+    return master_seed, results
+
+
+async def job_progress(job: SimulationJob, progress: dict) -> dict:
+    """Job progress, with the merged RunSimulationResponse once the job is finished."""
+    if progress["status"] in ("completed", "cancelled") and job.summary is not None:
+        request = RunSimulationRequest.model_construct(**job.params)
+        result = summary_response(job.summary, await request_calculations(request))
+        result.additional_results["master_seed"] = job.master_seed
+        progress = {**progress, "result": result.model_dump()}
+    return progress
+
+
+def get_job(app_request: Request, job_id: str) -> SimulationJob:
+    job = app_request.app.state.simulation_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Simulation job {job_id} not found")
+    return job
+
+
+class SimulationJobRequest(RunSimulationRequest):
+    # Jobs run slice by slice on the pool, so they may be far longer than a single request
+    max_spins: ClassVar[int] = MAX_JOB_SPINS
+    max_fast_spins: ClassVar[int] = MAX_JOB_SPINS
+
+
+@simulation_router.post("/simulation-jobs", status_code=202)
+async def create_simulation_job(request: SimulationJobRequest, app_request: Request):
+    """
+    Queue a simulation on the worker pool and return its job id at once.
+    Poll GET /simulation-jobs/{job_id}, follow /simulation-jobs/{job_id}/stream
+    or cancel with DELETE /simulation-jobs/{job_id}.
+    """
+    if request.detail_capture != "none":
+        raise HTTPException(status_code=422, detail="Simulation jobs do not record per-spin detail.")
+    if request.target_rtp_half_width is not None:
+        raise HTTPException(status_code=422, detail="Simulation jobs run to num_spins; target_rtp_half_width "
+                                                    "is only supported by /run_simulation.")
+    execute_plugin_url(request)
+    try:
+        job = app_request.app.state.simulation_jobs.submit(
+            {**request.model_dump(), "seed": request_master_seed(app_request, request)})
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return job.progress()
+
+
+@simulation_router.get("/simulation-jobs/{job_id}")
+async def get_simulation_job(job_id: str, app_request: Request):
+    """Progress of a job: spins done, running RTP and hit frequency, ETA, and its result once finished."""
+    job = get_job(app_request, job_id)
+    return await job_progress(job, job.progress())
+
+
+@simulation_router.delete("/simulation-jobs/{job_id}")
+async def cancel_simulation_job(job_id: str, app_request: Request):
+    """Cancel a job; the spins it already finished stay in its result."""
+    job = get_job(app_request, job_id)
+    await app_request.app.state.simulation_jobs.cancel(job_id)
+    return await job_progress(job, job.progress())
+
+
+@simulation_router.get("/simulation-jobs/{job_id}/stream")
+async def stream_simulation_job(job_id: str, app_request: Request):
+    """Newline-delimited JSON: the job's progress after every finished slice, ending with its result."""
+    job = get_job(app_request, job_id)
+    jobs = app_request.app.state.simulation_jobs
+
+    async def lines():
+        async for progress in jobs.updates(job):
+            yield json.dumps(await job_progress(job, progress), default=str) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
 @simulation_router.post("/run-multi-simulation")
-async def run_multi_simulation(request: RunSimulationRequest):
+async def run_multi_simulation(request: RunSimulationRequest, app_request: Request):
     num_spins = request.num_spins
     logging.info(f"Received request to run multi simulation with num_spins: {num_spins}")
 
-    if num_spins < 16:
-        raise HTTPException(status_code=400, detail="num_spins should be at least 16")
+    workers = app_request.app.state.simulation_pool.max_workers
+    if num_spins < workers:
+        raise HTTPException(status_code=400, detail=f"num_spins should be at least {workers}")
 
-    spins_per_worker = num_spins // 16
-    remainder = num_spins % 16
+    spins_per_worker = num_spins // workers
+    remainder = num_spins % workers
 
-    spins_list = [spins_per_worker] * 16
+    spins_list = [spins_per_worker] * workers
     for i in range(remainder):
         spins_list[i] += 1
 
     logging.info(f"Divided spins: {spins_list}")
 
-    all_results = []
-
     # FIXME: Fix starting_capital
-    with concurrent.futures.ProcessPoolExecutor(max_workers=16) as executor:
-        futures = [executor.submit(run_multi_simulation_async, request.model_copy(
-            update={"num_spins": spins, "starting_capital": spins, "bet_amount": request.bet_amount})) for spins in
-                   spins_list]
-        for future in concurrent.futures.as_completed(futures):
-            print('result in multiprocessing : ', future.result().rtp)
-            all_results.append(future.result())
+    master_seed, all_results = await run_pooled_simulations(app_request, request, [
+        {"num_spins": spins, "starting_capital": spins} for spins in spins_list])
 
-    return merge_results(all_results)
+    merged_result = merge_results(all_results)
+    merged_result.additional_results["master_seed"] = master_seed
+    return merged_result
 
 
 rtp_values = []
@@ -599,33 +969,24 @@ async def run_batch_simulation(request: RunSimulationRequest, app_request: Reque
         min_rtp = 90.0
         max_rtp = 98.0
 
-        total_bets = 0
-        total_winnings = 0
         total_free_spins_won = 0
-        sum_rtp = 0.0
         current_free_spins = 0
         calculations = {}
-        errors = any
+        errors = []
         aggregated_additional_results = []  # Collect dynamic additional results
 
-        executor = concurrent.futures.ThreadPoolExecutor()
         rtp_values = []  # Clear previous values
 
-        futures = [executor.submit(run_multi_simulation_async, request.model_copy(
-            update={"num_spins": spins, "starting_capital": capital_per_batch})) for spins in spins_list]
-        for future in concurrent.futures.as_completed(futures):
-
-            result = future.result()  # RunSimulationResponse without total_free_spins_won info
+        master_seed, batch_results = await run_pooled_simulations(app_request, request, [
+            {"num_spins": spins, "starting_capital": capital_per_batch} for spins in spins_list])
+        for result in batch_results:
             all_results.append(result)
             calculations = result.calculations
 
-            errors = result.errors
+            errors.extend(result.errors)
 
             # Aggregate data
-            total_bets += result.total_bets
-            total_winnings += result.total_winnings
             total_free_spins_won += result.additional_results.get('total_free_spins_won', 0)
-            sum_rtp += result.rtp
             current_free_spins += result.additional_results.get('current_free_spins', 0)
 
             # Aggregate all additional_results dynamically
@@ -644,8 +1005,11 @@ async def run_batch_simulation(request: RunSimulationRequest, app_request: Reque
             else:
                 rtp_profile_range_results.append(dict(expected_rtp=f"RTP {formatted_rtp} is in range"))
 
-        # Calculate average RTP across all batches
-        avg_rtp_across_all_batches = sum_rtp / batch
+        # RTP across all batches, weighted by their bets
+        totals = merged_totals(batch_results)
+        total_bets = totals["total_bets"]
+        total_winnings = totals["total_winnings"]
+        avg_rtp_across_all_batches = totals["rtp"]
 
         # Prepare final response, including symbol weights summary
         aggregated_result = AggregatedSimulationResult(
@@ -658,7 +1022,8 @@ async def run_batch_simulation(request: RunSimulationRequest, app_request: Reque
             avg_rtp_across_all_batches=f"{avg_rtp_across_all_batches:.1f}%",
             total_free_spins_won=total_free_spins_won,
             calculations=calculations,
-            all_additional_results=aggregated_additional_results
+            all_additional_results=aggregated_additional_results,
+            master_seed=master_seed,
         )
 
         simulation_report = RunSimulationReportFinalResponse(
@@ -716,6 +1081,25 @@ async def download_profile_range_image():
                              headers={"Content-Disposition": "attachment; filename=profile_range_report.png"})
 
 
+async def exact_base_game_reference(app_request: Request, request: RunSimulationRequest, spins: int) -> dict:
+    """
+    Summary of the base game's exact payout distribution, without its
+    histogram, for a report's ``exact_reference``. ``margin_of_error`` is the
+    exact half-width, at the request's confidence level, of the RTP of
+    ``spins`` paid spins of the base game; free spins are not part of the
+    exact solve.
+    """
+    try:
+        distribution = await solve_exact_distribution(app_request, request.model_dump())
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    summary = distribution.summary()
+    del summary["histogram"]
+    summary["margin_of_error"] = z_value(request.confidence_level) * 100 * summary["standard_deviation"] \
+        / math.sqrt(spins)
+    return summary
+
+
 # Define a new endpoint for Profile Point Report
 @simulation_router.post("/run-profile-point-report")
 async def run_profile_point_report(request: RunSimulationRequest, app_request: Request):
@@ -740,17 +1124,15 @@ async def run_profile_point_report(request: RunSimulationRequest, app_request: R
     all_results = []
     rtp_profile_point_results = []
     important_points = []
-    executor = app_request.app.state.executor
-    futures = [executor.submit(run_multi_simulation_async, request.model_copy(update={"num_spins": spins})) for spins in
-               spins_list]
+    master_seed, batch_results = await run_pooled_simulations(app_request, request, [
+        {"num_spins": spins} for spins in spins_list])
 
     rtp_values = []  # Reset RTP values for this run
-    for future in concurrent.futures.as_completed(futures):
-        result = future.result()
+    for result in batch_results:
         all_results.append(result)
 
         # Collect RTP values for each result
-        rtp = result.rtp / 1000  # Assuming result.rtp is large, scaling it down
+        rtp = result.rtp
         rtp_values.append(rtp)
 
         # Identify specific profile points of interest (e.g., very high or low RTP values)
@@ -767,8 +1149,12 @@ async def run_profile_point_report(request: RunSimulationRequest, app_request: R
     # Generate and return a simulation report with the collected results and points of interest
     simulation_report = RunSimulationReportResponse(
         result_across_all_batches=all_results,
-        profile_range=important_points  # Return the identified profile points
+        profile_range=important_points,  # Return the identified profile points
+        master_seed=master_seed,
     )
+    if request.exact_reference:
+        # Margin of error of a single batch's RTP
+        simulation_report.exact_base_game = await exact_base_game_reference(app_request, request, spins_list[-1])
 
     return simulation_report
 
@@ -828,42 +1214,36 @@ async def run_confidence_level_report(request: RunSimulationRequest, app_request
         spins_list[i] += 1
 
     # Collect results from simulation
-    all_results = []
-    executor = app_request.app.state.executor
-    futures = [executor.submit(run_multi_simulation_async, request.model_copy(update={"num_spins": spins})) for spins in
-               spins_list]
-
-    rtp_values = []  # Reset RTP values for this run
-    for future in concurrent.futures.as_completed(futures):
-        result = future.result()
-        all_results.append(result)
-
-        # Collect RTP values for each result
-        rtp = result.rtp / 1000  # Assuming result.rtp is large, scaling it down
-        rtp_values.append(rtp)
-
-    # Calculate confidence interval
-    mean_rtp = np.mean(rtp_values)
-    std_dev = np.std(rtp_values)
-    sample_size = len(rtp_values)
-
-    # Z-score for 95% confidence level
-    z_value = 1.96
-    margin_of_error = z_value * (std_dev / math.sqrt(sample_size))
-
-    lower_bound = mean_rtp - margin_of_error
-    upper_bound = mean_rtp + margin_of_error
+    master_seed, all_results = await run_pooled_simulations(app_request, request, [
+        {"num_spins": spins} for spins in spins_list])
+
+    # Interval of the RTP from the per-round returns of all batches, pooled exactly
+    totals = merged_totals(all_results)
+    statistics = return_statistics(totals["return_moments"], totals["return_histogram"])
+    confidence = request.confidence_level
+    margin_of_error = rtp_half_width(totals["round_moments"], totals["total_bets"], request.bet_amount, confidence)
+    if margin_of_error == math.inf:
+        margin_of_error = None
+    mean_rtp = totals["rtp"]
 
     confidence_interval = {
         "mean_rtp": mean_rtp,
-        "std_dev": std_dev,
-        "lower_bound": lower_bound,
-        "upper_bound": upper_bound,
-        "confidence_level": "95%"
+        # Spread of a single spin's return, in multiples of the bet
+        "std_dev": statistics["std_dev"],
+        "margin_of_error": margin_of_error,
+        "lower_bound": mean_rtp - margin_of_error if margin_of_error is not None else None,
+        "upper_bound": mean_rtp + margin_of_error if margin_of_error is not None else None,
+        "z_value": z_value(confidence),
+        "confidence_level": f"{confidence * 100:g}%",
+        "return_statistics": statistics,
     }
+    if request.exact_reference:
+        confidence_interval["exact_base_game"] = await exact_base_game_reference(app_request, request,
+                                                                                 request.num_spins)
 
     return {
         "confidence_interval": confidence_interval,
+        "master_seed": master_seed,
         "simulation_results": all_results
     }
 
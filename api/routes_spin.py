@@ -8,7 +8,7 @@ from fastapi import APIRouter, FastAPI, HTTPException
 from pydantic import BaseModel, Field
 
 from maths_engine.configuration import Configuration
-from maths_engine.simulation import Simulation
+from maths_engine.simulation import BIG_WIN_MULTIPLIER, Simulation
 from maths_engine.state_manager import StateManager
 from unittests.numbers import check_results
 
@@ -46,6 +46,11 @@ class SpinRequest(BaseModel):
             "custom_reels": [[1, 2, 3], [4, 5, 6], [7, 8, 9], [1, 2, 3], [4, 5, 6]],
         }],
     )
+    big_win_multiplier: float = Field(
+        BIG_WIN_MULTIPLIER,
+        description="Win, in multiples of the bet, from which the spin is a big win; /run_importance_sampling "
+                    "estimates how often that happens.",
+        gt=0)
     # demo_params: Optional[None] = None
 
 
@@ -102,6 +107,7 @@ async def spin(
         plugins_with_params=request.plugins,
         state_manager=state_manager,
         demo_params=request.demo_params,
+        big_win_multiplier=request.big_win_multiplier,
     )
 
     simulation.state_manager.set("is_free_spin", request.is_free_spin)
@@ -9,6 +9,10 @@ from api.routes_mathsengine import maths_router
 from api.routes_simulation import simulation_router
 from api.routes_spin import spin_router
 from api.routes_test import test_router
+from maths_engine.result_cache import (RUN_STORE_DIR, RUN_STORE_DISK_ENTRIES, RUN_STORE_MEMORY_ENTRIES,
+                                        ResultCache)
+from maths_engine.simulation_jobs import SimulationJobManager
+from maths_engine.simulation_pool import SimulationPool
 
 # Create FastAPI app
 app = FastAPI(debug=True)
@@ -46,6 +50,17 @@ async def startup_event():
     # Initialize the ThreadPoolExecutor on app startup
     app.state.executor = executor
     print("ThreadPoolExecutor started")
+    # Results of seeded runs, in memory and under DataStorage/simulation_cache
+    app.state.result_cache = ResultCache()
+    # Runs stored with store_run, which /run_simulation/{run_id}/extend continues
+    app.state.run_store = ResultCache(memory_entries=RUN_STORE_MEMORY_ENTRIES, directory=RUN_STORE_DIR,
+                                      disk_entries=RUN_STORE_DISK_ENTRIES)
+    # Warm worker processes shared by the multi-process simulation endpoints
+    app.state.simulation_pool = SimulationPool(cache=app.state.result_cache)
+    app.state.simulation_pool.start()
+    print(f"SimulationPool started with {app.state.simulation_pool.max_workers} workers")
+    # Background simulation jobs run on the same pool
+    app.state.simulation_jobs = SimulationJobManager(app.state.simulation_pool)
 
 
 @app.on_event("shutdown")
@@ -53,6 +68,9 @@ async def shutdown_event():
     # Shutdown the ThreadPoolExecutor on app shutdown
     app.state.executor.shutdown()
     print("ThreadPoolExecutor shut down")
+    app.state.simulation_jobs.shutdown()
+    app.state.simulation_pool.shutdown()
+    print("SimulationPool shut down")
 
 
 from slowapi import Limiter
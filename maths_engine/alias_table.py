@@ -0,0 +1,71 @@
+# maths_engine/alias_table.py
+from typing import List, Sequence
+
+import numpy as np
+
+from maths_engine.isaac_rng_v2 import mod
+
+
+class AliasTable:
+    """
+    Walker alias table over integer symbol weights.
+
+    The table is built exactly in integer arithmetic: each of the ``n`` buckets
+    holds ``total`` units, shared between the bucket's own symbol and one alias.
+    A single bounded draw in ``[0, n * total)`` then picks a bucket and an
+    offset inside it, so sampling is O(1) and reproduces the weights exactly.
+    """
+
+    def __init__(self, symbols: Sequence[int], weights: Sequence[int]):
+        pairs = [(symbol, int(weight)) for symbol, weight in zip(symbols, weights) if weight > 0]
+        if not pairs:
+            raise ValueError("Alias table needs at least one symbol with a positive weight.")
+
+        self.symbols: List[int] = [symbol for symbol, _ in pairs]
+        self.weights: List[int] = [weight for _, weight in pairs]
+        self.size = len(pairs)
+        self.total = sum(self.weights)
+        self.bound = self.size * self.total
+        if self.bound > mod:
+            raise ValueError(
+                f"Weight resolution too high for a 32-bit draw: {self.size} x {self.total}")
+
+        # Scaling by n makes every bucket's capacity exactly `total` units.
+        scaled = [weight * self.size for weight in self.weights]
+        self.threshold = [self.total] * self.size
+        self.alias = list(self.symbols)
+
+        small = [i for i, value in enumerate(scaled) if value < self.total]
+        large = [i for i, value in enumerate(scaled) if value >= self.total]
+        while small and large:
+            less = small.pop()
+            more = large.pop()
+            self.threshold[less] = scaled[less]
+            self.alias[less] = self.symbols[more]
+            scaled[more] -= self.total - scaled[less]
+            if scaled[more] < self.total:
+                small.append(more)
+            else:
+                large.append(more)
+
+        self._symbols_array = np.array(self.symbols, dtype=np.uint8)
+        self._alias_array = np.array(self.alias, dtype=np.uint8)
+        self._threshold_array = np.array(self.threshold, dtype=np.int64)
+
+    def sample(self, rng) -> int:
+        """Draw one symbol using a single unbiased Isaac draw."""
+        bucket, offset = divmod(rng.randbelow(self.bound), self.total)
+        if offset < self.threshold[bucket]:
+            return self.symbols[bucket]
+        return self.alias[bucket]
+
+    def sample_batch(self, rng, n: int) -> np.ndarray:
+        """Draw ``n`` symbols at once from bulk Isaac output, as ``uint8``."""
+        bucket, offset = np.divmod(rng.randbelow_batch(n, self.bound), self.total)
+        return np.where(offset < self._threshold_array[bucket],
+                        self._symbols_array[bucket],
+                        self._alias_array[bucket])
+
+    def probabilities(self) -> dict:
+        """Exact symbol probabilities encoded by the table."""
+        return {symbol: weight / self.total for symbol, weight in zip(self.symbols, self.weights)}
@@ -1,8 +1,21 @@
 # maths_engine/configuration.py
 # DO NOT DELETE THIS!!!
 import math
-from typing import Dict
-from maths_engine.isaac_rng_v2 import Isaac
+from typing import Dict, List
+from maths_engine.isaac_rng_v2 import Isaac, mod
+
+# Default integer resolution of symbol weight tables: every reel's weights are
+# apportioned onto this many integer units before sampling.
+DEFAULT_WEIGHT_RESOLUTION = 1_000_000
+
+
+def check_weight_resolution(symbols: int, weight_resolution: int):
+    """Raise ValueError unless a reel's weight table fits the 32-bit bounded draw of ``AliasTable``."""
+    if weight_resolution < 1:
+        raise ValueError(f"Weight resolution must be positive, got {weight_resolution}")
+    if symbols * weight_resolution > mod:
+        raise ValueError(f"Weight resolution too high for a 32-bit draw: {symbols} symbols x "
+                         f"{weight_resolution} units is more than 2**32; use at most {mod // symbols}")
 
 
 class Configuration:
@@ -18,6 +31,7 @@ class Configuration:
             symbol_payouts: Dict[int, float] = {},
             custom_paylines=None,
             plugins=None,
+            weight_resolution=DEFAULT_WEIGHT_RESOLUTION,
             **additional_params,
     ):
         self.rows = int(rows)
@@ -29,6 +43,8 @@ class Configuration:
         self.cascading_reels = True
         self.weight_formula = weight_formula
         self.payout_formula = payout_formula
+        self.weight_resolution = int(weight_resolution)
+        check_weight_resolution(self.symbols, self.weight_resolution)
         self.plugins = plugins if plugins is not None else []
         self.scatter_weight = 4.102
         # self.scatter_weight = 4.102
@@ -77,10 +93,10 @@ class Configuration:
     #         raise ValueError(f"Weight length must match the number of symbols: {self.symbols}")
     #     self.reel_weights[reel_idx] = weights
     # MFM - Added Get_Reel_weights
-    def get_reel_weights(self, reel_idx):
+    def get_reel_weights(self, reel_idx, resolution=None):
         """Get the weight distribution for a specific reel."""
         # Call get_symbol_weights to get the weights list
-        return self.get_symbol_weights()
+        return self.get_symbol_weights(resolution=resolution)
 
     def get_reels(
             self,
@@ -144,7 +160,17 @@ class Configuration:
     def get_sticky_options(self):
         return self.sticky_options
 
-    def get_symbol_weights(self):
+    def get_symbol_weights(self, resolution=None):
+        """
+        Symbol weights as normalised percentages, or as an integer table.
+
+        Args:
+            resolution (int, optional): When given, the weights are apportioned
+                onto exactly ``resolution`` integer units so sampling can be done
+                with integer arithmetic only.
+        Returns:
+            list: One weight per symbol, in symbol order.
+        """
         # Calculate the base weights using the weight formula
         base_weights = [
             eval(self.weight_formula, {"math": math, "x": i})
@@ -157,8 +183,30 @@ class Configuration:
         normalized_base_weights[-1] = self.scatter_weight  # Lock scatter weight
         # print(normalized_base_weights)
 
+        if resolution is not None:
+            return self.to_integer_weights(normalized_base_weights, resolution)
         return normalized_base_weights
 
+    @staticmethod
+    def to_integer_weights(weights, resolution) -> List[int]:
+        """Apportion ``weights`` onto ``resolution`` integer units (largest remainder)."""
+        resolution = int(resolution)
+        if resolution <= 0:
+            raise ValueError(f"Weight resolution must be positive, got {resolution}")
+        total = sum(weights)
+        if total <= 0:
+            raise ValueError("Weights must have a positive sum.")
+
+        scaled = [weight * resolution / total for weight in weights]
+        integer_weights = [int(math.floor(value)) for value in scaled]
+        shortfall = resolution - sum(integer_weights)
+        by_remainder = sorted((i for i in range(len(weights)) if weights[i] > 0),
+                              key=lambda i: scaled[i] - integer_weights[i],
+                              reverse=True)
+        for i in by_remainder[:shortfall]:
+            integer_weights[i] += 1
+        return integer_weights
+
     def set_simulation_results(self, rtp, total_bets, total_winnings, hit_frequency):
         self.rtp = rtp
         self.total_bets = total_bets
@@ -0,0 +1,112 @@
+# maths_engine/detail_capture.py
+import json
+import os
+import re
+from collections import deque
+from typing import Optional
+
+DETAIL_CAPTURE_MODES = ("none", "ring", "every", "threshold", "stream")
+# Records kept in memory by the ring, every and threshold modes
+DEFAULT_CAPTURE_SIZE = 1000
+DETAIL_STORAGE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "DataStorage")
+# Streamed detail files, named by their stream id; only the most recent are kept
+DETAIL_STREAM_DIR = os.path.join(DETAIL_STORAGE_DIR, "detail_streams")
+MAX_DETAIL_STREAMS = 50
+# Largest streamed detail file; later spins of the run are not written
+MAX_DETAIL_STREAM_BYTES = 256 * 1024 * 1024
+
+
+def detail_stream_path(stream_id: str, directory: str = DETAIL_STREAM_DIR) -> str:
+    """File of stream ``stream_id``, a 32-digit hex id, so no id can name a path elsewhere."""
+    if not re.fullmatch(r"[0-9a-f]{32}", stream_id):
+        raise ValueError(f"Invalid detail stream id {stream_id!r}")
+    return os.path.join(directory, f"{stream_id}.jsonl")
+
+
+def prune_detail_streams(directory: str = DETAIL_STREAM_DIR, keep: int = MAX_DETAIL_STREAMS):
+    """Delete all but the ``keep`` most recently written stream files of ``directory``."""
+    if not os.path.isdir(directory):
+        return
+    entries = [entry for entry in os.scandir(directory) if entry.name.endswith(".jsonl")]
+    if len(entries) <= keep:
+        return
+    entries.sort(key=lambda entry: entry.stat().st_mtime_ns)
+    for entry in entries[:len(entries) - keep]:
+        try:
+            os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+
+
+class DetailCapture:
+    """
+    Which per-spin detail records a simulation keeps.
+
+    ``none`` keeps nothing, ``ring`` the last ``size`` spins, ``every`` one
+    spin in ``every`` and ``threshold`` the winning spins paying at least
+    ``threshold`` times the bet; those three never hold more than ``size``
+    records. ``stream`` keeps every spin but writes it as a JSON line to
+    ``path``, or to the file of ``stream_id`` under ``DETAIL_STREAM_DIR``,
+    instead of memory, up to ``max_bytes``. Records get a ``spin`` key with
+    the spin's index in the run.
+    """
+
+    def __init__(self, mode: str = "none", size: int = DEFAULT_CAPTURE_SIZE, every: int = 1,
+                 threshold: float = 0.0, path: Optional[str] = None, stream_id: Optional[str] = None,
+                 max_bytes: int = MAX_DETAIL_STREAM_BYTES):
+        if mode not in DETAIL_CAPTURE_MODES:
+            raise ValueError(f"Detail capture mode must be one of {DETAIL_CAPTURE_MODES}, got {mode!r}")
+        if size < 1 or every < 1:
+            raise ValueError(f"Detail capture size and every must be positive, got {size} and {every}")
+        if mode == "stream" and path is None:
+            if stream_id is None:
+                raise ValueError("Streaming detail capture needs a path or a stream id.")
+            path = detail_stream_path(stream_id)
+        self.mode = mode
+        self.size = size
+        self.every = every
+        self.threshold = threshold
+        self.path = path if mode == "stream" else None
+        self.stream_id = stream_id if mode == "stream" else None
+        self.max_bytes = max_bytes
+        self.truncated = False
+        self.records = deque(maxlen=size) if mode == "ring" else []
+        self._stream = None
+        self._written = 0
+
+    def wants(self, spin_index: int, spin_winning: float, bet_amount: float) -> bool:
+        """Whether spin ``spin_index`` is recorded, so unwanted records are never built."""
+        if self.mode == "none":
+            return False
+        if self.mode == "every":
+            return spin_index % self.every == 0 and len(self.records) < self.size
+        if self.mode == "threshold":
+            # Losing spins never qualify, not even for a threshold of 0
+            return spin_winning > 0 and spin_winning >= self.threshold * bet_amount and len(self.records) < self.size
+        if self.mode == "stream":
+            return not self.truncated
+        return True
+
+    def record(self, spin_index: int, result: dict):
+        result["spin"] = spin_index
+        if self.mode != "stream":
+            self.records.append(result)
+            return
+        if self._stream is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._stream = open(self.path, "w")
+        line = json.dumps(result, default=str) + "\n"
+        if self._written + len(line) > self.max_bytes:
+            self.truncated = True
+            return
+        self._stream.write(line)
+        self._written += len(line)
+
+    def close(self):
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
+    def results(self) -> list:
+        """Records held in memory, oldest first."""
+        return list(self.records)
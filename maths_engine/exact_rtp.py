@@ -0,0 +1,127 @@
+# maths_engine/exact_rtp.py
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from maths_engine.payline_evaluator import LINE_BET_DIVISOR
+from maths_engine.slot_machine_engine import UNIQUE_REEL_SYMBOL
+
+
+class ExactRtpCalculator:
+    """
+    Exact base-game RTP from the engine's reel weights and paytable.
+
+    Each reel's column is drawn independently, so every payline's tuple
+    distribution is the product of per-reel cell distributions. The expected
+    payout of a line is that distribution dotted with the shared
+    ``LineOutcomeTable``, and by linearity of expectation the RTP is the sum
+    over lines; no simulation is involved.
+    """
+
+    def __init__(self, engine, scatter_symbol: Optional[int] = None, icon: Optional[int] = None,
+                 blocked_reels: Optional[List[int]] = None):
+        self.engine = engine
+        self.config = engine.config
+        self.scatter_symbol = scatter_symbol
+        self.icon = icon
+        self.blocked_reels = blocked_reels if blocked_reels is not None else []
+        self.evaluator = engine.get_payline_evaluator(scatter_symbol)
+        if self.evaluator.outcome_table is None:
+            raise ValueError("Game is too large for an exact line-outcome table.")
+        for line_index, columns in enumerate(self.evaluator.column_index):
+            if len(set(columns.tolist())) != len(columns):
+                raise ValueError(f"Payline {line_index + 1} visits a reel more than once.")
+
+    def _blocked_icon(self, reel_idx):
+        if reel_idx in self.blocked_reels and self.icon in range(1, self.config.symbols + 1):
+            return self.icon
+        return None
+
+    def symbol_probabilities(self, reel_idx: int):
+        """
+        Per-cell symbol probabilities of one reel.
+
+        Returns:
+            tuple: ``(full, reduced)`` dicts of symbol -> probability; ``reduced``
+            applies once symbol 10 is on the column and is None when the reel
+            cannot draw it.
+        """
+        blocked_icon = self._blocked_icon(reel_idx)
+        full = self.engine.get_alias_table(reel_idx, blocked_icon).probabilities()
+        reduced = None
+        if UNIQUE_REEL_SYMBOL in full:
+            reduced = self.engine.get_alias_table(
+                reel_idx, blocked_icon, frozenset((UNIQUE_REEL_SYMBOL,))).probabilities()
+        return full, reduced
+
+    def column_distribution(self, reel_idx: int) -> Dict[tuple, float]:
+        """
+        Exact probability of every column outcome of one reel.
+
+        Mirrors get_weighted_reels: rows are drawn top to bottom and, once
+        symbol 10 is drawn, the remaining rows come from the table without it.
+        """
+        full, reduced = self.symbol_probabilities(reel_idx)
+
+        outcomes = {(): 1.0}
+        for _ in range(self.config.rows):
+            extended = {}
+            for column, probability in outcomes.items():
+                table = reduced if UNIQUE_REEL_SYMBOL in column else full
+                for symbol, symbol_probability in table.items():
+                    extended[column + (symbol,)] = probability * symbol_probability
+            outcomes = extended
+        return outcomes
+
+    def cell_distributions(self) -> np.ndarray:
+        """``(columns, rows, symbols + 1)`` probability of each symbol in each cell."""
+        cells = np.zeros((self.config.columns, self.config.rows, self.config.symbols + 1))
+        for reel_idx in range(self.config.columns):
+            for column, probability in self.column_distribution(reel_idx).items():
+                for row, symbol in enumerate(column):
+                    cells[reel_idx, row, symbol] += probability
+        return cells
+
+    def line_distribution(self, line_index: int, cells: np.ndarray) -> np.ndarray:
+        """Probability of every line code (same order as ``LineOutcomeTable``)."""
+        distribution = np.ones(1)
+        for col, row in zip(self.evaluator.column_index[line_index], self.evaluator.row_index[line_index]):
+            distribution = np.multiply.outer(distribution, cells[col, row]).ravel()
+        return distribution
+
+    def calculate(self) -> dict:
+        """
+        calculate - Exact base-game RTP and its breakdown.
+
+        Returns:
+            dict: ``rtp`` in percent, ``line_contributions`` (RTP share and hit
+            probability per payline) and ``symbol_contributions`` (RTP share
+            per paying symbol).
+        """
+        table = self.evaluator.outcome_table
+        cells = self.cell_distributions()
+        symbol_contributions = np.zeros(self.config.symbols + 1)
+        line_contributions = []
+
+        for line_index in range(self.evaluator.line_count):
+            probability = self.line_distribution(line_index, cells)
+            expected = probability * table.multiplier
+            line_rtp = expected.sum() / LINE_BET_DIVISOR * 100
+            symbol_contributions += np.bincount(
+                table.symbol, weights=expected, minlength=self.config.symbols + 1
+            ) / LINE_BET_DIVISOR * 100
+            line_contributions.append({
+                "line": line_index + 1,
+                "rtp": float(line_rtp),
+                "hit_probability": float(probability[table.length > 0].sum()),
+            })
+
+        return {
+            "rtp": float(sum(line["rtp"] for line in line_contributions)),
+            "line_contributions": line_contributions,
+            "symbol_contributions": {
+                symbol: float(symbol_contributions[symbol])
+                for symbol in range(1, self.config.symbols + 1)
+                if symbol_contributions[symbol] > 0
+            },
+        }
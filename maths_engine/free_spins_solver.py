@@ -0,0 +1,127 @@
+# maths_engine/free_spins_solver.py
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from maths_engine.exact_rtp import ExactRtpCalculator
+from maths_engine.plugins.free_spins import FreeSpinsPlugin
+
+# Remaining free spins tracked by the chain; larger balances are folded into the last state.
+DEFAULT_MAX_REMAINING = 1000
+
+
+class FreeSpinsSolver:
+    """
+    Analytic value of the FreeSpinsPlugin feature.
+
+    Icons are only counted on the non-blocked reels, and those reels keep
+    their weights in free spins, so every spin has the same icon-count
+    distribution: the convolution of the per-reel counts. Awards follow
+    ``FreeSpinsPlugin.free_spins_awarded``. During the feature the balance of
+    remaining free spins is an absorbing Markov chain (one spin used, the
+    award added), solved for the expected feature length. Whether a free
+    spin is played depends only on earlier spins, so by Wald's identity the
+    feature payout is its expected length times the expected spin payout.
+
+    Weights follow the simulation loop, where a grid is drawn before the
+    plugin switches weights: the first free spin of a feature is drawn with
+    base weights and the first base spin after it with free-spin weights.
+    """
+
+    def __init__(self, engine, icon: int, blocked_reels: Optional[List[int]] = None,
+                 max_remaining: int = DEFAULT_MAX_REMAINING):
+        self.config = engine.config
+        if icon not in range(1, self.config.symbols + 1):
+            raise ValueError(f"Free spins icon must be a symbol between 1 and {self.config.symbols}, got {icon}")
+        self.icon = icon
+        self.blocked_reels = blocked_reels if blocked_reels is not None else [0, 4]
+        self.max_remaining = max_remaining
+        self.base_calculator = ExactRtpCalculator(engine)
+        # Free-spin weights drop the icon from the blocked reels
+        self.free_calculator = ExactRtpCalculator(engine, icon=icon, blocked_reels=self.blocked_reels)
+
+    def icon_count_distribution(self) -> np.ndarray:
+        """Probability of ``k`` icons on the non-blocked reels, indexed by ``k``."""
+        counts = np.ones(1)
+        for reel_idx in range(self.config.columns):
+            if reel_idx in self.blocked_reels:
+                continue
+            reel_counts = np.zeros(self.config.rows + 1)
+            for column, probability in self.base_calculator.column_distribution(reel_idx).items():
+                reel_counts[column.count(self.icon)] += probability
+            counts = np.convolve(counts, reel_counts)
+        return counts
+
+    @staticmethod
+    def award_distribution(counts: np.ndarray, is_free_spin: bool) -> Dict[int, float]:
+        """Probability of each number of free spins awarded by one spin."""
+        awards = {}
+        for count, probability in enumerate(counts):
+            won = FreeSpinsPlugin.free_spins_awarded(count, is_free_spin)
+            awards[won] = awards.get(won, 0.0) + float(probability)
+        return awards
+
+    def expected_remaining_spins(self, retrigger: Dict[int, float]) -> np.ndarray:
+        """
+        Expected free spins played from each balance of remaining free spins.
+
+        Args:
+            retrigger (dict): Award distribution of a free spin.
+        Returns:
+            np.ndarray: Entry ``r - 1`` is the expected feature length starting
+            from ``r`` remaining free spins.
+        """
+        expected_award = sum(won * probability for won, probability in retrigger.items())
+        if expected_award >= 1:
+            raise ValueError(f"Free spins award {expected_award:.4f} spins per free spin on average, "
+                             f"so the feature does not end.")
+
+        size = self.max_remaining
+        transient = np.zeros((size, size))
+        for remaining in range(1, size + 1):
+            for won, probability in retrigger.items():
+                following = min(remaining - 1 + won, size)
+                if following > 0:
+                    transient[remaining - 1, following - 1] += probability
+        return np.linalg.solve(np.eye(size) - transient, np.ones(size))
+
+    def calculate(self) -> dict:
+        """
+        calculate - Expected value of the free-spins feature.
+
+        Returns:
+            dict: ``rtp`` (base game plus feature, per paid spin, in percent),
+            its ``base_rtp`` and ``feature_rtp`` shares, ``trigger_probability``,
+            ``retrigger_probabilities`` (per number of spins awarded),
+            ``expected_feature_spins`` and ``expected_feature_payout`` (in
+            multiples of the bet).
+        """
+        counts = self.icon_count_distribution()
+        trigger = self.award_distribution(counts, is_free_spin=False)
+        retrigger = self.award_distribution(counts, is_free_spin=True)
+        if max(max(trigger), max(retrigger)) >= self.max_remaining:
+            raise ValueError(f"max_remaining must exceed the largest award of {max(max(trigger), max(retrigger))}")
+        remaining_spins = self.expected_remaining_spins(retrigger)
+
+        trigger_probability = sum(probability for won, probability in trigger.items() if won > 0)
+        feature_spins = 0.0
+        if trigger_probability > 0:
+            feature_spins = float(sum(probability * remaining_spins[won - 1]
+                                      for won, probability in trigger.items() if won > 0)) / trigger_probability
+
+        base_payout = self.base_calculator.calculate()["rtp"] / 100
+        free_payout = self.free_calculator.calculate()["rtp"] / 100
+        feature_payout = base_payout + (feature_spins - 1) * free_payout if feature_spins else 0.0
+        # A base spin follows a feature (and uses free-spin weights) as often as features trigger.
+        base_spin_payout = (1 - trigger_probability) * base_payout + trigger_probability * free_payout
+
+        return {
+            "rtp": (base_spin_payout + trigger_probability * feature_payout) * 100,
+            "base_rtp": base_spin_payout * 100,
+            "feature_rtp": trigger_probability * feature_payout * 100,
+            "trigger_probability": trigger_probability,
+            "retrigger_probabilities": retrigger,
+            "expected_retrigger_spins": sum(won * probability for won, probability in retrigger.items()),
+            "expected_feature_spins": feature_spins,
+            "expected_feature_payout": feature_payout,
+        }
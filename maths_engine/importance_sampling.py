@@ -0,0 +1,194 @@
+# maths_engine/importance_sampling.py
+import copy
+import math
+import random
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+from maths_engine.configuration import Configuration
+from maths_engine.isaac_rng_v2 import IsaacLanes, substream_seed
+from maths_engine.simulation import BIG_WIN_MULTIPLIER
+from maths_engine.simulation_kernel import DEFAULT_CHUNK_SIZE, DEFAULT_LANES
+from maths_engine.simulation_pool import build_configuration
+from maths_engine.slot_machine_engine import UNIQUE_REEL_SYMBOL, SlotMachineEngine
+from maths_engine.spin_statistics import DEFAULT_CONFIDENCE, add_returns, moments_variance, new_moments, z_value
+from maths_engine.state_manager import StateManager
+
+# Win sizes, in multiples of the bet, whose probabilities an importance sampling run reports by default
+DEFAULT_TAIL_MULTIPLIERS = (100, BIG_WIN_MULTIPLIER)
+# Most spins one importance sampling request may play
+MAX_IMPORTANCE_SPINS = 50_000_000
+
+
+def tilted_engine(engine, tilt: Dict[int, float]):
+    """
+    Copy of ``engine`` whose reels weigh every symbol ``tilt.get(symbol, 1)``
+    times as much, apportioned back onto the weight resolution. A symbol the
+    engine can draw keeps at least one weight unit, so every grid of the game
+    stays possible and the likelihood ratio of every grid is finite.
+    """
+    for symbol, factor in tilt.items():
+        if symbol not in range(1, engine.config.symbols + 1):
+            raise ValueError(f"Tilted symbol must be between 1 and {engine.config.symbols}, got {symbol}")
+        if not factor > 0:
+            raise ValueError(f"Tilt of symbol {symbol} must be positive, got {factor}")
+    tilted = copy.copy(engine)
+    tilted.reel_weights = dict(engine.reel_weights)
+    tilted._alias_tables = {}
+    for reel_idx, weights in engine.reel_weights.items():
+        scaled = Configuration.to_integer_weights(
+            [weight * tilt.get(symbol, 1.0) for symbol, weight in enumerate(weights, start=1)],
+            engine.weight_resolution)
+        tilted.set_reel_weights(reel_idx, [max(units, 1) if weight > 0 else 0
+                                           for units, weight in zip(scaled, weights)])
+    return tilted
+
+
+class ImportanceSampler:
+    """
+    Base game spins drawn from tilted reel weights, weighted back to the game.
+
+    Grids come from ``tilted_engine(engine, tilt)``, so wins built from the
+    tilted symbols, rare under the game's weights, turn up often. Each grid
+    carries its likelihood ratio, the probability of drawing it from the
+    game's reels over that from the tilted ones, cell by cell as
+    ``get_weighted_reels`` draws (symbol 10 at most once per reel). Averages
+    of a quantity times the ratio are then unbiased for its expectation
+    under the game: the RTP, and the probability and RTP contribution of
+    wins of at least each of ``tail_multipliers`` times the bet. Plugins,
+    whose spins depend on the previous ones, are not modelled.
+    """
+
+    def __init__(self, engine, tilt: Dict[int, float], bet_amount: float = 1.0, seed: Optional[int] = None,
+                 tail_multipliers: Sequence[float] = DEFAULT_TAIL_MULTIPLIERS, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 lanes: int = DEFAULT_LANES):
+        if bet_amount <= 0:
+            raise ValueError(f"Bet amount must be positive, got {bet_amount}")
+        if any(not multiplier > 0 for multiplier in tail_multipliers):
+            raise ValueError(f"Tail multipliers must be positive, got {list(tail_multipliers)}")
+        self.engine = engine
+        self.tilt = dict(tilt)
+        self.tilted = tilted_engine(engine, self.tilt)
+        self.bet_amount = bet_amount
+        self.chunk_size = chunk_size
+        self.evaluator = engine.get_payline_evaluator()
+        self.log_ratios = [self._reel_log_ratios(reel_idx) for reel_idx in range(engine.config.columns)]
+        if seed is None:
+            seed = random.getrandbits(64)
+        self.seed = seed
+        self.rng = IsaacLanes([substream_seed(seed, "importance", lane) for lane in range(lanes)])
+        self.spins = 0
+        # Moments of the likelihood ratios and of the weighted returns
+        self.ratio_moments = new_moments()
+        self.return_moments = new_moments()
+        self.tails = {float(multiplier): {"probability": new_moments(), "contribution": new_moments(), "observed": 0}
+                      for multiplier in sorted(set(tail_multipliers))}
+
+    def _reel_log_ratios(self, reel_idx: int):
+        """Log likelihood ratio of each symbol on one reel, before and after symbol 10 is drawn there."""
+        tables = []
+        excluded_sets = [frozenset()]
+        if UNIQUE_REEL_SYMBOL in self.engine.get_alias_table(reel_idx).symbols:
+            excluded_sets.append(frozenset((UNIQUE_REEL_SYMBOL,)))
+        for excluded in excluded_sets:
+            nominal = self.engine.get_alias_table(reel_idx, excluded=excluded).probabilities()
+            tilted = self.tilted.get_alias_table(reel_idx, excluded=excluded).probabilities()
+            log_ratios = np.zeros(self.engine.config.symbols + 1)
+            for symbol, probability in nominal.items():
+                log_ratios[symbol] = math.log(probability) - math.log(tilted[symbol])
+            tables.append(log_ratios)
+        return tables[0], tables[1] if len(tables) > 1 else None
+
+    def likelihood_ratios(self, grids: np.ndarray) -> np.ndarray:
+        """Likelihood ratio of every grid of an ``(n, columns, rows)`` batch."""
+        log_ratio = np.zeros(grids.shape[0])
+        for reel_idx, (full, reduced) in enumerate(self.log_ratios):
+            seen = np.zeros(grids.shape[0], dtype=bool)
+            for row in range(grids.shape[2]):
+                cells = grids[:, reel_idx, row]
+                if reduced is None:
+                    log_ratio += full[cells]
+                else:
+                    log_ratio += np.where(seen, reduced[cells], full[cells])
+                    seen |= cells == UNIQUE_REEL_SYMBOL
+        return np.exp(log_ratio)
+
+    def run(self, num_spins: int):
+        """Draw, evaluate and weigh ``num_spins`` more spins."""
+        remaining = num_spins
+        while remaining > 0:
+            size = min(self.chunk_size, remaining)
+            grids = self.tilted.generate_grids(size, rng=self.rng)
+            returns = self.evaluator.evaluate(grids, self.bet_amount) / self.bet_amount
+            ratios = self.likelihood_ratios(grids)
+            add_returns(self.ratio_moments, ratios)
+            add_returns(self.return_moments, ratios * returns)
+            for multiplier, tail in self.tails.items():
+                # Payouts are sums of float multipliers, so allow for rounding at the threshold
+                hit = returns >= multiplier * (1 - 1e-9)
+                tail["observed"] += int(np.count_nonzero(hit))
+                add_returns(tail["probability"], np.where(hit, ratios, 0.0))
+                add_returns(tail["contribution"], np.where(hit, ratios * returns, 0.0))
+            self.spins += size
+            remaining -= size
+
+    def _estimate(self, moments: dict):
+        """Mean of the weighted values of ``moments`` and its standard error."""
+        if moments["count"] < 2:
+            return moments["mean"], math.inf
+        return moments["mean"], math.sqrt(moments_variance(moments) / moments["count"])
+
+    def results(self, confidence: float = DEFAULT_CONFIDENCE) -> dict:
+        """
+        Importance sampling estimates so far, with normal ``confidence``
+        intervals. ``variance_reduction`` of a tail is how many times more
+        spins plain sampling needs for the same precision, and the effective
+        sample size that of plain sampling the ratios' spread is worth.
+        """
+        z = z_value(confidence)
+        ratios = self.ratio_moments
+        ratio_squares = ratios["m2"] + ratios["count"] * ratios["mean"] ** 2
+        rtp, rtp_error = self._estimate(self.return_moments)
+        tails = []
+        for multiplier, tail in self.tails.items():
+            probability, error = self._estimate(tail["probability"])
+            contribution, contribution_error = self._estimate(tail["contribution"])
+            variance = moments_variance(tail["probability"])
+            tails.append({
+                "multiplier": multiplier,
+                "probability": probability,
+                "standard_error": error,
+                "interval": [max(probability - z * error, 0.0), probability + z * error],
+                "one_in": 1 / probability if probability > 0 else None,
+                "rtp_contribution": 100 * contribution,
+                "rtp_contribution_standard_error": 100 * contribution_error,
+                "spins_observed": tail["observed"],
+                "variance_reduction": probability * (1 - probability) / variance if variance > 0 else None,
+            })
+        return {
+            "seed": self.seed,
+            "spins": self.spins,
+            "tilt": self.tilt,
+            "confidence": confidence,
+            "rtp": 100 * rtp,
+            "rtp_standard_error": 100 * rtp_error,
+            "mean_likelihood_ratio": ratios["mean"],
+            "effective_sample_size": (ratios["count"] * ratios["mean"]) ** 2 / ratio_squares if ratio_squares else 0.0,
+            "tails": tails,
+        }
+
+
+def run_importance_sampling_task(params: dict, tilt: Dict[int, float], num_spins: int,
+                                 tail_multipliers: Sequence[float] = DEFAULT_TAIL_MULTIPLIERS,
+                                 confidence: float = DEFAULT_CONFIDENCE) -> dict:
+    """
+    Importance sample ``num_spins`` spins of the game of request-named
+    ``params`` in a pool worker and return the sampler's ``results``.
+    """
+    config = build_configuration(params)
+    engine = SlotMachineEngine(config=config, state_manager=StateManager(initial_state={"config": config}))
+    sampler = ImportanceSampler(engine, tilt, bet_amount=params["bet_amount"], seed=params.get("seed"),
+                                tail_multipliers=tail_multipliers)
+    sampler.run(num_spins)
+    return sampler.results(confidence)
@@ -1,7 +1,10 @@
+import hashlib
 import random
 
+import numpy as np
 
 mod = 2**32
+MASK_32 = 0xFFFFFFFF
 
 
 def mix(a, b, c, d, e, f, g, h):
@@ -32,15 +35,37 @@ def mix(a, b, c, d, e, f, g, h):
     return a, b, c, d, e, f, g, h
 
 
+def substream_seed(master_seed: int, *keys) -> int:
+    """
+    Derive an independent 64-bit seed for the substream named by ``keys``.
+
+    The seed is a BLAKE2b hash of the master seed and the keys, so
+    substreams of different keys (or master seeds) are unrelated and any one
+    of them can be recreated from the master seed alone.
+    """
+    material = repr((int(master_seed),) + tuple(keys)).encode()
+    return int.from_bytes(hashlib.blake2b(material, digest_size=8).digest(), "little")
+
+
+def substream_seeds(master_seed: int, count: int, *keys) -> list:
+    """Seeds of ``count`` substreams: ``substream_seed(master_seed, *keys, index)`` for each index."""
+    return [substream_seed(master_seed, *keys, index) for index in range(count)]
+
+
 class Isaac:
     def __init__(
         self,
         state_manager,
         dummy_icon=0,
+        seed=None,
     ):
         self.state_manager = state_manager
+        self.seed = seed
         self.mm = [0] * 256
-        self.randrsl = [random.getrandbits(32) for _ in range(256)]
+        # An explicit seed makes the whole stream reproducible; without one the
+        # seed vector comes from Python's global generator as before.
+        seeder = random.Random(seed) if seed is not None else random
+        self.randrsl = [seeder.getrandbits(32) for _ in range(256)]
         # self.randrsl = [0] * 256  # FIXME: this is only for testing. Delete this line and uncomment previous line.
         # self.randcnt = 0
         self.aa = 0
@@ -51,6 +76,11 @@ class Isaac:
 
         self.__randinit__(True)
 
+    @classmethod
+    def substreams(cls, state_manager, master_seed: int, count: int, *keys) -> list:
+        """``count`` independent generators derived from ``master_seed`` (see ``substream_seeds``)."""
+        return [cls(state_manager, seed=seed) for seed in substream_seeds(master_seed, count, *keys)]
+
     def rand(self, mod=2**32, reel_idx=0, icon=0):
         # print("state_manager in isaac : ", self.state_manager.get_full_state())
         reel_idx-=1
@@ -72,29 +102,131 @@ class Isaac:
 
         return symbol 
 
+    def next_word(self) -> int:
+        """Return the next raw 32-bit word of the stream."""
+        if self.randcnt == 256:
+            self.__isaac__()
+            self.randcnt = 0
+        word = self.randrsl[self.randcnt]
+        self.randcnt += 1
+        return word
+
+    def randbelow(self, n: int) -> int:
+        """
+        Unbiased integer in ``[0, n)`` from raw 32-bit words.
+
+        Uses Lemire's multiply-shift with rejection: the high half of
+        ``word * n`` is the draw, and the rare words whose low half falls in
+        the biased zone are redrawn.
+        """
+        if not 0 < n <= mod:
+            raise ValueError(f"Bound must be in (0, 2**32], got {n}")
+        product = self.next_word() * n
+        low = product & MASK_32
+        if low < n:
+            threshold = (mod - n) % n
+            while low < threshold:
+                product = self.next_word() * n
+                low = product & MASK_32
+        return product >> 32
+
+    def randbelow_batch(self, n: int, bound: int) -> np.ndarray:
+        """Vectorised ``randbelow``: ``n`` unbiased integers in ``[0, bound)``."""
+        if not 0 < bound <= mod:
+            raise ValueError(f"Bound must be in (0, 2**32], got {bound}")
+        product = self.raw_batch(n).astype(np.uint64) * np.uint64(bound)
+        threshold = (mod - bound) % bound
+        rejected = np.flatnonzero((product & np.uint64(MASK_32)) < threshold)
+        while rejected.size:
+            redraw = self.raw_batch(rejected.size).astype(np.uint64) * np.uint64(bound)
+            product[rejected] = redraw
+            rejected = rejected[(redraw & np.uint64(MASK_32)) < threshold]
+        return (product >> np.uint64(32)).astype(np.int64)
+
+    def next_block(self) -> np.ndarray:
+        """Run one ISAAC round and return its 256 result words as ``uint32``.
+
+        The block is marked as consumed, so scalar ``rand`` calls continue
+        with the round after it.
+        """
+        self.__isaac__()
+        self.randcnt = 256
+        return np.array(self.randrsl, dtype=np.uint32)
+
+    def raw_batch(self, n: int) -> np.ndarray:
+        """Return the next ``n`` raw 32-bit words of the stream as ``uint32``.
+
+        Words are taken in exactly the order ``rand`` would take them, so
+        mixing scalar and batch calls never skips or repeats output.
+        """
+        out = np.empty(n, dtype=np.uint32)
+        filled = 0
+        while filled < n:
+            if self.randcnt == 256:
+                if n - filled >= 256:
+                    out[filled:filled + 256] = self.next_block()
+                    filled += 256
+                    continue
+                self.__isaac__()
+                self.randcnt = 0
+            take = min(256 - self.randcnt, n - filled)
+            out[filled:filled + take] = self.randrsl[self.randcnt:self.randcnt + take]
+            self.randcnt += take
+            filled += take
+        return out
+
+    def get_state(self) -> dict:
+        """Position in the stream: the internal state and the unread words of the current round."""
+        return {"mm": list(self.mm), "randrsl": list(self.randrsl), "randcnt": self.randcnt,
+                "aa": self.aa, "bb": self.bb, "cc": self.cc}
+
+    def set_state(self, state: dict):
+        """Continue the stream from a ``get_state`` position."""
+        self.mm = list(state["mm"])
+        self.randrsl = list(state["randrsl"])
+        self.randcnt = state["randcnt"]
+        self.aa, self.bb, self.cc = state["aa"], state["bb"], state["cc"]
+
+    def rand_batch(self, n: int, mod=2**32) -> np.ndarray:
+        """Vectorised ``rand``: ``n`` draws of ``word % mod + 1`` in one call."""
+        words = self.raw_batch(n)
+        if isinstance(mod, float):
+            return words.astype(np.float64) % mod + 1
+        return words.astype(np.int64) % mod + 1
+
     def __isaac__(self):
+        # Same recurrence as the reference implementation, unrolled over the
+        # four shift cases and run on local variables; the sequence is
+        # bit-identical.
+        mm = self.mm
+        randrsl = self.randrsl
         self.cc += 1
-        self.bb += self.cc
-        self.bb &= 0xFFFFFFFF
+        bb = (self.bb + self.cc) & MASK_32
+        aa = self.aa
 
-        for i in range(256):
-            x = self.mm[i]
-            switch = i % 4
-            xorwith = None
-            if switch == 0:
-                xorwith = (self.aa << 13) % mod
-            elif switch == 1:
-                xorwith = self.aa >> 6
-            elif switch == 2:
-                xorwith = (self.aa << 2) % mod
-            elif switch == 3:
-                xorwith = self.aa >> 16
-            else:
-                raise Exception("math is broken")
-            self.aa = self.aa ^ xorwith
-            self.aa = (self.mm[(i + 128) % 256] + self.aa) % mod
-            y = self.mm[i] = (self.mm[(x >> 2) % 256] + self.aa + self.bb) % mod
-            self.randrsl[i] = self.bb = (self.mm[(y >> 10) % 256] + x) % mod
+        for i in range(0, 256, 4):
+            x = mm[i]
+            aa = (mm[(i + 128) & 255] + (aa ^ ((aa << 13) & MASK_32))) & MASK_32
+            y = mm[i] = (mm[(x >> 2) & 255] + aa + bb) & MASK_32
+            randrsl[i] = bb = (mm[(y >> 10) & 255] + x) & MASK_32
+
+            x = mm[i + 1]
+            aa = (mm[(i + 129) & 255] + (aa ^ (aa >> 6))) & MASK_32
+            y = mm[i + 1] = (mm[(x >> 2) & 255] + aa + bb) & MASK_32
+            randrsl[i + 1] = bb = (mm[(y >> 10) & 255] + x) & MASK_32
+
+            x = mm[i + 2]
+            aa = (mm[(i + 130) & 255] + (aa ^ ((aa << 2) & MASK_32))) & MASK_32
+            y = mm[i + 2] = (mm[(x >> 2) & 255] + aa + bb) & MASK_32
+            randrsl[i + 2] = bb = (mm[(y >> 10) & 255] + x) & MASK_32
+
+            x = mm[i + 3]
+            aa = (mm[(i + 131) & 255] + (aa ^ (aa >> 16))) & MASK_32
+            y = mm[i + 3] = (mm[(x >> 2) & 255] + aa + bb) & MASK_32
+            randrsl[i + 3] = bb = (mm[(y >> 10) & 255] + x) & MASK_32
+
+        self.aa = aa
+        self.bb = bb
 
     def __randinit__(self, flag):
         a = b = c = d = e = f = g = h = 0x9E3779B9
@@ -158,3 +290,108 @@ class Isaac:
                 i += 8
         self.__isaac__()
         self.randcnt = 256
+
+
+class IsaacLanes:
+    """
+    ``lanes`` independent ISAAC generators advanced together.
+
+    Lane ``k`` is bit-identical to ``Isaac(state_manager, seed=seeds[k])``;
+    the state is kept word-major as ``(256, lanes)`` ``uint32`` arrays so each
+    step of the recurrence is a handful of NumPy operations over all lanes
+    instead of Python integer work per word. Rounds are handed out word by
+    word across lanes (word 0 of every lane, then word 1, ...), and the batch
+    methods share ``Isaac``'s interface so AliasTable and
+    ``SlotMachineEngine.generate_grids`` accept either generator.
+    """
+
+    _shifts = ((13, True), (6, False), (2, True), (16, False))
+
+    def __init__(self, seeds):
+        self.seeds = [int(seed) for seed in seeds]
+        self.lanes = len(self.seeds)
+        if not 0 < self.lanes <= 2**24:
+            raise ValueError(f"Lane count must be in (0, 2**24], got {self.lanes}")
+        # random.Random.getrandbits(8192) yields the same words as 256 calls of getrandbits(32)
+        randrsl = np.stack([
+            np.frombuffer(random.Random(seed).getrandbits(256 * 32).to_bytes(1024, "little"), dtype="<u4")
+            for seed in self.seeds
+        ], axis=1).astype(np.uint64)
+        self.lane_index = np.arange(self.lanes, dtype=np.uint32)
+        self.mm = self.__randinit__(randrsl)
+        self.aa = np.zeros(self.lanes, dtype=np.uint32)
+        self.bb = np.zeros(self.lanes, dtype=np.uint32)
+        self.cc = 0
+        self.randrsl = np.empty((256, self.lanes), dtype=np.uint32)
+        self.__isaac__()
+        # Isaac discards the round run by its initialisation in the same way
+        self._buffer = np.empty(0, dtype=np.uint32)
+
+    def __randinit__(self, randrsl):
+        words = [np.full(self.lanes, 0x9E3779B9, dtype=np.uint64) for _ in range(8)]
+        for _ in range(4):
+            words = list(mix(*words))
+
+        mm = np.empty((256, self.lanes), dtype=np.uint64)
+        for source in (randrsl, mm):
+            for i in range(0, 256, 8):
+                words = list(mix(*[(word + source[i + j]) % mod for j, word in enumerate(words)]))
+                mm[i:i + 8] = np.stack(words)
+        return mm.astype(np.uint32)
+
+    def __isaac__(self):
+        mm = self.mm
+        flat = mm.reshape(-1)
+        lanes = np.uint32(self.lanes)
+        lane_index = self.lane_index
+        randrsl = self.randrsl
+        self.cc += 1
+        bb = self.bb + np.uint32(self.cc)
+        aa = self.aa
+
+        for i in range(256):
+            shift, left = self._shifts[i & 3]
+            x = mm[i].copy()
+            aa = mm[(i + 128) & 255] + (aa ^ ((aa << np.uint32(shift)) if left else (aa >> np.uint32(shift))))
+            y = flat[((x >> np.uint32(2)) & np.uint32(255)) * lanes + lane_index] + aa + bb
+            mm[i] = y
+            bb = flat[((y >> np.uint32(10)) & np.uint32(255)) * lanes + lane_index] + x
+            randrsl[i] = bb
+
+        self.aa = aa
+        self.bb = bb
+
+    def raw_batch(self, n: int) -> np.ndarray:
+        """Return the next ``n`` raw 32-bit words, lanes interleaved, as ``uint32``."""
+        chunks = [self._buffer[:n]]
+        filled = chunks[0].size
+        self._buffer = self._buffer[filled:]
+        while filled < n:
+            self.__isaac__()
+            block = self.randrsl.reshape(-1)
+            take = min(block.size, n - filled)
+            chunks.append(block[:take].copy())
+            self._buffer = block[take:].copy()
+            filled += take
+        return np.concatenate(chunks) if len(chunks) > 1 else chunks[0].copy()
+
+    def get_state(self) -> dict:
+        """
+        Position of every lane: the internal state and the buffered words not
+        handed out yet (a round overwrites ``randrsl`` whole, so it is left out).
+        """
+        return {"mm": self.mm.copy(), "aa": self.aa.copy(), "bb": self.bb.copy(), "cc": self.cc,
+                "buffer": self._buffer.copy()}
+
+    def set_state(self, state: dict):
+        """Continue every lane from a ``get_state`` position of a generator with as many lanes."""
+        if state["mm"].shape != self.mm.shape:
+            raise ValueError(f"State of {state['mm'].shape[1]} lanes given to a generator of {self.lanes}")
+        self.mm = state["mm"].copy()
+        self.aa, self.bb = state["aa"].copy(), state["bb"].copy()
+        self.cc = state["cc"]
+        self._buffer = state["buffer"].copy()
+
+    # Lemire draws and ``word % mod + 1`` only need raw_batch
+    randbelow_batch = Isaac.randbelow_batch
+    rand_batch = Isaac.rand_batch
@@ -0,0 +1,187 @@
+# maths_engine/parameter_sweep.py
+import itertools
+import math
+import random
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from maths_engine.isaac_rng_v2 import MASK_32, IsaacLanes, mod, substream_seed
+from maths_engine.simulation_kernel import DEFAULT_CHUNK_SIZE, DEFAULT_LANES
+from maths_engine.simulation_pool import build_configuration
+from maths_engine.slot_machine_engine import UNIQUE_REEL_SYMBOL, SlotMachineEngine
+from maths_engine.spin_statistics import DEFAULT_CONFIDENCE, add_returns, moments_variance, new_moments, z_value
+from maths_engine.state_manager import StateManager
+
+# Request fields a sweep may vary; the others, grid shape included, are shared by every variant
+SWEEP_FIELDS = ("weight_formula", "payout_formula", "custom_symbol_payouts", "custom_paylines", "weight_resolution",
+                "wild_symbol")
+MAX_SWEEP_VARIANTS = 64
+# Most spins a sweep plays over all its variants (num_spins times the variants)
+MAX_SWEEP_SPINS = 50_000_000
+
+
+def sweep_variants(grid: Dict[str, List[Any]]) -> List[dict]:
+    """
+    Overrides of every variant of a sweep: the base game (no overrides)
+    first, then every combination of the values of ``grid``, which maps
+    fields of ``SWEEP_FIELDS`` to the values to try.
+    """
+    unknown = sorted(set(grid) - set(SWEEP_FIELDS))
+    if unknown:
+        raise ValueError(f"A sweep can vary {', '.join(SWEEP_FIELDS)}; got {unknown}")
+    if any(not values for values in grid.values()):
+        raise ValueError("Every swept field needs at least one value.")
+    fields = sorted(grid)
+    combinations = itertools.product(*(grid[field] for field in fields))
+    variants = [{}] + [dict(zip(fields, values)) for values in combinations]
+    if len(variants) > MAX_SWEEP_VARIANTS:
+        raise ValueError(f"A sweep runs at most {MAX_SWEEP_VARIANTS} variants, got {len(variants)}")
+    return variants
+
+
+class ParameterSweep:
+    """
+    Base game variants compared on common random numbers.
+
+    Every batch draws its raw 32-bit words once. Each distinct weight
+    table turns the same words into grids by inverse transform: a word
+    becomes an exact uniform position in the reel's integer weights, by
+    the multiply-and-shift bounded draw, and the symbol whose cumulative
+    weight covers it is drawn. The draws of rejected words come from a side
+    stream, so the shared words stay aligned. Variants differing in their
+    paytable or paylines alone are evaluated on the very same grids, and
+    those differing in weights on grids that change only where the weights
+    move a position to another symbol. Spin by spin differences from the
+    base game therefore have far less noise than independent runs.
+    Plugins, which make spins depend on earlier ones, are not supported.
+    """
+
+    def __init__(self, params: dict, variants: List[dict], seed: Optional[int] = None,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE, lanes: int = DEFAULT_LANES):
+        if params.get("plugins"):
+            raise ValueError(f"A sweep covers the base game only; got plugins {sorted(params['plugins'])}")
+        if not variants or variants[0]:
+            raise ValueError("The first variant of a sweep is the base game, without overrides.")
+        self.bet_amount = params["bet_amount"]
+        if self.bet_amount <= 0:
+            raise ValueError(f"Bet amount must be positive, got {self.bet_amount}")
+        self.variants = variants
+        self.engines = []
+        for overrides in variants:
+            config = build_configuration({**params, **overrides})
+            self.engines.append(SlotMachineEngine(config=config,
+                                                  state_manager=StateManager(initial_state={"config": config})))
+        # Variants drawing from the same weights share their grids
+        self.weight_groups = {}
+        for index, engine in enumerate(self.engines):
+            key = (engine.config.wild_symbol, tuple(tuple(engine.reel_weights[reel_idx])
+                                                    for reel_idx in range(engine.config.columns)))
+            self.weight_groups.setdefault(key, []).append(index)
+        self.chunk_size = chunk_size
+        if seed is None:
+            seed = random.getrandbits(64)
+        self.seed = seed
+        self.rng = IsaacLanes([substream_seed(seed, "sweep", lane) for lane in range(lanes)])
+        self.side_rng = IsaacLanes([substream_seed(seed, "sweep-redraw", lane) for lane in range(lanes)])
+        self.spins = 0
+        # Moments of every variant's returns and of their differences from the base game's
+        self.return_moments = [new_moments() for _ in variants]
+        self.difference_moments = [new_moments() for _ in variants]
+
+    def _draw_symbols(self, table, words: np.ndarray) -> np.ndarray:
+        """Inverse transform of ``words`` through an alias table's integer weights."""
+        product = words.astype(np.uint64) * np.uint64(table.total)
+        threshold = (mod - table.total) % table.total
+        rejected = np.flatnonzero((product & np.uint64(MASK_32)) < threshold)
+        while rejected.size:
+            redraw = self.side_rng.raw_batch(rejected.size).astype(np.uint64) * np.uint64(table.total)
+            product[rejected] = redraw
+            rejected = rejected[(redraw & np.uint64(MASK_32)) < threshold]
+        positions = (product >> np.uint64(32)).astype(np.int64)
+        cumulative = np.cumsum(table.weights)
+        return np.asarray(table.symbols, dtype=np.uint8)[np.searchsorted(cumulative, positions, side="right")]
+
+    def generate_grids(self, engine, words: np.ndarray) -> np.ndarray:
+        """
+        Grids of ``engine``'s weights from ``(n, columns, rows)`` raw words,
+        following get_weighted_reels' rules like ``generate_grids``.
+        """
+        grids = np.empty(words.shape, dtype=np.uint8)
+        for reel_idx in range(words.shape[1]):
+            table = engine.get_alias_table(reel_idx)
+            reduced_table = None
+            if UNIQUE_REEL_SYMBOL in table.symbols:
+                reduced_table = engine.get_alias_table(reel_idx, None, frozenset((UNIQUE_REEL_SYMBOL,)))
+            seen = np.zeros(words.shape[0], dtype=bool)
+            for row in range(words.shape[2]):
+                cells = self._draw_symbols(table, words[:, reel_idx, row])
+                if reduced_table is not None:
+                    # Spins that already have a 10 on this reel map the word without it
+                    cells = np.where(seen, self._draw_symbols(reduced_table, words[:, reel_idx, row]), cells)
+                    seen |= cells == UNIQUE_REEL_SYMBOL
+                grids[:, reel_idx, row] = cells
+        return grids
+
+    def run(self, num_spins: int):
+        """Play ``num_spins`` more spins of every variant."""
+        config = self.engines[0].config
+        remaining = num_spins
+        while remaining > 0:
+            size = min(self.chunk_size, remaining)
+            words = self.rng.raw_batch(size * config.columns * config.rows).reshape(size, config.columns,
+                                                                                   config.rows)
+            returns = [None] * len(self.variants)
+            for indices in self.weight_groups.values():
+                grids = self.generate_grids(self.engines[indices[0]], words)
+                for index in indices:
+                    engine = self.engines[index]
+                    returns[index] = engine.get_payline_evaluator().evaluate(grids, self.bet_amount) / self.bet_amount
+            for index, variant_returns in enumerate(returns):
+                add_returns(self.return_moments[index], variant_returns)
+                add_returns(self.difference_moments[index], variant_returns - returns[0])
+            self.spins += size
+            remaining -= size
+
+    def results(self, confidence: float = DEFAULT_CONFIDENCE) -> dict:
+        """
+        RTP of every variant and its difference from the base game's, in
+        percentage points, with normal ``confidence`` intervals of the
+        difference. ``variance_reduction`` is how many times more spins two
+        independent runs would need for the same precision of the difference.
+        """
+        z = z_value(confidence)
+        base = self.return_moments[0]
+        variants = []
+        for overrides, moments, differences in zip(self.variants, self.return_moments, self.difference_moments):
+            count = differences["count"]
+            rtp_error = 100 * math.sqrt(moments_variance(moments) / count) if count > 1 else None
+            difference_error = 100 * math.sqrt(moments_variance(differences) / count) if count > 1 else None
+            difference = 100 * differences["mean"]
+            unpaired = moments_variance(moments) + moments_variance(base)
+            variants.append({
+                "overrides": overrides,
+                "rtp": 100 * moments["mean"],
+                "rtp_standard_error": rtp_error,
+                "difference": difference,
+                "difference_standard_error": difference_error,
+                "difference_interval": [difference - z * difference_error, difference + z * difference_error]
+                if difference_error is not None else None,
+                "variance_reduction": unpaired / moments_variance(differences) if moments_variance(differences) > 0
+                else None,
+            })
+        return {
+            "seed": self.seed,
+            "spins": self.spins,
+            "confidence": confidence,
+            "weight_groups": len(self.weight_groups),
+            "variants": variants,
+        }
+
+
+def run_sweep_task(params: dict, variants: List[dict], num_spins: int,
+                   confidence: float = DEFAULT_CONFIDENCE) -> dict:
+    """Play ``num_spins`` spins of every variant in a pool worker and return the sweep's ``results``."""
+    sweep = ParameterSweep(params, variants, seed=params.get("seed"))
+    sweep.run(num_spins)
+    return sweep.results(confidence)
@@ -0,0 +1,195 @@
+# maths_engine/payline_evaluator.py
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Line bet divisor used by SlotMachineEngine.check_payline (bet split over 20 lines).
+LINE_BET_DIVISOR = 20
+
+# Largest line-outcome table built; bigger games fall back to matching lines directly.
+MAX_LINE_TABLE_SIZE = 5_000_000
+
+# Line-outcome tables kept for sharing between the engines and simulations of the process
+MAX_CACHED_LINE_TABLES = 16
+
+# Most recently used line-outcome tables, keyed by (paytable multipliers, wild
+# symbol, scatter symbol, symbols, line length); paytables come from requests,
+# so the cache is bounded. Evaluators keep their own table once built.
+_LINE_TABLE_CACHE = OrderedDict()
+_LINE_TABLE_LOCK = threading.Lock()
+
+
+class LineOutcomeTable:
+    """
+    Outcome of every possible payline tuple.
+
+    A line is encoded as a base ``symbols + 1`` integer (first position most
+    significant; digit 0 is the empty symbol), and the table maps each code to
+    the paying symbol, match length and paytable multiplier.
+    """
+
+    def __init__(self, evaluator: "PaylineEvaluator"):
+        self.base = evaluator.symbols + 1
+        self.line_length = evaluator.line_length
+        self.symbols = evaluator.symbols
+        self.powers = self.base ** np.arange(self.line_length - 1, -1, -1, dtype=np.int64)
+
+        codes = np.arange(self.base ** self.line_length, dtype=np.int64)
+        lines = (codes[:, None] // self.powers) % self.base
+        symbol, length = evaluator.match(lines)
+        self.symbol = symbol.astype(np.uint8)
+        self.length = length.astype(np.uint8)
+        self.multiplier = evaluator.multipliers[symbol, length]
+        # Plain list for the per-line lookups of the single-spin path
+        self.length_list = self.length.tolist()
+
+    def encode(self, lines: np.ndarray) -> np.ndarray:
+        """Codes of ``lines``, with the payline positions on the last axis."""
+        # Horner's rule in int32 (codes stay below MAX_LINE_TABLE_SIZE); an int64 matmul has no BLAS path
+        codes = lines[..., 0].astype(np.int32)
+        for position in range(1, self.line_length):
+            codes *= self.base
+            codes += lines[..., position]
+        return codes
+
+    def encode_line(self, line: list):
+        """Code of a single line, or None when it cannot be encoded."""
+        if len(line) != self.line_length:
+            return None
+        code = 0
+        for symbol in line:
+            if not (isinstance(symbol, int) and 0 < symbol <= self.symbols):
+                return None
+            code = code * self.base + symbol
+        return code
+
+
+def get_line_outcome_table(evaluator: "PaylineEvaluator"):
+    """Shared outcome table for ``evaluator``'s rules, or None when it would be too large."""
+    if (evaluator.symbols + 1) ** evaluator.line_length > MAX_LINE_TABLE_SIZE:
+        return None
+    key = (evaluator.multipliers.tobytes(), evaluator.wild_symbol, evaluator.scatter_symbol,
+           evaluator.symbols, evaluator.line_length)
+    with _LINE_TABLE_LOCK:
+        table = _LINE_TABLE_CACHE.get(key)
+        if table is not None:
+            _LINE_TABLE_CACHE.move_to_end(key)
+            return table
+    table = LineOutcomeTable(evaluator)
+    with _LINE_TABLE_LOCK:
+        _LINE_TABLE_CACHE[key] = table
+        _LINE_TABLE_CACHE.move_to_end(key)
+        while len(_LINE_TABLE_CACHE) > MAX_CACHED_LINE_TABLES:
+            _LINE_TABLE_CACHE.popitem(last=False)
+    return table
+
+
+class PaylineEvaluator:
+    """
+    Evaluate every payline of a batch of grids at once.
+
+    Paylines are compiled once into index arrays, line symbols for a whole
+    ``(n, columns, rows)`` batch are gathered with fancy indexing, and each
+    line is looked up in the shared ``LineOutcomeTable``. ``match`` holds the
+    rules of ``SlotMachineEngine.check_wins`` as array operations:
+
+    - lines made only of wilds or only of scatters never pay,
+    - a line holding both a wild and a scatter is void when it starts with
+      the scatter (scatter interference),
+    - the paying symbol is the first non-wild symbol and the match runs while
+      every symbol is that symbol or a wild; 3 or more matches pay.
+    """
+
+    def __init__(self, paylines: List[list], paytable: Dict[int, dict], wild_symbol: int,
+                 scatter_symbol: Optional[int], columns: int, rows: int, symbols: int):
+        if not paylines:
+            raise ValueError("At least one payline is required.")
+        line_length = len(paylines[0])
+        for line_index, line in enumerate(paylines):
+            if len(line) != line_length:
+                raise ValueError(f"Payline {line_index + 1} has {len(line)} positions, expected {line_length}")
+            for col, row in line:
+                if not (0 <= col < columns and 0 <= row < rows):
+                    raise ValueError(f"Payline {line_index + 1} position {(col, row)} is outside the "
+                                     f"{columns}x{rows} grid")
+
+        self.line_count = len(paylines)
+        self.line_length = line_length
+        self.wild_symbol = wild_symbol
+        # Symbol 0 never lands on a reel, so it stands in for "no scatter".
+        self.scatter_symbol = scatter_symbol or 0
+        self.symbols = symbols
+        self.column_index = np.array([[col for col, _ in line] for line in paylines], dtype=np.intp)
+        self.row_index = np.array([[row for _, row in line] for line in paylines], dtype=np.intp)
+
+        # multipliers[symbol, length] -> paytable value, 0 where nothing pays
+        self.multipliers = np.zeros((symbols + 1, line_length + 1), dtype=np.float64)
+        for symbol, payouts in paytable.items():
+            for length, multiplier in payouts.items():
+                if 0 < symbol <= symbols and 3 <= length <= line_length:
+                    self.multipliers[symbol, length] = multiplier
+        self.outcome_table = get_line_outcome_table(self)
+
+    def line_symbols(self, grids: np.ndarray) -> np.ndarray:
+        """Gather ``(n, lines, line_length)`` payline symbols from ``(n, columns, rows)`` grids."""
+        return grids[:, self.column_index, self.row_index]
+
+    def match(self, lines: np.ndarray):
+        """
+        Paying symbol and match length of every line.
+
+        Args:
+            lines (np.ndarray): Symbols with the payline positions on the last axis.
+        Returns:
+            tuple: ``(symbol, length)`` arrays shaped like ``lines[..., 0]``;
+            ``length`` is 0 where the line does not win.
+        """
+        wild = lines == self.wild_symbol
+        scatter = lines == self.scatter_symbol
+        non_wild = ~wild
+
+        first_non_wild = non_wild.argmax(axis=-1)
+        symbol = np.take_along_axis(lines, first_non_wild[..., None], axis=-1)[..., 0]
+        matching = wild | (lines == symbol[..., None])
+        matched = np.cumprod(matching, axis=-1, dtype=np.int8).sum(axis=-1)
+
+        # check_wins records the win at positions 3, 4 and 5; a 5+ match keeps the whole line.
+        length = np.where(matched >= 5, self.line_length, matched)
+        void = (
+            ~non_wild.any(axis=-1)
+            | scatter.all(axis=-1)
+            | (wild.any(axis=-1) & scatter.any(axis=-1) & scatter[..., 0])
+            | (length < 3)
+        )
+        length = np.where(void, 0, length)
+        return symbol, length
+
+    def evaluate(self, grids: np.ndarray, bet_amount: float, per_line: bool = False):
+        """
+        Payouts for a batch of grids.
+
+        Args:
+            grids (np.ndarray): ``(n, columns, rows)`` symbols, as from ``generate_grids``.
+            bet_amount (float): Total bet per spin.
+            per_line (bool): Also return the per-line win arrays.
+        Returns:
+            np.ndarray | tuple: ``(n,)`` spin payouts, or ``(payouts, line_wins)``
+            where ``line_wins`` holds ``(n, lines)`` ``symbol``, ``length`` and
+            ``payout`` arrays.
+        """
+        lines = self.line_symbols(grids)
+        if self.outcome_table is not None:
+            codes = self.outcome_table.encode(lines)
+            line_payouts = self.outcome_table.multiplier[codes] * (bet_amount / LINE_BET_DIVISOR)
+            if per_line:
+                symbol = self.outcome_table.symbol[codes]
+                length = self.outcome_table.length[codes]
+        else:
+            symbol, length = self.match(lines)
+            line_payouts = self.multipliers[symbol, length] * (bet_amount / LINE_BET_DIVISOR)
+        payouts = line_payouts.sum(axis=1)
+        if not per_line:
+            return payouts
+        return payouts, {"symbol": symbol, "length": length, "payout": line_payouts}
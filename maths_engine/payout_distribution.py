@@ -0,0 +1,312 @@
+# maths_engine/payout_distribution.py
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from maths_engine.exact_rtp import ExactRtpCalculator
+from maths_engine.payline_evaluator import LINE_BET_DIVISOR
+from maths_engine.slot_machine_engine import UNIQUE_REEL_SYMBOL
+
+# Line multipliers are summed as integers in these units, so equal spin payouts merge exactly.
+PAYOUT_UNITS = 10 ** 6
+
+# Most states expanded at once; bigger frontiers are split and solved block by block.
+DEFAULT_BLOCK_SIZE = 200_000
+
+# Win sizes, in multiples of the total bet, reported by PayoutDistribution.summary.
+DEFAULT_WIN_THRESHOLDS = (1, 2, 5, 10, 20, 50, 100)
+
+# z-score of the volatility index (90% confidence).
+VOLATILITY_Z = 1.645
+
+_HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+_HASH_SHIFT = np.uint64(29)
+
+
+def _mix(key: np.ndarray) -> np.ndarray:
+    key = key * _HASH_MULTIPLIER
+    return key ^ (key >> _HASH_SHIFT)
+
+
+class PayoutDistribution:
+    """
+    Probability of every distinct spin payout, in multiples of the total bet.
+    """
+
+    def __init__(self, multipliers: np.ndarray, probabilities: np.ndarray):
+        order = np.argsort(multipliers)
+        self.multipliers = np.asarray(multipliers, dtype=np.float64)[order]
+        self.probabilities = np.asarray(probabilities, dtype=np.float64)[order]
+
+    def mean(self) -> float:
+        return float(self.multipliers @ self.probabilities)
+
+    def variance(self) -> float:
+        return float(((self.multipliers - self.mean()) ** 2) @ self.probabilities)
+
+    def standard_deviation(self) -> float:
+        return self.variance() ** 0.5
+
+    def volatility_index(self, z: float = VOLATILITY_Z) -> float:
+        return z * self.standard_deviation()
+
+    def hit_frequency(self) -> float:
+        """Percentage of spins that win anything."""
+        return float(self.probabilities[self.multipliers > 0].sum()) * 100
+
+    def probability_at_least(self, multiple: float) -> float:
+        """P(spin payout >= ``multiple`` x total bet)."""
+        return float(self.probabilities[self.multipliers >= multiple].sum())
+
+    def percentile(self, q: float) -> float:
+        """Smallest payout multiple with at least ``q`` percent of the spins at or below it."""
+        cumulative = np.cumsum(self.probabilities)
+        index = np.searchsorted(cumulative, q / 100 * cumulative[-1] - 1e-15)
+        return float(self.multipliers[min(index, len(self.multipliers) - 1)])
+
+    def summary(self, thresholds: Sequence[float] = DEFAULT_WIN_THRESHOLDS) -> dict:
+        return {
+            "rtp": self.mean() * 100,
+            "hit_frequency": self.hit_frequency(),
+            "variance": self.variance(),
+            "standard_deviation": self.standard_deviation(),
+            "volatility_index": self.volatility_index(),
+            "win_probabilities": {threshold: self.probability_at_least(threshold) for threshold in thresholds},
+            "histogram": [
+                {"multiplier": float(multiplier), "probability": float(probability)}
+                for multiplier, probability in zip(self.multipliers, self.probabilities)
+            ],
+        }
+
+
+class PayoutDistributionCalculator:
+    """
+    Exact base-game distribution of the total spin payout.
+
+    Unlike the RTP, the distribution depends on how paylines share cells, so
+    the grid is walked cell by cell, reel by reel, keeping the joint state of
+    every payline. A payline's state is its prefix class in the shared
+    ``LineOutcomeTable``: prefixes paying the same for every completion (the
+    paying symbol and match so far) share a class, so wild and scatter rules
+    are exactly those of ``check_wins``. Once a line's payout is settled it
+    is added to the state's accumulated payout and the line drops to class 0.
+
+    Identical states are merged after every cell, and lines left with the same
+    unvisited cells are interchangeable, so their classes are kept sorted.
+    """
+
+    def __init__(self, engine, scatter_symbol: Optional[int] = None, icon: Optional[int] = None,
+                 blocked_reels: Optional[List[int]] = None, block_size: int = DEFAULT_BLOCK_SIZE):
+        self.rtp_calculator = ExactRtpCalculator(engine, scatter_symbol, icon, blocked_reels)
+        self.config = engine.config
+        self.evaluator = self.rtp_calculator.evaluator
+        self.block_size = block_size
+        if self.evaluator.line_length != self.config.columns or (
+                self.evaluator.column_index != np.arange(self.config.columns)).any():
+            raise ValueError("Every payline must visit the reels left to right, one position per reel.")
+
+        self.line_count = self.evaluator.line_count
+        # Pad states to whole 64-bit words for hashing
+        self.state_width = -(-self.line_count // 8) * 8
+        self.cells = [(reel_idx, row) for reel_idx in range(self.config.columns)
+                      for row in range(self.config.rows)]
+        self._build_line_classes()
+        self.cell_probabilities = [self._cell_probabilities(reel_idx) for reel_idx in range(self.config.columns)]
+        self._interchangeable = [self._interchangeable_lines(cell) for cell in self.cells]
+
+    def _build_line_classes(self):
+        table = self.evaluator.outcome_table
+        base, length = table.base, table.line_length
+        classes = [np.zeros(1, dtype=np.int64)]
+        settled = [np.zeros(1, dtype=np.int64)]
+        for prefix_length in range(1, length + 1):
+            completions = table.multiplier.reshape(base ** prefix_length, base ** (length - prefix_length))
+            unique, inverse = np.unique(completions, axis=0, return_inverse=True)
+            inverse = inverse.ravel()
+            fixed = (unique == unique[:, :1]).all(axis=1)
+            ids = np.zeros(len(unique), dtype=np.int64)
+            ids[~fixed] = np.arange(1, np.count_nonzero(~fixed) + 1)
+            classes.append(ids[inverse])
+            settled.append(np.where(fixed[inverse], np.rint(unique[inverse, 0] * PAYOUT_UNITS), 0).astype(np.int64))
+        if max(int(ids.max()) for ids in classes) > np.iinfo(np.int8).max:
+            raise ValueError("Paytable has too many payline states for an exact distribution.")
+
+        # transitions[reel][class, symbol] -> class after the reel, settled_values the payout it settles
+        self.transitions, self.settled_values, self._ordinary = [], [], []
+        for prefix_length in range(length):
+            ids = classes[prefix_length]
+            representative = np.zeros(int(ids.max()) + 1, dtype=np.int64)
+            representative[ids[::-1]] = np.arange(len(ids) - 1, -1, -1)
+            extended = representative[:, None] * base + np.arange(base)
+            transition = classes[prefix_length + 1][extended]
+            value = settled[prefix_length + 1][extended]
+            if prefix_length:
+                # Class 0 of a non-empty prefix is already settled.
+                transition[0] = 0
+                value[0] = 0
+
+            # Symbols giving a class its most common outcome; any of them can stand for the rest.
+            ordinary = np.zeros(transition.shape, dtype=bool)
+            for state in range(len(transition)):
+                outcomes = list(zip(transition[state].tolist(), value[state].tolist()))
+                common = max(set(outcomes), key=outcomes.count)
+                ordinary[state] = [outcome == common for outcome in outcomes]
+
+            self.transitions.append(transition.astype(np.int8))
+            self.settled_values.append(value)
+            self._ordinary.append(ordinary)
+
+    def _cell_probabilities(self, reel_idx: int) -> np.ndarray:
+        """``(2, symbols + 1)`` cell probabilities before and after symbol 10 is on the column."""
+        full, reduced = self.rtp_calculator.symbol_probabilities(reel_idx)
+        probabilities = np.zeros((2, self.config.symbols + 1))
+        for symbol, probability in full.items():
+            probabilities[:, symbol] = probability
+        if reduced is not None:
+            probabilities[1] = 0
+            for symbol, probability in reduced.items():
+                probabilities[1, symbol] = probability
+        return probabilities
+
+    def _interchangeable_lines(self, cell) -> List[List[int]]:
+        reel_idx, row = cell
+        row_index = self.evaluator.row_index
+        groups = {}
+        for line in range(self.line_count):
+            pending_row = row_index[line, reel_idx] if row_index[line, reel_idx] > row else -1
+            key = (pending_row,) + tuple(row_index[line, reel_idx + 1:].tolist())
+            groups.setdefault(key, []).append(line)
+        return [lines for lines in groups.values() if len(lines) > 1]
+
+    def _step(self, state, cell_index):
+        codes, flags, payouts, probabilities = state
+        reel_idx, row = self.cells[cell_index]
+        cell_probabilities = self.cell_probabilities[reel_idx]
+        transition = self.transitions[reel_idx]
+        value = self.settled_values[reel_idx]
+        on_cell = np.flatnonzero(self.evaluator.row_index[:, reel_idx] == row)
+        below = np.flatnonzero(self.evaluator.row_index[:, reel_idx] > row)
+
+        if reel_idx == 0:
+            active = np.ones(len(probabilities), dtype=bool)
+            active_below = np.full(len(probabilities), len(below) > 0)
+        else:
+            active = codes[:, on_cell].any(axis=1)
+            active_below = codes[:, below].any(axis=1)
+
+        # No open line on this cell: only whether symbol 10 lands here can still matter.
+        waiting = ~active & active_below
+        parts = [tuple(part[~active & ~active_below] for part in state)]
+        if waiting.any():
+            codes_w, flags_w, payouts_w, probabilities_w = (part[waiting] for part in state)
+            unique_probability = cell_probabilities[flags_w, UNIQUE_REEL_SYMBOL]
+            parts.append((codes_w, flags_w, payouts_w, probabilities_w * (1 - unique_probability)))
+            drawn = unique_probability > 0
+            parts.append((codes_w[drawn], np.ones(np.count_nonzero(drawn), dtype=np.uint8),
+                          payouts_w[drawn], probabilities_w[drawn] * unique_probability[drawn]))
+
+        codes_a, flags_a, payouts_a, probabilities_a = (part[active] for part in state)
+        current = codes_a[:, on_cell].astype(np.intp)
+        lumped = self._ordinary[reel_idx][current].all(axis=1)
+        lumped[active_below[active], UNIQUE_REEL_SYMBOL] = False
+        symbol_probabilities = cell_probabilities[flags_a]
+
+        for symbol in np.flatnonzero(cell_probabilities.max(axis=0) > 0):
+            keep = (symbol_probabilities[:, symbol] > 0) & ~lumped[:, symbol]
+            if not keep.any():
+                continue
+            new_codes = codes_a[keep]
+            new_codes[:, on_cell] = transition[current[keep], symbol]
+            parts.append((
+                new_codes,
+                flags_a[keep] | (symbol == UNIQUE_REEL_SYMBOL),
+                payouts_a[keep] + value[current[keep], symbol].sum(axis=1),
+                probabilities_a[keep] * symbol_probabilities[keep, symbol],
+            ))
+
+        lumped_probability = (symbol_probabilities * lumped).sum(axis=1)
+        keep = lumped_probability > 0
+        if keep.any():
+            symbol = lumped[keep].argmax(axis=1)[:, None]
+            new_codes = codes_a[keep]
+            new_codes[:, on_cell] = transition[current[keep], symbol]
+            parts.append((new_codes, flags_a[keep],
+                          payouts_a[keep] + value[current[keep], symbol].sum(axis=1),
+                          probabilities_a[keep] * lumped_probability[keep]))
+
+        codes, flags, payouts, probabilities = (np.concatenate(column) for column in zip(*parts))
+        if row == self.config.rows - 1:
+            flags[:] = 0
+        for lines in self._interchangeable[cell_index]:
+            codes[:, lines] = np.sort(codes[:, lines], axis=1)
+        return self._merge(codes, flags, payouts, probabilities)
+
+    @staticmethod
+    def _merge(codes, flags, payouts, probabilities):
+        """Sum the probabilities of identical states."""
+        words = codes.view(np.uint64)
+        key = payouts.astype(np.uint64) * np.uint64(2) + flags
+        for column in words.T:
+            key = _mix(key) ^ column
+        key = _mix(key)
+
+        order = np.argsort(key)
+        sorted_key = key[order]
+        first = np.empty(len(key), dtype=bool)
+        first[:1] = True
+        np.not_equal(sorted_key[1:], sorted_key[:-1], out=first[1:])
+        group = np.empty(len(key), dtype=np.intp)
+        group[order] = np.cumsum(first) - 1
+        index = order[first]
+
+        # A hash collision would merge different states; check and fall back to comparing bytes.
+        representative = index[group]
+        if not ((words[representative] == words).all() and (payouts[representative] == payouts).all()
+                and (flags[representative] == flags).all()):
+            rows = np.concatenate([codes.view(np.uint8), flags[:, None], payouts.view(np.uint8).reshape(-1, 8)],
+                                  axis=1)
+            rows = np.ascontiguousarray(rows).view(np.dtype((np.void, rows.shape[1]))).ravel()
+            _, index, group = np.unique(rows, return_index=True, return_inverse=True)
+            group = group.ravel()
+
+        return codes[index], flags[index], payouts[index], np.bincount(group, weights=probabilities)
+
+    def _solve(self, state, cell_index: int, settled: list):
+        while cell_index < len(self.cells):
+            if cell_index >= self.config.rows:
+                done = ~state[0].any(axis=1)
+                if done.any():
+                    settled.append((state[2][done], state[3][done]))
+                    state = tuple(part[~done] for part in state)
+            count = len(state[3])
+            if count > self.block_size:
+                for start in range(0, count, self.block_size):
+                    self._solve(tuple(part[start:start + self.block_size] for part in state), cell_index, settled)
+                return
+            state = self._step(state, cell_index)
+            cell_index += 1
+        settled.append((state[2], state[3]))
+
+    def calculate(self) -> PayoutDistribution:
+        """
+        calculate - Exact distribution of the base-game spin payout.
+
+        Returns:
+            PayoutDistribution: Every distinct payout, as a multiple of the total
+            bet, with its probability.
+        """
+        state = (
+            np.zeros((1, self.state_width), dtype=np.int8),
+            np.zeros(1, dtype=np.uint8),
+            np.zeros(1, dtype=np.int64),
+            np.ones(1),
+        )
+        settled = []
+        self._solve(state, 0, settled)
+        payouts = np.concatenate([payout for payout, _ in settled])
+        probabilities = np.concatenate([probability for _, probability in settled])
+        values, group = np.unique(payouts, return_inverse=True)
+        return PayoutDistribution(
+            values / PAYOUT_UNITS / LINE_BET_DIVISOR,
+            np.bincount(group.ravel(), weights=probabilities),
+        )
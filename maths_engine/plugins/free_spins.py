@@ -23,13 +23,18 @@ class FreeSpinsPlugin(BasePlugin):
         self.free_spins_multiplier = multiplier
         self.blocked_reels = blocked_reels
         self.state_manager.set("current_free_spins", 0)
+        # Icon positions of the current spin; run-wide figures are counters
         self.state_manager.set("free_spins_lines", [])
+        self.state_manager.set("free_spins_icon_counts", {})  # icons landed -> spins
+        self.state_manager.set("free_spins_triggers", 0)
+        self.state_manager.set("free_spins_retriggers", 0)
+        self.state_manager.set("free_spins_played", 0)
         self.state_manager.set("free_spins_multiplier", multiplier)
         self.state_manager.set("total_free_spins_won",
                                0)  # Initialize total_free_spins_won
         # Store original reel weights to reset after free spins
         self.original_reel_weights = {
-            reel_idx: config.get_reel_weights(reel_idx)
+            reel_idx: config.get_reel_weights(reel_idx, resolution=config.weight_resolution)
             for reel_idx in range(config.columns)
         }
 
@@ -57,6 +62,8 @@ class FreeSpinsPlugin(BasePlugin):
             total_bets = self.state_manager.get("total_bets") - bet_amount  # Remove bet amount from total bets
             self.state_manager.set("total_bets", total_bets)
 
+            self.state_manager.set("free_spins_played", self.state_manager.get("free_spins_played") + 1)
+
             # Decrement the free spins if in free spin mode
             current_free_spins = self.state_manager.get("current_free_spins")
             if current_free_spins > 0:
@@ -90,30 +97,38 @@ class FreeSpinsPlugin(BasePlugin):
                     # break  # Only count one free spins symbol per reel
 
         self.state_manager.set("free_spins_count", free_spins_count)
+        icon_counts = self.state_manager.get("free_spins_icon_counts")
+        icon_counts[free_spins_count] = icon_counts.get(free_spins_count, 0) + 1
 
         # Calculate the number of free spins to award
-        won = 0
         is_free_spin = self.state_manager.get("is_free_spin")
-        # Check if the spin is already a free spin to prevent re-triggering
-        if is_free_spin:
-            if free_spins_count >= 3:
-                won = 10
-            if free_spins_count == 1:
-                won = 2
-            if free_spins_count == 2:
-                won = 4
-        elif not is_free_spin:
-            if free_spins_count >= 3:  # Assuming 3 symbols trigger free spins
-                won = 10  # Example: Award 10 free spins
+        won = self.free_spins_awarded(free_spins_count, is_free_spin)
+        if won:
+            counter = "free_spins_retriggers" if is_free_spin else "free_spins_triggers"
+            self.state_manager.set(counter, self.state_manager.get(counter) + 1)
 
         # Update total and current free spins count
         self.state_manager.set("total_free_spins_won", self.state_manager.get("total_free_spins_won", 0) + won)  # FIXME: reespin number counter
         self.state_manager.set("current_free_spins", self.state_manager.get("current_free_spins", 0) + won)
 
         # Store the lines that triggered free spins
-        free_spins_lines = self.state_manager.get("free_spins_lines")
-        free_spins_lines.append(curr_free_spins_lines)
-        self.state_manager.set("free_spins_lines", free_spins_lines)
+        self.state_manager.set("free_spins_lines", curr_free_spins_lines)
+
+    @staticmethod
+    def free_spins_awarded(free_spins_count: int, is_free_spin: bool) -> int:
+        """Free spins won for ``free_spins_count`` icons on the non-blocked reels."""
+        # Check if the spin is already a free spin to prevent re-triggering
+        if is_free_spin:
+            if free_spins_count >= 3:
+                return 10
+            if free_spins_count == 1:
+                return 2
+            if free_spins_count == 2:
+                return 4
+            return 0
+        if free_spins_count >= 3:  # Assuming 3 symbols trigger free spins
+            return 10  # Example: Award 10 free spins
+        return 0
 
     def _adjust_reel_weights_for_free_spins(self):
         """Adjust the weights of symbols on the reels to modify the chances of the free spins symbol appearing."""
@@ -163,7 +178,12 @@ class FreeSpinsPlugin(BasePlugin):
         return {
             "total_free_spins_won": self.state_manager.get("total_free_spins_won", 0),
             "current_free_spins": self.state_manager.get("current_free_spins", 0),
-            "free_spins_detail": self.state_manager.get("free_spins_lines", 0)
+            "free_spins_triggers": self.state_manager.get("free_spins_triggers", 0),
+            "free_spins_retriggers": self.state_manager.get("free_spins_retriggers", 0),
+            "free_spins_played": self.state_manager.get("free_spins_played", 0),
+            "free_spins_icon_counts": dict(sorted(self.state_manager.get("free_spins_icon_counts", {}).items())),
+            # Same shape as before (one list per spin), holding the last spin only
+            "free_spins_detail": [self.state_manager.get("free_spins_lines", [])],
         }
 
 
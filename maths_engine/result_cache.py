@@ -0,0 +1,152 @@
+# maths_engine/result_cache.py
+import copy
+import hashlib
+import json
+import logging
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+from maths_engine.detail_capture import DETAIL_STORAGE_DIR
+
+logger = logging.getLogger(__name__)
+
+RESULT_CACHE_DIR = os.path.join(DETAIL_STORAGE_DIR, "simulation_cache")
+# Runs stored for extension, kept as checkpoints (a fast run's is a few MB)
+RUN_STORE_DIR = os.path.join(DETAIL_STORAGE_DIR, "simulation_runs")
+RUN_STORE_MEMORY_ENTRIES = 8
+RUN_STORE_DISK_ENTRIES = 100
+# Bump when an engine change alters the results of existing keys
+RESULT_CACHE_VERSION = 3
+DEFAULT_MEMORY_ENTRIES = 256
+DEFAULT_DISK_ENTRIES = 10_000
+
+
+def canonical_configuration(config) -> dict:
+    """
+    What a ``Configuration`` makes the engine do: its integer weight table,
+    paytable and paylines rather than the formulas they came from, plus the
+    sticky and cascading options.
+    """
+    return {
+        "rows": config.rows,
+        "columns": config.columns,
+        "symbols": config.symbols,
+        "wild_symbol": config.wild_symbol,
+        "symbol_weights": config.get_symbol_weights(resolution=config.weight_resolution),
+        "paytable": config.get_paytable(),
+        "paylines": config.get_paylines(),
+        "sticky_options": getattr(config, "sticky_options", None),
+        "cascading_reels": config.cascading_reels,
+    }
+
+
+def canonical_key(payload: dict) -> str:
+    """SHA-256 of ``payload`` as sorted, compact JSON, so equal payloads give equal keys."""
+    material = json.dumps({"version": RESULT_CACHE_VERSION, **payload}, sort_keys=True,
+                          separators=(",", ":"), default=str)
+    return hashlib.sha256(material.encode()).hexdigest()
+
+
+class ResultCache:
+    """
+    Simulation results by content key: an LRU memory tier of
+    ``memory_entries`` values in front of a pickle file per key in
+    ``directory``, which keeps its ``disk_entries`` most recently written
+    files. Values are copied in and out, so callers may change what they get.
+    A ``directory`` of None keeps the memory tier only.
+    """
+
+    def __init__(self, memory_entries: int = DEFAULT_MEMORY_ENTRIES, directory: Optional[str] = RESULT_CACHE_DIR,
+                 disk_entries: int = DEFAULT_DISK_ENTRIES):
+        if memory_entries < 1 or disk_entries < 1:
+            raise ValueError(f"Cache sizes must be positive, got {memory_entries} and {disk_entries}")
+        self.memory_entries = memory_entries
+        self.directory = directory
+        self.disk_entries = disk_entries
+        self.memory = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # Pool futures store their results from the executor's thread
+        self.lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    def get(self, key: str) -> Optional[Any]:
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                return copy.deepcopy(self.memory[key])
+        value = self._read(key)
+        with self.lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._remember(key, value)
+        return copy.deepcopy(value)
+
+    def put(self, key: str, value: Any):
+        value = copy.deepcopy(value)
+        with self.lock:
+            self._remember(key, value)
+        self._write(key, value)
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+        if self.directory and os.path.isdir(self.directory):
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(".pkl"):
+                    os.remove(entry.path)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "memory_entries": len(self.memory)}
+
+    def _remember(self, key: str, value: Any):
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def _read(self, key: str) -> Optional[Any]:
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(key), "rb") as cached:
+                return pickle.load(cached)
+        except FileNotFoundError:
+            return None
+        except (OSError, pickle.UnpicklingError, EOFError) as e:
+            logger.warning(f"Ignoring unreadable cache entry {key}: {e}")
+            return None
+
+    def _write(self, key: str, value: Any):
+        if not self.directory:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # Write then rename, so readers never see a partial entry
+            handle, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(handle, "wb") as cached:
+                pickle.dump(value, cached, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary, self._path(key))
+            self._prune()
+        except OSError as e:
+            logger.warning(f"Could not write cache entry {key}: {e}")
+
+    def _prune(self):
+        entries = [entry for entry in os.scandir(self.directory) if entry.name.endswith(".pkl")]
+        if len(entries) <= self.disk_entries:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime_ns)
+        for entry in entries[:len(entries) - self.disk_entries]:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
@@ -1,21 +1,58 @@
 # simulation.py
 # DO NOT DELETE THIS!!!
 
+import asyncio
+import copy
 import logging
 import os
+import random
 import sys
 import traceback
 from concurrent.futures import ProcessPoolExecutor
 
 from maths_engine.configuration import Configuration
+from maths_engine.detail_capture import DetailCapture
+from maths_engine.exact_rtp import ExactRtpCalculator
 from maths_engine.plugin_manager import PluginManager
+from maths_engine.simulation_kernel import SimulationKernel
 from maths_engine.slot_machine_engine import SlotMachineEngine
+from maths_engine.spin_statistics import (DEFAULT_CONFIDENCE, add_return, close_round, control_variate_estimate,
+                                          new_control_moments, new_moments, new_round, replicate_rtp_half_width,
+                                          return_bucket, return_statistics, rtp_half_width, with_open_round,
+                                          z_value)
 from maths_engine.state_manager import StateManager
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 logger = logging.getLogger(__name__)
 
+CHECKPOINT_VERSION = 1
+# Win, in multiples of the bet, from which single_spin reports a big win
+BIG_WIN_MULTIPLIER = 1000
+# Spins between two precision checks of a run with a target half-width
+PRECISION_CHECK_SPINS = 10_000
+FAST_PRECISION_CHECK_SPINS = 100_000
+# Fewest rounds, and winning spins, whose spread a run's RTP interval is trusted from
+MIN_PRECISION_ROUNDS = 1000
+MIN_PRECISION_WINS = 10
+# Most spins one request plays in the spin loop and with the batch kernel; longer runs are extended or run as jobs
+MAX_SIMULATION_SPINS = 1_200_000
+MAX_FAST_SIMULATION_SPINS = 50_000_000
+# State a resumed simulation takes from its own arguments rather than the checkpoint
+CHECKPOINT_EXCLUDED_STATE = ("config", "slot_machine_engine", "seed", "num_spins", "bet_amount", "demo_params",
+                             "pending_actions", "action_results")
+
+
+def _is_plain(value) -> bool:
+    """Whether a state value is plain data (numbers, strings and containers of them)."""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return True
+    if isinstance(value, (list, tuple)):
+        return all(_is_plain(item) for item in value)
+    if isinstance(value, dict):
+        return all(_is_plain(key) and _is_plain(item) for key, item in value.items())
+    return False
+
 
 class Simulation:
 
@@ -26,8 +63,58 @@ class Simulation:
                  capital,
                  plugins_with_params,
                  state_manager,
-                 demo_params=None):
+                 demo_params=None,
+                 seed=None,
+                 fast=False,
+                 detail_capture=None,
+                 target_half_width=None,
+                 confidence=DEFAULT_CONFIDENCE,
+                 check_every=None,
+                 control_variate=False,
+                 stratified_reels=0,
+                 big_win_multiplier=BIG_WIN_MULTIPLIER):
+        """
+        With a ``target_half_width`` (RTP percentage points), ``num_spins``
+        is a budget: the run stops at the first check, every ``check_every``
+        spins, where the ``confidence`` interval of its RTP is that narrow.
+
+        ``control_variate`` also estimates the RTP with the line returns as
+        a control: the expected line return of a grid drawn with the base
+        game (or free spin) weights is known exactly, so a spin's deviation
+        from it has mean zero, and so has a round's total deviation. Games
+        without plugins or with the free_spins plugin alone are supported,
+        where a spin's winnings are its line payouts.
+
+        ``stratified_reels`` (1 or 2, fast runs only) stratifies the base game
+        grids on the joint column outcomes of their first reels, drawn in
+        proportion to their exact probabilities (see ``ColumnStrata``); the
+        other reels are drawn as usual. Each grid still follows the game's
+        distribution, so every result is that of plain sampling. A full
+        batch is a stratified sample of its own, so without plugins the RTP
+        interval comes from the spread of the batches' mean returns; with
+        free spins, whose rounds span batches, it stays the per-round one.
+
+        ``single_spin`` flags wins of at least ``big_win_multiplier`` times
+        the bet as big wins; ``ImportanceSampler`` measures how often they
+        happen.
+        """
+        if target_half_width is not None and target_half_width <= 0:
+            raise ValueError(f"target_half_width must be positive, got {target_half_width}")
+        z_value(confidence)
+        if check_every is not None and check_every < 1:
+            raise ValueError(f"check_every must be positive, got {check_every}")
+        if not big_win_multiplier > 0:
+            raise ValueError(f"big_win_multiplier must be positive, got {big_win_multiplier}")
+        self.big_win_multiplier = big_win_multiplier
+        self.target_half_width = target_half_width
+        self.confidence = confidence
+        self.check_every = check_every or (FAST_PRECISION_CHECK_SPINS if fast else PRECISION_CHECK_SPINS)
         self.state_manager = state_manager
+        # Every run gets an explicit seed so it can be reproduced from the results.
+        if seed is None:
+            seed = random.getrandbits(64)
+        self.seed = seed
+        self.state_manager.set("seed", seed)
         self.state_manager.set("bet_amount", bet_amount)
         self.state_manager.set("num_spins", num_spins)
         self.state_manager.set("pending_actions",
@@ -39,7 +126,16 @@ class Simulation:
         self.state_manager.set("total_winnings", 0)
         self.state_manager.set("total_bets", 0)
         self.state_manager.set("hits", 0)
-        self.state_manager.set("detailed_results", [])
+        self.state_manager.set("sum_squared_winnings", 0.0)
+        # Streaming statistics of the per-spin return (winnings / bet): Welford moments and the
+        # win multiplier histogram, both of a fixed size and mergeable across runs
+        self.state_manager.set("return_moments", new_moments())
+        self.state_manager.set("return_histogram", {})
+        # Moments of the finished rounds' returns (a paid spin and its free spins) and the round in play
+        self.state_manager.set("round_moments", new_moments())
+        self.state_manager.set("open_round", new_round())
+        # Per-spin detail is opt-in; by default no record is built or kept
+        self.detail_capture = detail_capture if detail_capture is not None else DetailCapture()
         self.state_manager.set("errors", [])
         self.state_manager.set("multiplier", 1)
         self.state_manager.set("demo_params", demo_params)
@@ -52,27 +148,54 @@ class Simulation:
             config=config,
             plugin_manager=self.plugin_manager,
             state_manager=self.state_manager,
+            seed=seed,
         )
         # Store the engine in the state manager
         self.state_manager.set("slot_machine_engine", self.engine)
         self.state_manager.set("icon", 0)
         self.state_manager.set("blocked_reels", [])
+        # Exact expected line return of a grid, by whether it is drawn with the free spin weights
+        self.control_expectations = None
+        if control_variate:
+            free_spins = SimulationKernel.supported_plugin(self.plugin_manager.plugins, "The control variate")
+            if demo_params is not None:
+                raise ValueError("The control variate does not support demo_params.")
+            icon = self.state_manager.get("icon")
+            draws = {False: (icon, self.state_manager.get("blocked_reels"))}
+            if free_spins is not None:
+                draws[True] = (free_spins.free_spins_symbol, free_spins.blocked_reels)
+            self.control_expectations = {
+                free_weights: ExactRtpCalculator(self.engine, scatter_symbol=icon, icon=draw_icon,
+                                                 blocked_reels=draw_blocked_reels).calculate()["rtp"] / 100
+                for free_weights, (draw_icon, draw_blocked_reels) in draws.items()
+            }
+            self.state_manager.set("control_moments", new_control_moments())
+        self.stratified_reels = stratified_reels
+        if stratified_reels:
+            if not fast:
+                raise ValueError("Stratified sampling draws grids in batches and needs fast=True.")
+            if control_variate:
+                raise ValueError("Stratified sampling and the control variate cannot be combined.")
+        # Fast runs replace the per-spin loop with the batch kernel
+        self.kernel = SimulationKernel(self) if fast else None
+        if self.kernel is not None and self.kernel.strata is not None and self.kernel.free_spins is None:
+            # Moments of the full stratified batches' mean returns and the batch in play
+            self.state_manager.set("batch_moments", new_moments())
+            self.state_manager.set("open_batch", {"spins": 0, "value": 0.0})
 
     def run(self):
         try:
             num_spins = self.state_manager.get("num_spins")
-
-            for _ in range(num_spins):
-                capital = self.state_manager.get("capital")
-                bet_amount = self.state_manager.get("bet_amount")
-
-                if capital < bet_amount:
-                    break
-
-                spin_success = self._run_spin()
-                if not spin_success:
-                    # An error occurred during the spin, stop the simulation
-                    break
+            if self.target_half_width is None:
+                self._play(num_spins)
+            else:
+                played = 0
+                while played < num_spins:
+                    spins = min(self.check_every, num_spins - played)
+                    played += spins
+                    # Stop once the capital or an error ends the run early, or the RTP is precise enough
+                    if not self._play(spins) or self.target_met():
+                        break
 
             # Ensure the simulation results are stored
             rtp = self._get_rtp()
@@ -94,6 +217,7 @@ class Simulation:
             self.state_manager.set("errors", errors)
 
         finally:
+            self.detail_capture.close()
             user_id = self.state_manager.get("user_id")  # Assuming user_id is stored in state_manager
             self.plugin_manager.unload_plugins(user_id)
 
@@ -101,7 +225,93 @@ class Simulation:
 
 
     
+    def _play(self, num_spins) -> bool:
+        """Play up to ``num_spins`` more spins; False when the capital or an error stopped them early."""
+        spin_count = self.state_manager.get("spin_count")
+        if self.kernel is not None:
+            # The kernel plays every spin and syncs the state when it is done
+            self.kernel.run(num_spins)
+            return self.state_manager.get("spin_count") - spin_count == num_spins and \
+                not self.state_manager.get("errors")
+
+        for _ in range(num_spins):
+            capital = self.state_manager.get("capital")
+            bet_amount = self.state_manager.get("bet_amount")
+
+            if capital < bet_amount:
+                return False
+
+            spin_success = self._run_spin()
+            if not spin_success:
+                # An error occurred during the spin, stop the simulation
+                return False
+        return True
+
+    def rtp_half_width(self) -> float:
+        """
+        Half-width, in RTP percentage points, of the run's RTP confidence
+        interval so far; that of the control variate estimate when enabled.
+        """
+        if self.control_expectations is not None:
+            estimate = self.control_variate_estimate()
+            return float("inf") if estimate is None else z_value(self.confidence) * estimate["rtp_standard_error"]
+        batch_moments = self.state_manager.get("batch_moments")
+        if batch_moments is not None:
+            return replicate_rtp_half_width(batch_moments, self.confidence)
+        return rtp_half_width(self.round_moments(), self.state_manager.get("total_bets"),
+                              self.state_manager.get("bet_amount"), self.confidence)
+
+    def target_met(self) -> bool:
+        """
+        Whether the RTP interval is within the target half-width. A run with
+        fewer than ``MIN_PRECISION_ROUNDS`` rounds or ``MIN_PRECISION_WINS``
+        wins has not seen the game's spread yet (no wins at all looks like no
+        variance), so its interval never meets the target.
+        """
+        if self.round_moments()["count"] < MIN_PRECISION_ROUNDS or \
+                self.state_manager.get("hits") < MIN_PRECISION_WINS:
+            return False
+        return self.rtp_half_width() <= self.target_half_width
+
+    def control_variate_estimate(self):
+        """``control_variate_estimate`` of the run so far, None without the control variate."""
+        if self.control_expectations is None:
+            return None
+        return control_variate_estimate(self.round_moments(control=True),
+                                        self.state_manager.get("total_bets"), self.state_manager.get("bet_amount"))
+
+    def stratified_sampling_report(self) -> dict:
+        """
+        Strata of a stratified run and its RTP standard errors, in percentage
+        points: from the full batches (None with free spins or before two
+        batches) and from the rounds as if they were drawn independently.
+        """
+        z = z_value(self.confidence)
+        unstratified = rtp_half_width(self.round_moments(), self.state_manager.get("total_bets"),
+                                      self.state_manager.get("bet_amount"), self.confidence) / z
+        batch_moments = self.state_manager.get("batch_moments")
+        stratified = self.rtp_half_width() / z if batch_moments is not None else float("inf")
+        report = {
+            "reels": self.stratified_reels,
+            "strata": self.kernel.strata.size,
+            "batches": batch_moments["count"] if batch_moments is not None else None,
+            "rtp_standard_error": stratified if stratified < float("inf") else None,
+            "unstratified_rtp_standard_error": unstratified if unstratified < float("inf") else None,
+            "variance_reduction": None,
+        }
+        if report["rtp_standard_error"] and report["unstratified_rtp_standard_error"] is not None:
+            report["variance_reduction"] = (unstratified / stratified) ** 2
+        return report
+
+    def round_moments(self, control: bool = False) -> dict:
+        """Moments of the run's round returns, or with ``control`` their co-moments with the control."""
+        moments = self.state_manager.get("control_moments" if control else "round_moments")
+        return with_open_round(moments, self.state_manager.get("open_round"), control)
+
     def _run_spin(self):
+        # The grid is drawn with the weights the previous spin's before_spin left
+        free_weights = bool(self.state_manager.get("is_free_spin", False))
+
         # Prepare for the spin with optional blocked reels or specific icons
         self.engine.pre_spin(icon=self.state_manager.get("icon"), blocked_reels=self.state_manager.get("blocked_reels"))
 
@@ -141,18 +351,75 @@ class Simulation:
         if spin_winning > 0:
             self.state_manager.set("hits", self.state_manager.get("hits") + 1)
             self.state_manager.set("total_winnings", self.state_manager.get("total_winnings") + spin_winning)
-
-        # Store detailed spin results
-        result = self.engine.detailed_spin_result(self.state_manager.get("bet_amount"))
-        detailed_results = self.state_manager.get("detailed_results")
-        detailed_results.append(result)
-        self.state_manager.set("detailed_results", detailed_results)
+        self.state_manager.set("sum_squared_winnings",
+                               self.state_manager.get("sum_squared_winnings") + spin_winning * spin_winning)
+        spin_return = spin_winning / bet_amount if bet_amount else 0.0
+        add_return(self.state_manager.get("return_moments"), spin_return)
+        # A paid spin starts a new round
+        open_round = self.state_manager.get("open_round")
+        if open_round["spins"] and not self.state_manager.get("is_free_spin", False):
+            close_round(open_round, self.state_manager.get("round_moments"), self.state_manager.get("control_moments"))
+        open_round["spins"] += 1
+        open_round["value"] += spin_return
+        if self.control_expectations is not None:
+            open_round["control"] += spin_return - self.control_expectations[free_weights]
+        return_histogram = self.state_manager.get("return_histogram")
+        bucket = return_bucket(spin_return)
+        return_histogram[bucket] = return_histogram.get(bucket, 0) + 1
+
+        # Store detailed spin results when the capture keeps this spin
+        spin_index = self.state_manager.get("spin_count")
+        if self.detail_capture.wants(spin_index, spin_winning, bet_amount):
+            self.detail_capture.record(spin_index, self.engine.detailed_spin_result(bet_amount))
 
         # Increment spin count
         self.state_manager.set("spin_count", self.state_manager.get("spin_count") + 1)
 
         return True  # Indicate success
 
+    def checkpoint(self) -> dict:
+        """
+        Everything needed to carry this run on: the accumulators and plugin
+        counters held in the state, the engine's reel weights and the
+        generator's position. ``restore`` on a new simulation of the same
+        game, seed and bet continues from here, exactly as if the run had
+        never stopped.
+        """
+        state = {
+            key: copy.deepcopy(value)
+            for key, value in self.state_manager.get_full_state().items()
+            if key not in CHECKPOINT_EXCLUDED_STATE and _is_plain(value)
+        }
+        # The kernel's position includes the batches it drew ahead
+        generator = self.kernel if self.kernel is not None else self.engine.rng
+        return {
+            "version": CHECKPOINT_VERSION,
+            "seed": self.seed,
+            "bet_amount": self.state_manager.get("bet_amount"),
+            "fast": self.kernel is not None,
+            "state": state,
+            "reel_weights": copy.deepcopy(self.engine.reel_weights),
+            "rng": generator.get_state(),
+        }
+
+    def restore(self, checkpoint: dict):
+        """
+        Continue the run a ``checkpoint`` was taken from: ``run`` then plays
+        this simulation's ``num_spins`` more spins on top of the checkpoint's
+        totals.
+        """
+        if checkpoint.get("version") != CHECKPOINT_VERSION:
+            raise ValueError(f"Unsupported checkpoint version {checkpoint.get('version')}")
+        if (checkpoint["seed"], checkpoint["bet_amount"], checkpoint["fast"]) != \
+                (self.seed, self.state_manager.get("bet_amount"), self.kernel is not None):
+            raise ValueError("A checkpoint can only be restored into a simulation with the same seed, "
+                             "bet amount and kernel.")
+        self.state_manager.update(copy.deepcopy(checkpoint["state"]))
+        for reel_idx, weights in checkpoint["reel_weights"].items():
+            self.engine.set_reel_weights(reel_idx, weights)
+        generator = self.kernel if self.kernel is not None else self.engine.rng
+        generator.set_state(checkpoint["rng"])
+
     def _process_pending_actions(self):
         pending_actions = self.state_manager.get_pending_actions()
         if pending_actions:
@@ -203,9 +470,34 @@ class Simulation:
             "hit_frequency": self._get_hit_frequency(),
             "errors": state.get("errors") or [],
             "pending_actions": state.get("pending_actions", {}),
-            "total_free_spins_won": state.get("total_free_spins_won", 0)
+            "total_free_spins_won": state.get("total_free_spins_won", 0),
+            "sum_squared_winnings": state.get("sum_squared_winnings", 0.0),
+            "return_statistics": return_statistics(state["return_moments"], state["return_histogram"]),
+            "return_histogram": dict(sorted(state["return_histogram"].items())),
+            "seed": self.seed,
         }
 
+        if self.target_half_width is not None:
+            half_width = self.rtp_half_width()
+            results["sequential_stopping"] = {
+                "target_half_width": self.target_half_width,
+                "rtp_half_width": half_width if half_width != float("inf") else None,
+                "confidence": self.confidence,
+                "target_met": self.target_met(),
+                "spins_budget": state["num_spins"],
+                "spins_played": state["spin_count"],
+            }
+
+        if self.control_expectations is not None:
+            results["control_variate"] = {
+                "expected_base_return": self.control_expectations[False],
+                "expected_free_spin_return": self.control_expectations.get(True),
+                **(self.control_variate_estimate() or {}),
+            }
+
+        if self.stratified_reels:
+            results["stratified_sampling"] = self.stratified_sampling_report()
+
         # Set status based on presence of errors
         if results["errors"]:
             results["status"] = "error"
@@ -217,8 +509,16 @@ class Simulation:
             plugin_results = plugin_instance.get_results()
             results.update(plugin_results)
 
+        if self.detail_capture.stream_id is not None:
+            # Served by GET /detailed-results/{id}; server paths mean nothing to clients
+            results["detailed_results_id"] = self.detail_capture.stream_id
+        elif self.detail_capture.path is not None:
+            results["detailed_results_path"] = self.detail_capture.path
+        if self.detail_capture.truncated:
+            results["detailed_results_truncated"] = True
+
         if detail_level == "detailed":
-            results["detailed_results"] = state["detailed_results"]
+            results["detailed_results"] = self.detail_capture.results()
             results["paylines"] = self.state_manager.get("config").get_paylines()
             results["paytable"] = self.state_manager.get("config").get_paytable()
 
@@ -256,8 +556,6 @@ class Simulation:
         if spin_winning > 0:
             self.state_manager.set("hits", self.state_manager.get("hits") + 1)
             # self.state_manager.set("total_winnings", self.state_manager.get("total_winnings") + spin_winning)  # will double "total_winnings"
-        detailed_results = self.state_manager.get("detailed_results")
-        self.state_manager.set("detailed_results", detailed_results)
 
         out = self.get_results()
         ## hard coded! need to change! DONE!
@@ -275,10 +573,7 @@ class Simulation:
                     symbols.append(symbol['symbols'][0])
                     positions.append([symbol['positions'][0], pos_count-1])
 
-        out["big_win"] = False
-        big_win = self.state_manager.get("bet_amount") * 1000  # Fixme: use correct value
-        if spin_winning > big_win:
-            out["big_win"] = True
+        out["big_win"] = spin_winning >= self.state_manager.get("bet_amount") * self.big_win_multiplier
         out["spin_results"] = {
             "total_payout": spin_winning,
             "payline_results": self.engine.lines,
@@ -310,8 +605,8 @@ class Simulation:
 
 async def run_simulation_async(simulation: Simulation):
     try:
-
-        simulation.run()  # Run the simulation asynchronously
+        # Run in a worker thread so the event loop keeps serving requests
+        await asyncio.to_thread(simulation.run)
         return simulation.get_results()
     except Exception as e:
         logging.error(f"Simulation error: {traceback.format_exc()}")
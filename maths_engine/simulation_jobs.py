@@ -0,0 +1,211 @@
+# maths_engine/simulation_jobs.py
+import asyncio
+import logging
+import random
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from maths_engine.simulation_pool import SimulationPool, build_simulation, summarise_simulation, summary_value
+
+logger = logging.getLogger(__name__)
+
+JOB_STATUSES = ("queued", "running", "completed", "cancelled", "failed")
+FINISHED_JOB_STATUSES = ("completed", "cancelled", "failed")
+# Jobs waiting for a worker before new ones are refused
+DEFAULT_MAX_QUEUED_JOBS = 16
+# Finished jobs kept for GET requests, oldest dropped first
+DEFAULT_FINISHED_JOBS_KEPT = 100
+# Spins per pool task; a job reports progress once per slice
+DEFAULT_SLICE_SPINS = 10_000
+FAST_SLICE_SPINS = 250_000
+# Most spins one job plays
+MAX_JOB_SPINS = 10_000_000_000
+
+
+def run_slice_task(params: dict, checkpoint: Optional[dict]) -> Tuple[dict, dict]:
+    """
+    Play a job's next ``params["num_spins"]`` spins in a pool worker,
+    continuing from the previous slice's ``checkpoint`` (None for the
+    first). Returns the summary of the whole run so far and its checkpoint.
+    """
+    simulation = build_simulation(params)
+    if checkpoint is not None:
+        simulation.restore(checkpoint)
+    simulation.run()
+    return summarise_simulation(simulation), simulation.checkpoint()
+
+
+class SimulationJob:
+    """
+    One simulation run in the background, slice by slice.
+
+    Each slice is a pool task of at most ``slice_spins`` spins that restores
+    the checkpoint the previous slice left (capital, free spins still owed,
+    plugin state and generator position), so a job plays exactly the spins
+    of one run seeded with ``master_seed``. ``summary`` is the summary of
+    that run up to the last finished slice.
+    """
+
+    def __init__(self, params: dict, master_seed: int, slice_spins: int):
+        self.id = uuid.uuid4().hex
+        self.params = params
+        self.master_seed = master_seed
+        self.num_spins = params["num_spins"]
+        self.slice_spins = slice_spins
+        self.status = "queued"
+        self.summary = None
+        # Spins asked of the finished slices; fewer are played if the capital runs out
+        self.spins_scheduled = 0
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.task = None
+        self.version = 0
+        self.changed = asyncio.Condition()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_JOB_STATUSES
+
+    async def notify(self):
+        async with self.changed:
+            self.version += 1
+            self.changed.notify_all()
+
+    def add_slice(self, summary: dict, spins: int):
+        # A slice continues the run, so its summary already covers the earlier slices
+        self.summary = summary
+        self.spins_scheduled += spins
+
+    def progress(self) -> dict:
+        """Status, spins done, running totals and, while running, the estimated seconds left."""
+        summary = self.summary
+        total_bets = summary_value(summary, "total_bets", 0.0) if summary else 0.0
+        total_winnings = summary_value(summary, "total_winnings", 0.0) if summary else 0.0
+        spins_done = summary_value(summary, "spin_count") if summary else 0
+        hits = summary_value(summary, "hits") if summary else 0
+        now = self.finished_at or time.time()
+        elapsed = now - self.started_at if self.started_at else 0.0
+        eta = None
+        if self.status == "running" and self.spins_scheduled:
+            eta = elapsed / self.spins_scheduled * (self.num_spins - self.spins_scheduled)
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "master_seed": self.master_seed,
+            "num_spins": self.num_spins,
+            "spins_done": spins_done,
+            "progress": 1.0 if self.status == "completed" else self.spins_scheduled / self.num_spins,
+            "total_bets": total_bets,
+            "total_winnings": total_winnings,
+            "rtp": total_winnings / total_bets * 100 if total_bets > 0 else 0.0,
+            "hit_frequency": hits / spins_done * 100 if spins_done > 0 else 0.0,
+            "elapsed_seconds": elapsed,
+            "eta_seconds": eta,
+            "error": self.error,
+        }
+
+
+class SimulationJobManager:
+    """
+    Background simulation jobs on the shared ``SimulationPool``.
+
+    At most one job per pool worker runs at a time and up to ``max_queued``
+    more wait for a slot; ``submit`` refuses jobs beyond that. Each running
+    job keeps one slice in flight, so concurrent jobs share the workers
+    fairly and a cancelled job frees its worker once the current slice ends.
+    """
+
+    def __init__(self, pool: SimulationPool, max_queued: int = DEFAULT_MAX_QUEUED_JOBS,
+                 finished_kept: int = DEFAULT_FINISHED_JOBS_KEPT):
+        self.pool = pool
+        self.max_queued = max_queued
+        self.finished_kept = finished_kept
+        self.jobs = OrderedDict()
+        self.slots = asyncio.Semaphore(pool.max_workers)
+
+    def submit(self, params: dict, slice_spins: Optional[int] = None) -> SimulationJob:
+        """Queue a job for request-named ``params``; its seed is the master seed, drawn when None."""
+        if params["num_spins"] < 1:
+            raise ValueError(f"num_spins must be positive, got {params['num_spins']}")
+        queued = sum(job.status == "queued" for job in self.jobs.values())
+        if queued >= self.max_queued:
+            raise RuntimeError(f"Simulation job queue is full ({queued} jobs waiting).")
+        master_seed = params.get("seed")
+        if master_seed is None:
+            master_seed = random.getrandbits(64)
+        slice_spins = slice_spins or (FAST_SLICE_SPINS if params.get("fast") else DEFAULT_SLICE_SPINS)
+        job = SimulationJob(params, master_seed, slice_spins)
+        self.jobs[job.id] = job
+        self._forget_finished()
+        job.task = asyncio.create_task(self._run(job))
+        return job
+
+    def get(self, job_id: str) -> Optional[SimulationJob]:
+        return self.jobs.get(job_id)
+
+    async def cancel(self, job_id: str) -> Optional[SimulationJob]:
+        """Cancel a queued or running job, keeping the slices it finished."""
+        job = self.jobs.get(job_id)
+        if job is not None and not job.finished:
+            job.task.cancel()
+            try:
+                await job.task
+            except asyncio.CancelledError:
+                pass
+        return job
+
+    async def updates(self, job: SimulationJob):
+        """Yield the job's progress now and after every change, ending with its final state."""
+        version = None
+        while True:
+            async with job.changed:
+                await job.changed.wait_for(lambda: job.version != version)
+                version = job.version
+                progress = job.progress()
+            yield progress
+            if progress["status"] in FINISHED_JOB_STATUSES:
+                return
+
+    def shutdown(self):
+        for job in self.jobs.values():
+            if not job.finished:
+                job.task.cancel()
+
+    def _forget_finished(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished]
+        for job_id in finished[:max(len(finished) - self.finished_kept, 0)]:
+            del self.jobs[job_id]
+
+    async def _run(self, job: SimulationJob):
+        try:
+            async with self.slots:
+                job.status = "running"
+                job.started_at = time.time()
+                await job.notify()
+                checkpoint = None
+                while job.spins_scheduled < job.num_spins:
+                    spins = min(job.slice_spins, job.num_spins - job.spins_scheduled)
+                    # Slices are not cached: each one is only worth anything to this job
+                    future = self.pool.submit_task(run_slice_task, {**job.params, "num_spins": spins,
+                                                                    "seed": job.master_seed}, checkpoint)
+                    summary, checkpoint = await asyncio.wrap_future(future)
+                    job.add_slice(summary, spins)
+                    if summary["errors"] or summary_value(summary, "spin_count") < job.spins_scheduled:
+                        # Out of capital, or the run stopped on an error
+                        break
+                    await job.notify()
+            job.status = "completed"
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+            raise
+        except Exception as e:
+            logger.error(f"Simulation job {job.id} failed: {e}")
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+            await job.notify()
@@ -0,0 +1,338 @@
+# maths_engine/simulation_kernel.py
+from typing import Optional
+
+import numpy as np
+
+from maths_engine.isaac_rng_v2 import IsaacLanes, substream_seed
+from maths_engine.plugins.free_spins import FreeSpinsPlugin
+from maths_engine.spin_statistics import (add_control, add_controls, add_return, add_returns, add_to_histogram,
+                                          close_round, new_moments, return_bucket)
+from maths_engine.stratified_sampling import ColumnStrata
+
+# Spins drawn and evaluated per batch
+DEFAULT_CHUNK_SIZE = 16_384
+# Independent ISAAC lanes advanced together by the kernel's generator
+DEFAULT_LANES = 1024
+
+
+class SimulationKernel:
+    """
+    Batch spin loop behind ``Simulation(fast=True)``.
+
+    Grids come from ``generate_grids`` driven by a lane-parallel ISAAC
+    generator seeded from the simulation seed, payouts from the compiled
+    ``PaylineEvaluator``, and the running totals live in local variables;
+    the StateManager is only written once the run is over, so
+    ``Simulation.get_results`` reads the same keys as after the spin loop.
+
+    Plugin-free games run fully vectorised, with the stop on running out of
+    capital applied to each batch through a cumulative sum. The free_spins
+    plugin is replayed spin by spin over pre-evaluated batches, keeping the
+    loop's ordering: a grid is drawn with the weights chosen by the previous
+    spin's ``before_spin``. Other plugins, demo reels and detail capture are
+    not supported (``free_spins_detail`` holds no icon positions).
+
+    With the simulation's ``stratified_reels``, base game batches take the
+    columns of their first reels from a ``ColumnStrata`` sample, and the
+    mean return of every batch played in full is kept as a replicate.
+
+    Grids are always drawn in full batches and a run plays on from where the
+    previous one stopped in a batch, so how a run is split (``get_state`` /
+    ``set_state`` included) never changes which grids are played.
+    """
+
+    def __init__(self, simulation, chunk_size: int = DEFAULT_CHUNK_SIZE, lanes: int = DEFAULT_LANES):
+        self.state_manager = simulation.state_manager
+        self.engine = simulation.engine
+        self.chunk_size = chunk_size
+        if self.state_manager.get("demo_params") is not None:
+            raise ValueError("Fast simulation does not support demo_params.")
+        if simulation.detail_capture.mode != "none":
+            raise ValueError("Fast simulation does not record per-spin detail.")
+        self.free_spins = self.supported_plugin(simulation.plugin_manager.plugins)
+        self.control_expectations = simulation.control_expectations
+        self.strata = None
+        if simulation.stratified_reels:
+            self.strata = ColumnStrata(self.engine, simulation.stratified_reels, self.state_manager.get("icon"),
+                                       self.state_manager.get("blocked_reels"))
+        self.rng = IsaacLanes([substream_seed(simulation.seed, "lane", lane) for lane in range(lanes)])
+        # Batches in play, keyed by whether they hold free spin grids
+        self.streams = {}
+        # Batches of a restored run still to be redrawn
+        self._restored_streams = {}
+
+    @staticmethod
+    def supported_plugin(plugins: dict, feature: str = "Fast simulation") -> Optional[FreeSpinsPlugin]:
+        """The free spins plugin when it is the only plugin, None without plugins."""
+        unsupported = [name for name, plugin in plugins.items() if type(plugin) is not FreeSpinsPlugin]
+        if unsupported or len(plugins) > 1:
+            raise ValueError(f"{feature} supports no plugins or the free_spins plugin alone, "
+                             f"got {sorted(plugins)}")
+        return next(iter(plugins.values()), None)
+
+    def get_state(self) -> dict:
+        """
+        Generator position plus, for every batch not played to its end, the
+        generator position it was drawn from and how far it was played.
+        """
+        streams = dict(self._restored_streams)
+        for key, stream in self.streams.items():
+            if stream["position"] < stream["size"]:
+                streams[key] = {"rng": stream["rng"], "size": stream["size"], "position": stream["position"]}
+        return {"rng": self.rng.get_state(), "streams": streams}
+
+    def set_state(self, state: dict):
+        """Continue from a ``get_state`` position; unfinished batches are redrawn on the next ``run``."""
+        self.rng.set_state(state["rng"])
+        self.streams = {}
+        self._restored_streams = dict(state["streams"])
+
+    def _stream(self, key: bool, size: int, icon, blocked_reels, evaluator, bet_amount) -> dict:
+        """The batch stream ``key``, with a restored batch redrawn at the position it was left."""
+        stream = self.streams.get(key)
+        if stream is None:
+            stream = self.streams[key] = {"size": size, "icon": icon, "blocked_reels": blocked_reels,
+                                          "position": size, "rng": None,
+                                          "column_strata": None if key else self.strata}
+            restored = self._restored_streams.pop(key, None)
+            if restored is not None:
+                if restored["size"] != size:
+                    raise ValueError(f"Restored batch of {restored['size']} grids, expected {size}")
+                current = self.rng.get_state()
+                self.rng.set_state(restored["rng"])
+                self._draw(stream, evaluator, bet_amount)
+                self.rng.set_state(current)
+                stream["position"] = restored["position"]
+        return stream
+
+    def _draw(self, stream: dict, evaluator, bet_amount):
+        stream["rng"] = self.rng.get_state()
+        leading_columns = None
+        if stream["column_strata"] is not None:
+            leading_columns, _ = stream["column_strata"].sample(self.rng, stream["size"])
+        grids = self.engine.generate_grids(stream["size"], stream["icon"], stream["blocked_reels"], rng=self.rng,
+                                           leading_columns=leading_columns)
+        stream["grids"] = grids
+        stream["wins"] = evaluator.evaluate(grids, bet_amount)
+        stream["position"] = 0
+        plugin = self.free_spins
+        if plugin is not None:
+            counted_reels = [reel_idx for reel_idx in range(grids.shape[1]) if reel_idx not in plugin.blocked_reels]
+            icon_counts = np.count_nonzero(grids[:, counted_reels, :] == plugin.free_spins_symbol, axis=(1, 2))
+            # The spin by spin loop reads Python lists much faster than arrays
+            stream["win_list"], stream["counts"] = stream["wins"].tolist(), icon_counts.tolist()
+
+    def run(self, num_spins: Optional[int] = None):
+        """Play ``num_spins`` more spins, the simulation's ``num_spins`` by default."""
+        state = self.state_manager
+        icon = state.get("icon")
+        blocked_reels = state.get("blocked_reels")
+        evaluator = self.engine.get_payline_evaluator(icon)
+        totals = {
+            "num_spins": state.get("num_spins") if num_spins is None else num_spins,
+            "bet_amount": state.get("bet_amount"),
+            "capital": state.get("capital"),
+            "total_bets": state.get("total_bets"),
+            "total_winnings": state.get("total_winnings"),
+            "hits": state.get("hits"),
+            "spin_count": state.get("spin_count"),
+            "sum_squared_winnings": state.get("sum_squared_winnings", 0.0),
+            "return_moments": state.get("return_moments") or new_moments(),
+            "return_histogram": state.get("return_histogram", {}),
+        }
+        if self.free_spins is None:
+            self._run_base_game(totals, evaluator, icon, blocked_reels)
+        else:
+            self._run_free_spins(totals, evaluator, icon, blocked_reels)
+
+        for key in ("capital", "total_bets", "total_winnings", "hits", "spin_count", "sum_squared_winnings",
+                    "return_moments", "return_histogram"):
+            state.set(key, totals[key])
+        if "last_grid" in totals:
+            state.set("engine_reels", totals["last_grid"].tolist())
+            state.set("spin_winnings", totals["last_win"])
+
+    def _run_base_game(self, totals, evaluator, icon, blocked_reels):
+        bet_amount = totals["bet_amount"]
+        capital = totals["capital"]
+        spin_count = totals["spin_count"]
+        remaining = totals["num_spins"]
+        total_bets, total_winnings, hits, sum_squares = 0.0, 0.0, 0, 0.0
+        stream = self._stream(False, self.chunk_size, icon, blocked_reels, evaluator, bet_amount)
+        open_round = self.state_manager.get("open_round")
+        if open_round["spins"]:
+            close_round(open_round, self.state_manager.get("round_moments"), self.state_manager.get("control_moments"))
+        batch_moments = self.state_manager.get("batch_moments")
+        open_batch = self.state_manager.get("open_batch")
+
+        while remaining > 0 and capital >= bet_amount:
+            if stream["position"] == stream["size"]:
+                self._draw(stream, evaluator, bet_amount)
+            start = stream["position"]
+            wins = stream["wins"][start:start + remaining]
+            # Capital before each spin of the batch; the loop stops before the first spin it cannot cover
+            before = capital + np.concatenate(([0.0], np.cumsum(wins - bet_amount)[:-1]))
+            broke = np.flatnonzero(before < bet_amount)
+            played = int(broke[0]) if broke.size else wins.size
+            wins = wins[:played]
+            stream["position"] = start + played
+            capital = float(before[played - 1] - bet_amount + wins[-1])
+            total_bets += bet_amount * played
+            total_winnings += float(wins.sum())
+            hits += int(np.count_nonzero(wins > 0))
+            sum_squares += float(np.dot(wins, wins))
+            returns = wins / bet_amount if bet_amount else np.zeros_like(wins)
+            add_returns(totals["return_moments"], returns)
+            add_to_histogram(totals["return_histogram"], returns)
+            # Without free spins every spin is a round of its own
+            add_returns(self.state_manager.get("round_moments"), returns)
+            if self.control_expectations is not None:
+                add_controls(self.state_manager.get("control_moments"), returns,
+                             returns - self.control_expectations[False])
+            if batch_moments is not None:
+                open_batch["spins"] += played
+                open_batch["value"] += float(returns.sum())
+                if stream["position"] == stream["size"]:
+                    add_return(batch_moments, open_batch["value"] / open_batch["spins"])
+                    open_batch.update(spins=0, value=0.0)
+            spin_count += played
+            remaining -= played
+            totals["last_grid"], totals["last_win"] = stream["grids"][start + played - 1], float(wins[-1])
+            if broke.size:
+                break
+
+        totals["capital"] = capital
+        totals["total_bets"] += total_bets
+        totals["total_winnings"] += total_winnings
+        totals["hits"] += hits
+        totals["sum_squared_winnings"] += sum_squares
+        totals["spin_count"] = spin_count
+
+    def _run_free_spins(self, totals, evaluator, icon, blocked_reels):
+        plugin = self.free_spins
+        state = self.state_manager
+        bet_amount = totals["bet_amount"]
+        capital = totals["capital"]
+        total_bets = totals["total_bets"]
+        total_winnings = totals["total_winnings"]
+        hits = totals["hits"]
+        spin_count = totals["spin_count"]
+        sum_squares = totals["sum_squared_winnings"]
+        moments = totals["return_moments"]
+        # Welford's update inlined on locals, as it runs once per spin
+        return_count, return_mean, return_m2 = moments["count"], moments["mean"], moments["m2"]
+        return_max = moments["max"]
+        return_scale = 1 / bet_amount if bet_amount else 0.0
+        return_histogram = totals["return_histogram"]
+        # Spin winnings repeat, so each one's histogram bucket is computed once
+        buckets = {}
+        # Rounds: the one in play and the moments of the finished ones, the latter inlined like the spin moments
+        open_round = state.get("open_round")
+        round_spins, round_value, round_control = open_round["spins"], open_round["value"], open_round["control"]
+        round_moments = state.get("round_moments")
+        round_count, round_mean, round_m2, round_max = (round_moments[key] for key in ("count", "mean", "m2", "max"))
+        control_expectations = self.control_expectations or {False: 0.0, True: 0.0}
+        control_moments = state.get("control_moments")
+        current_free_spins = state.get("current_free_spins", 0)
+        total_free_spins_won = state.get("total_free_spins_won", 0)
+        cells = self.engine.config.columns * self.engine.config.rows
+        awards = {(count, is_free): plugin.free_spins_awarded(count, is_free)
+                  for count in range(cells + 1)
+                  for is_free in (False, True)}
+        icon_counts = [0] * (cells + 1)
+        # Spins awarding free spins, indexed by whether they were free spins themselves
+        awarding_spins = [state.get("free_spins_triggers", 0), state.get("free_spins_retriggers", 0)]
+        free_spins_played = state.get("free_spins_played", 0)
+
+        # Base grids use the game's reel blocking, free grids the plugin's
+        streams = {
+            False: self._stream(False, self.chunk_size, icon, blocked_reels, evaluator, bet_amount),
+            True: self._stream(True, self.chunk_size // 8, plugin.free_spins_symbol, plugin.blocked_reels,
+                               evaluator, bet_amount),
+        }
+        # Weights left by the last before_spin
+        free_weights = bool(state.get("is_free_spin", False))
+        is_free_spin = False
+        free_spins_count = 0
+        stream = None
+
+        for _ in range(totals["num_spins"]):
+            if capital < bet_amount:
+                break
+            expected_return = control_expectations[free_weights]
+            stream = streams[free_weights]
+            position = stream["position"]
+            if position == stream["size"]:
+                self._draw(stream, evaluator, bet_amount)
+                position = 0
+            stream["position"] = position + 1
+
+            # before_spin picks the weights of the next grid
+            is_free_spin = free_weights = current_free_spins > 0
+            spin_winning = stream["win_list"][position]
+            free_spins_count = stream["counts"][position]
+            won = awards[free_spins_count, is_free_spin]
+            icon_counts[free_spins_count] += 1
+            if won:
+                awarding_spins[is_free_spin] += 1
+            total_free_spins_won += won
+            current_free_spins += won
+            if is_free_spin:
+                capital += bet_amount
+                total_bets -= bet_amount
+                current_free_spins -= 1
+                free_spins_played += 1
+
+            capital += spin_winning - bet_amount
+            total_bets += bet_amount
+            if spin_winning > 0:
+                hits += 1
+                total_winnings += spin_winning
+            sum_squares += spin_winning * spin_winning
+            spin_return = spin_winning * return_scale
+            return_count += 1
+            delta = spin_return - return_mean
+            return_mean += delta / return_count
+            return_m2 += delta * (spin_return - return_mean)
+            if spin_return > return_max:
+                return_max = spin_return
+            bucket = buckets.get(spin_winning)
+            if bucket is None:
+                bucket = buckets[spin_winning] = return_bucket(spin_return)
+            return_histogram[bucket] = return_histogram.get(bucket, 0) + 1
+            # A paid spin closes the round in play and starts a new one
+            if round_spins and not is_free_spin:
+                round_count += 1
+                delta = round_value - round_mean
+                round_mean += delta / round_count
+                round_m2 += delta * (round_value - round_mean)
+                if round_value > round_max:
+                    round_max = round_value
+                if control_moments is not None:
+                    add_control(control_moments, round_value, round_control)
+                round_spins, round_value, round_control = 0, 0.0, 0.0
+            round_spins += 1
+            round_value += spin_return
+            round_control += spin_return - expected_return
+            spin_count += 1
+
+        if stream is not None:
+            totals["last_grid"] = stream["grids"][stream["position"] - 1]
+            totals["last_win"] = stream["win_list"][stream["position"] - 1]
+        totals.update(capital=capital, total_bets=total_bets, total_winnings=total_winnings,
+                      hits=hits, spin_count=spin_count, sum_squared_winnings=sum_squares)
+        moments.update(count=return_count, mean=return_mean, m2=return_m2, max=return_max)
+        round_moments.update(count=round_count, mean=round_mean, m2=round_m2, max=round_max)
+        open_round.update(spins=round_spins, value=round_value, control=round_control)
+        state.set("current_free_spins", current_free_spins)
+        state.set("total_free_spins_won", total_free_spins_won)
+        state.set("is_free_spin", is_free_spin)
+        state.set("free_spins_count", free_spins_count)
+        state.set("free_spins_triggers", awarding_spins[False])
+        state.set("free_spins_retriggers", awarding_spins[True])
+        state.set("free_spins_played", free_spins_played)
+        histogram = state.get("free_spins_icon_counts", {})
+        for count, spins in enumerate(icon_counts):
+            if spins:
+                histogram[count] = histogram.get(count, 0) + spins
+        state.set("free_spins_icon_counts", histogram)
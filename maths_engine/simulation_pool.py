@@ -0,0 +1,250 @@
+# maths_engine/simulation_pool.py
+import logging
+import multiprocessing
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Optional
+
+import numpy as np
+
+from maths_engine.configuration import Configuration
+from maths_engine.payout_distribution import PayoutDistribution, PayoutDistributionCalculator
+from maths_engine.result_cache import ResultCache, canonical_configuration, canonical_key
+from maths_engine.simulation import Simulation
+from maths_engine.slot_machine_engine import SlotMachineEngine
+from maths_engine.spin_statistics import merge_moments, new_moments
+from maths_engine.state_manager import StateManager
+
+logger = logging.getLogger(__name__)
+
+# Ratios reported by get_results; they are recomputed from the merged totals
+DERIVED_RESULTS = ("rtp", "hit_frequency")
+# Request fields besides the game configuration that decide a run's results
+CACHED_RUN_FIELDS = ("plugins", "seed", "num_spins", "bet_amount", "starting_capital", "demo_params",
+                     "control_variate", "stratified_reels")
+
+
+def available_cpus() -> int:
+    """CPUs this process may run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def build_configuration(params: dict) -> Configuration:
+    """Game configuration from request parameters named like ``RunSimulationRequest``'s fields."""
+    config = Configuration(
+        rows=params["rows"],
+        columns=params["columns"],
+        symbols=params["symbols"],
+        wild_symbol=params["wild_symbol"],
+        weight_formula=params.get("weight_formula") or "",
+        payout_formula=params.get("payout_formula") or "",
+        symbol_payouts=params.get("custom_symbol_payouts") or {},
+        custom_paylines=params.get("custom_paylines"),
+        weight_resolution=params["weight_resolution"],
+    )
+    config.sticky_options = {
+        "duration": params.get("sticky_duration"),
+        "expand": params.get("expand_stickies"),
+        "multiplier": params.get("sticky_multiplier"),
+        "until_bonus": params.get("until_bonus"),
+        "bonus_symbol": params.get("bonus_symbol"),
+    }
+    config.cascading_reels = params.get("cascading_reels", False)
+    return config
+
+
+def simulation_cache_key(params: dict, **extra) -> str:
+    """
+    Result cache key of a run: the effective configuration built from request
+    ``params``, the fields in ``CACHED_RUN_FIELDS``, the kernel used and any
+    ``extra`` values the caller's results also depend on.
+    """
+    payload = {field: params.get(field) for field in CACHED_RUN_FIELDS}
+    payload.update(config=canonical_configuration(build_configuration(params)),
+                   fast=bool(params.get("fast")), **extra)
+    return canonical_key(payload)
+
+
+def cacheable(params: dict) -> bool:
+    """Whether a run's results may be cached: seeded, not opted out, no detail records or remote plugin code."""
+    return (params.get("seed") is not None and params.get("cache") is not False
+            and params.get("detail_capture", "none") == "none" and not params.get("plugin_url"))
+
+
+def summarise_simulation(simulation: Simulation) -> dict:
+    """
+    Compact numeric summary of a finished simulation.
+
+    Integer and float results travel as one ``int64`` and one ``float64``
+    array with their names, and integer histograms (such as
+    ``free_spins_icon_counts`` and ``return_histogram``) as ``int64`` arrays
+    indexed by bucket, so a worker sends a few hundred bytes back instead of
+    a pydantic model. The per-spin and per-round return moments travel as
+    they are.
+    """
+    results = simulation.get_results()
+    state = simulation.state_manager
+    scalars = {"spin_count": state.get("spin_count"), "hits": state.get("hits"), "capital": state.get("capital")}
+    histograms = {}
+    for key, value in results.items():
+        if key in DERIVED_RESULTS or key == "seed" or isinstance(value, bool):
+            continue
+        if isinstance(value, (int, float, np.integer, np.floating)):
+            scalars[key] = value
+        elif isinstance(value, dict) and value and all(isinstance(bucket, int) and bucket >= 0 and
+                                                       isinstance(count, int) for bucket, count in value.items()):
+            histograms[key] = np.bincount(list(value), weights=list(value.values())).astype(np.int64)
+
+    counts = {key: value for key, value in scalars.items() if isinstance(value, (int, np.integer))}
+    amounts = {key: value for key, value in scalars.items() if key not in counts}
+    return {
+        "seed": simulation.seed,
+        "count_names": tuple(counts),
+        "counts": np.array(list(counts.values()), dtype=np.int64),
+        "amount_names": tuple(amounts),
+        "amounts": np.array(list(amounts.values()), dtype=np.float64),
+        "histograms": histograms,
+        "return_moments": dict(state.get("return_moments")),
+        "round_moments": simulation.round_moments(),
+        "errors": list(results["errors"]),
+    }
+
+
+def summary_value(summary: dict, name: str, default=0):
+    """A count or amount of a ``summarise_simulation`` summary."""
+    for names, values in ((summary["count_names"], summary["counts"]), (summary["amount_names"], summary["amounts"])):
+        if name in names:
+            return values[names.index(name)].item()
+    return default
+
+
+def merge_summaries(*summaries: dict) -> dict:
+    """
+    Sum of ``summarise_simulation`` summaries: counts, amounts and histogram
+    buckets add up by name, return and round moments are pooled and errors are
+    concatenated. The seed is dropped, as the merged runs had one each.
+    """
+    counts, amounts, histograms, errors = {}, {}, {}, []
+    moments = merge_moments(*(summary.get("return_moments", new_moments()) for summary in summaries))
+    round_moments = merge_moments(*(summary.get("round_moments", new_moments()) for summary in summaries))
+    for summary in summaries:
+        for name, value in zip(summary["count_names"], summary["counts"].tolist()):
+            counts[name] = counts.get(name, 0) + value
+        for name, value in zip(summary["amount_names"], summary["amounts"].tolist()):
+            amounts[name] = amounts.get(name, 0.0) + value
+        for name, histogram in summary["histograms"].items():
+            merged = histograms.get(name, np.zeros(0, dtype=np.int64))
+            if merged.size < histogram.size:
+                merged = np.pad(merged, (0, histogram.size - merged.size))
+            merged[:histogram.size] += histogram
+            histograms[name] = merged
+        errors.extend(summary["errors"])
+    return {
+        "seed": None,
+        "count_names": tuple(counts),
+        "counts": np.array(list(counts.values()), dtype=np.int64),
+        "amount_names": tuple(amounts),
+        "amounts": np.array(list(amounts.values()), dtype=np.float64),
+        "histograms": histograms,
+        "return_moments": moments,
+        "round_moments": round_moments,
+        "errors": errors,
+    }
+
+
+def build_simulation(params: dict, **overrides) -> Simulation:
+    """Simulation for request-named ``params``; ``overrides`` are passed on to ``Simulation`` as they are."""
+    config = build_configuration(params)
+    state_manager = StateManager(initial_state={"config": config})
+    arguments = dict(
+        config=config,
+        bet_amount=params["bet_amount"],
+        num_spins=params["num_spins"],
+        capital=params["starting_capital"],
+        plugins_with_params=params["plugins"],
+        state_manager=state_manager,
+        demo_params=params.get("demo_params"),
+        seed=params.get("seed"),
+        fast=params.get("fast", False),
+        control_variate=params.get("control_variate", False),
+        stratified_reels=params.get("stratified_reels", 0),
+    )
+    arguments.update(overrides)
+    return Simulation(**arguments)
+
+
+def run_simulation_task(params: dict) -> dict:
+    """Run one simulation in a pool worker and return its ``summarise_simulation`` summary."""
+    simulation = build_simulation(params)
+    simulation.run()
+    return summarise_simulation(simulation)
+
+
+def exact_distribution_task(params: dict) -> PayoutDistribution:
+    """
+    Solve the exact spin payout distribution in a pool worker; ``params`` are
+    named like ``ExactDistributionRequest``'s fields.
+    """
+    config = build_configuration(params)
+    engine = SlotMachineEngine(config=config, state_manager=StateManager(initial_state={"config": config}))
+    return PayoutDistributionCalculator(engine, scatter_symbol=params.get("scatter_symbol"), icon=params.get("icon"),
+                                        blocked_reels=params.get("blocked_reels")).calculate()
+
+
+def warm_worker():
+    """Pool initializer: import the engine and build the default game's shared tables once per worker."""
+    config = Configuration()
+    state_manager = StateManager(initial_state={"config": config})
+    Simulation(config=config, bet_amount=1, num_spins=0, capital=0, plugins_with_params={},
+               state_manager=state_manager, seed=0).engine.get_payline_evaluator(0)
+
+
+class SimulationPool:
+    """
+    Long-lived worker processes shared by the multi-process simulation endpoints.
+
+    Workers are spawned once (sized to the usable CPUs) and reused, so the
+    engine is imported and the line-outcome tables, which are cached per
+    process, are built once per worker rather than once per request. With a
+    ``cache``, cacheable runs already summarised are answered from it
+    without reaching a worker.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, cache: Optional[ResultCache] = None):
+        self.max_workers = max_workers or available_cpus()
+        self.cache = cache
+        self.executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                            mp_context=multiprocessing.get_context("spawn"),
+                                            initializer=warm_worker)
+
+    def start(self):
+        """Bring every worker up now instead of on the first request."""
+        for future in [self.executor.submit(os.getpid) for _ in range(self.max_workers)]:
+            future.result()
+        logger.info(f"Simulation pool started with {self.max_workers} workers")
+
+    def submit(self, params: dict) -> Future:
+        if self.cache is None or not cacheable(params):
+            return self.executor.submit(run_simulation_task, params)
+        key = simulation_cache_key(params)
+        summary = self.cache.get(key)
+        if summary is not None:
+            future = Future()
+            future.set_result(summary)
+            return future
+        future = self.executor.submit(run_simulation_task, params)
+        future.add_done_callback(lambda done: self._store(key, done))
+        return future
+
+    def submit_task(self, function, *args) -> Future:
+        """Run ``function(*args)``, a module-level function, in a worker: CPU-bound work besides simulations."""
+        return self.executor.submit(function, *args)
+
+    def _store(self, key: str, future: Future):
+        if not future.cancelled() and future.exception() is None and not future.result()["errors"]:
+            self.cache.put(key, future.result())
+
+    def shutdown(self):
+        self.executor.shutdown(cancel_futures=True)
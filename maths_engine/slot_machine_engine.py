@@ -4,7 +4,10 @@ import sys
 import inspect
 import numpy as np
 
+from maths_engine.alias_table import AliasTable
+from maths_engine.configuration import Configuration
 from maths_engine.isaac_rng_v2 import Isaac
+from maths_engine.payline_evaluator import LINE_BET_DIVISOR, PaylineEvaluator
 from maths_engine.plugin_manager import PluginManager
 
 from maths_engine.state_manager import StateManager
@@ -12,6 +15,9 @@ from typing import Optional
 
 logger = logging.getLogger(__name__)
 
+# Symbol that may appear at most once per reel (see get_weighted_reels).
+UNIQUE_REEL_SYMBOL = 10
+
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 
@@ -23,6 +29,7 @@ class SlotMachineEngine:
         state_manager: StateManager,
         plugin_manager=None,
         plugins_with_params=None,
+        seed=None,
     ):  # Accept `plugins_with_params` as an argument
         self.logger = logging.getLogger(__name__)
         self.config = config
@@ -31,6 +38,12 @@ class SlotMachineEngine:
         self.state_manager.set("engine_lines", [])
         self.paytable = config.get_paytable(exclude=[self.config.wild_symbol])
         self.paylines = config.get_paylines()
+        # (symbol, match length) -> multiplier, for check_payline
+        self._paytable_lookup = {
+            (symbol, length): multiplier
+            for symbol, payouts in self.paytable.items()
+            for length, multiplier in payouts.items()
+        }
         self.errors = []
         self.free_spins = 0
         self.current_free_spin_winnings = 0
@@ -40,12 +53,21 @@ class SlotMachineEngine:
         self.current_total_winnings = 0
         self.current_reels = []
         self.winning_lines = []
-        self.rng = Isaac(self.state_manager)
+        # One long-lived generator per engine: the 256-word result block is
+        # consumed fully before the next ISAAC round instead of paying the
+        # seeding and __randinit__ cost on every spin.
+        self.rng = Isaac(self.state_manager, seed=seed)
 
+        # Integer weight tables, so symbol draws are exact bounded-integer picks.
+        self.weight_resolution = config.weight_resolution
         self.reel_weights = {
-            i: config.get_symbol_weights()
+            i: config.get_symbol_weights(resolution=self.weight_resolution)
             for i in range(config.columns)
         }  # Store reel weights for modification
+        # Alias tables keyed by (reel, blocked icon, excluded symbols); entries
+        # for a reel are dropped when set_reel_weights changes its weights.
+        self._alias_tables = {}
+        self._payline_evaluators = {}
 
         if plugins_with_params is not None:
             self.plugin_manager.load_plugins(
@@ -58,7 +80,6 @@ class SlotMachineEngine:
         # })
 
     def pre_spin(self, icon = Optional, blocked_reels = Optional):
-        self.rng = Isaac(self.state_manager)
         reels_from_rng = self.get_weighted_reels(self.rng, icon, blocked_reels)
         # reels_from_rng = [[2, 3, 4], [5, 9, 6], [8, 10, 2], [2, 10, 6], [3, 1, 7]]
 
@@ -101,10 +122,8 @@ class SlotMachineEngine:
 
     @staticmethod
     def convert_reels_to_lines(reels: list) -> list[list]:
-        reels_arr = np.array(reels)
-        reels_transformed = reels_arr.T
-        lines = reels_transformed.tolist()
-        return lines
+        # Plain transpose; avoids a NumPy round trip for a 5x3 grid every spin
+        return [list(line) for line in zip(*reels)]
 
     def set_reel_weights(self, reel_idx, weights):
         """Set custom weights for a specific reel."""
@@ -114,7 +133,40 @@ class SlotMachineEngine:
             raise ValueError(
                 f"Weight length must match the number of symbols: {self.config.symbols}"
             )
+        if not all(isinstance(weight, int) for weight in weights):
+            weights = Configuration.to_integer_weights(weights, self.weight_resolution)
+        weights = list(weights)
+        if weights == self.reel_weights[reel_idx]:
+            return
         self.reel_weights[reel_idx] = weights
+        self._alias_tables = {
+            key: table
+            for key, table in self._alias_tables.items() if key[0] != reel_idx
+        }
+
+    def get_alias_table(self, reel_idx, blocked_icon=None, excluded=frozenset()):
+        """
+        Cached alias table for one reel.
+
+        The wild symbol is never drawn on reel 0, ``blocked_icon`` is removed on
+        reels where it is blocked, and ``excluded`` holds symbols already used
+        up on the reel (the once-per-reel symbol).
+        """
+        key = (reel_idx, blocked_icon, excluded)
+        table = self._alias_tables.get(key)
+        if table is None:
+            removed = set(excluded)
+            if reel_idx == 0:
+                removed.add(self.config.wild_symbol)
+            if blocked_icon is not None:
+                removed.add(blocked_icon)
+            symbols = [
+                symbol for symbol in range(1, self.config.symbols + 1)
+                if symbol not in removed
+            ]
+            weights = [self.reel_weights[reel_idx][symbol - 1] for symbol in symbols]
+            table = self._alias_tables[key] = AliasTable(symbols, weights)
+        return table
 
     # def get_weighted_reels(self, rng, icon = Optional):
     #     """Select symbols for each reel using custom weighted selection with Isaac RNG."""
@@ -183,81 +235,103 @@ class SlotMachineEngine:
 
         # If blocked_reels is not provided, initialize as an empty list
         blocked_reels = blocked_reels if blocked_reels is not None else []
+        symbol_range = range(1, self.config.symbols + 1)
 
         for reel_idx in range(self.config.columns):
             reel_symbols = []
-            weights = self.reel_weights[reel_idx].copy()  # Copy to avoid mutating original weights
-            symbols = list(range(1, self.config.symbols + 1))  # Assuming symbols are 1 to N
-
-            # Block the wild symbol on the first reel (reel_idx 0)
-            if reel_idx == 0 and self.config.wild_symbol in symbols:
-                wild_index = symbols.index(self.config.wild_symbol)
-                # Set the weight of the wild symbol to zero on the first reel
-                weights[wild_index] = 0
-
-                # Optional: remove the wild symbol from the list entirely on the first reel
-                symbols.pop(wild_index)
-                weights.pop(wild_index)
-
-            # Check if the current reel index is in blocked_reels and needs to exclude the icon
-            if reel_idx in blocked_reels and icon in symbols:
-                icon_index = symbols.index(icon)
-                # Set the weight of the blocked icon to zero to exclude it entirely on this reel
-                weights[icon_index] = 0
-
-                # If you want to fully remove the symbol instead of zeroing its weight:
-                symbols.pop(icon_index)
-                weights.pop(icon_index)
-
-            # Calculate cumulative weights based on the updated symbol list and modified weights
-            cumulative_weights = self._calculate_cumulative_weights(weights)
+            # Exclude the icon entirely on reels where it is blocked
+            blocked_icon = icon if reel_idx in blocked_reels and icon in symbol_range else None
+            table = self.get_alias_table(reel_idx, blocked_icon)
 
             for _ in range(self.config.rows):
                 # Select a symbol, but only allow '10' to appear once per reel
-                chosen_symbol = self._select_symbol_with_weights(
-                    rng, symbols, cumulative_weights, icon
-                )
+                chosen_symbol = table.sample(rng)
                 reel_symbols.append(chosen_symbol)
 
-                # If '10' is selected, remove it from symbols and weights to prevent further selection
-                if chosen_symbol == 10 and 10 in symbols:  # FIXME: With this implementation, the symbol 10 will appear at most once per reel during the selection process. Should be changed to now overwrite 10 symbol.
-                    index_10 = symbols.index(10)
-                    symbols.pop(index_10)
-                    weights.pop(index_10)
-
-                    # Recalculate cumulative weights after modifying the symbol pool
-                    cumulative_weights = self._calculate_cumulative_weights(weights)
+                # If '10' is selected, draw the rest of the reel without it
+                if chosen_symbol == UNIQUE_REEL_SYMBOL:  # FIXME: With this implementation, the symbol 10 will appear at most once per reel during the selection process. Should be changed to now overwrite 10 symbol.
+                    table = self.get_alias_table(
+                        reel_idx, blocked_icon, frozenset((UNIQUE_REEL_SYMBOL,)))
 
             reels.append(reel_symbols)
 
         return reels
 
-    @staticmethod
-    def _calculate_cumulative_weights(weights):
-        """Calculate cumulative weights for selection."""
-        cumulative_weights = []
-        total = 0
-        for weight in weights:
-            total += weight
-            cumulative_weights.append(total)
-        return cumulative_weights
-
-    @staticmethod
-    def _select_symbol_with_weights(rng, symbols, cumulative_weights, icon= Optional):
-        """Select a symbol based on weights using Isaac RNG."""
-        total_weight = cumulative_weights[-1]
-        rand_value = rng.rand(mod=total_weight, icon=icon)
+    def generate_grids(self, n, icon=None, blocked_reels=None, rng=None, leading_columns=None) -> np.ndarray:
+        """
+        generate_grids - Draw ``n`` spins at once.
 
-        for i, cumulative_weight in enumerate(cumulative_weights):
-            if rand_value <= cumulative_weight:
-                return symbols[i]
+        Follows the same rules as get_weighted_reels: no wild on reel 0, the
+        icon removed on ``blocked_reels`` and symbol 10 at most once per reel.
 
-        return symbols[-1]  # Fallback in case of rounding errors
+        Args:
+            n (int): Number of spins to draw.
+            icon (int, optional): Icon excluded on ``blocked_reels``.
+            blocked_reels (list, optional): Reels on which ``icon`` is blocked.
+            rng (optional): Generator with ``randbelow_batch``; defaults to the
+                engine's own stream.
+            leading_columns (np.ndarray, optional): ``(n, k, rows)`` columns of
+                the first ``k`` reels, such as a ``ColumnStrata`` sample; only
+                the other reels are drawn.
+        Returns:
+            np.ndarray: ``(n, columns, rows)`` array of symbols as ``uint8``,
+            laid out like ``engine_reels`` for every spin.
+        """
+        if self.config.symbols > np.iinfo(np.uint8).max:
+            raise ValueError(f"Too many symbols for uint8 grids: {self.config.symbols}")
+        blocked_reels = blocked_reels if blocked_reels is not None else []
+        rng = rng if rng is not None else self.rng
+        symbol_range = range(1, self.config.symbols + 1)
+        grids = np.empty((n, self.config.columns, self.config.rows), dtype=np.uint8)
+        drawn_from = 0
+        if leading_columns is not None:
+            drawn_from = leading_columns.shape[1]
+            grids[:, :drawn_from, :] = leading_columns
+
+        for reel_idx in range(drawn_from, self.config.columns):
+            blocked_icon = icon if reel_idx in blocked_reels and icon in symbol_range else None
+            table = self.get_alias_table(reel_idx, blocked_icon)
+            reduced_table = None
+            if UNIQUE_REEL_SYMBOL in table.symbols:
+                reduced_table = self.get_alias_table(
+                    reel_idx, blocked_icon, frozenset((UNIQUE_REEL_SYMBOL,)))
+            seen = np.zeros(n, dtype=bool)
+
+            for row in range(self.config.rows):
+                if reduced_table is None or not seen.any():
+                    cells = table.sample_batch(rng, n)
+                else:
+                    # Spins that already have a 10 on this reel draw without it
+                    cells = np.empty(n, dtype=np.uint8)
+                    cells[~seen] = table.sample_batch(rng, n - int(seen.sum()))
+                    cells[seen] = reduced_table.sample_batch(rng, int(seen.sum()))
+                if reduced_table is not None:
+                    seen |= cells == UNIQUE_REEL_SYMBOL
+                grids[:, reel_idx, row] = cells
+
+        return grids
+
+    def get_payline_evaluator(self, scatter_symbol=None) -> PaylineEvaluator:
+        """Compiled batch evaluator for this engine's paylines and paytable."""
+        evaluator = self._payline_evaluators.get(scatter_symbol)
+        if evaluator is None:
+            evaluator = self._payline_evaluators[scatter_symbol] = PaylineEvaluator(
+                paylines=self.paylines,
+                paytable=self.paytable,
+                wild_symbol=self.config.wild_symbol,
+                scatter_symbol=scatter_symbol,
+                columns=self.config.columns,
+                rows=self.config.rows,
+                symbols=self.config.symbols,
+            )
+        return evaluator
 
     def calculate_winnings(self):
         # self.logger.debug("Calculating winnings.")
         from icecream import ic
         self.current_total_winnings = 0
+        # Winning lines describe the current spin only
+        self.winning_lines = []
         self.state_manager.set("engine_lines", self.lines)
         confirmed_lines = self.check_wins(
             slot_results=self.state_manager.get("engine_reels"))
@@ -323,6 +397,7 @@ class SlotMachineEngine:
         # Get the number of rows and columns
         num_rows = len(slot_results[0])  # Assuming at least one column exists
         num_cols = len(slot_results)      # Number of columns is the length of the outer array
+        outcome_table = self.get_line_outcome_table(scatter_symbol)
 
         for line_index, line_v in enumerate(self.paylines):
             line = []
@@ -340,6 +415,14 @@ class SlotMachineEngine:
                 else:
                     logging.error(f"Expected tuple for position at index {idx}, got: {pos}")
 
+            # Regular lines are a single lookup in the precomputed outcome table
+            code = outcome_table.encode_line(line) if outcome_table is not None else None
+            if code is not None:
+                win_length = outcome_table.length_list[code]
+                if win_length:
+                    all_win_lines.append([line_index + 1, line[:win_length]])
+                continue
+
             # Refined condition to allow winning lines with wild and scatter if wild contributes to win
             if wild_symbol in line and scatter_symbol in line:
                 # Check if scatter symbol interferes with potential win
@@ -387,6 +470,14 @@ class SlotMachineEngine:
 
         return all_win_lines
 
+    def get_line_outcome_table(self, scatter_symbol=None):
+        """Shared line-outcome table for this engine's paytable, or None if unavailable."""
+        try:
+            return self.get_payline_evaluator(scatter_symbol).outcome_table
+        except ValueError:
+            # Paylines that do not fit the grid are reported line by line in check_wins
+            return None
+
     def calculate_symbols_position(self, wl: list) -> list:
         line_index = wl[0]-1
         sequence_length = len(wl[1])
@@ -470,12 +561,12 @@ class SlotMachineEngine:
         payout_multiplier = len(win_line[1])
         bet_amount = self.bet_amount
 
-        bet_amount_per_line = bet_amount / 20  #divided by 20 because we have 20 payline (need to build this dynamically)
-        payout_symbol = self.exclude_wild_symbol(win_line[1])
-        if (payout_symbol in self.paytable
-                and payout_multiplier in self.paytable[payout_symbol]):
-            line_payout = (bet_amount_per_line *
-                           self.paytable[payout_symbol][payout_multiplier])
+        bet_amount_per_line = bet_amount / LINE_BET_DIVISOR  #divided by 20 because we have 20 payline (need to build this dynamically)
+        wild_symbol = self.config.wild_symbol
+        payout_symbol = next((symbol for symbol in win_line[1] if symbol != wild_symbol), None)
+        multiplier = self._paytable_lookup.get((payout_symbol, payout_multiplier))
+        if multiplier is not None:
+            line_payout = bet_amount_per_line * multiplier
 
             return line_payout
         return 0
@@ -0,0 +1,278 @@
+# maths_engine/spin_statistics.py
+import math
+from statistics import NormalDist
+from typing import Optional
+
+import numpy as np
+
+# Confidence of the sequential stopping interval unless the caller picks one
+DEFAULT_CONFIDENCE = 0.95
+
+# Win multiplier histogram: bucket 0 holds the spins without a win, bucket b >= 1 the returns in
+# [HISTOGRAM_MIN_RETURN * 2 ** ((b - 1) / HISTOGRAM_BUCKETS_PER_DOUBLING), ... * 2 ** (b / ...)),
+# the first and last buckets also taking the returns below and above the covered range.
+HISTOGRAM_BUCKETS_PER_DOUBLING = 8
+HISTOGRAM_MIN_RETURN = 2.0 ** -10
+HISTOGRAM_DOUBLINGS = 30
+HISTOGRAM_BUCKETS = 1 + HISTOGRAM_DOUBLINGS * HISTOGRAM_BUCKETS_PER_DOUBLING
+# Quantiles of the win multiplier reported by return_statistics
+DEFAULT_QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+
+def new_moments() -> dict:
+    """
+    Empty running moments of per-spin returns: spin count, mean, sum of
+    squared deviations (Welford's ``M2``) and the largest return.
+    """
+    return {"count": 0, "mean": 0.0, "m2": 0.0, "max": 0.0}
+
+
+def add_return(moments: dict, value: float):
+    """Welford update of ``moments`` in place with one spin's return."""
+    count = moments["count"] + 1
+    delta = value - moments["mean"]
+    mean = moments["mean"] + delta / count
+    moments["count"], moments["mean"] = count, mean
+    moments["m2"] += delta * (value - mean)
+    if value > moments["max"]:
+        moments["max"] = value
+
+
+def add_returns(moments: dict, values: np.ndarray):
+    """Add a batch of returns to ``moments`` in place, merging its own moments in one step."""
+    if values.size:
+        mean = float(values.mean())
+        batch = {"count": int(values.size), "mean": mean, "m2": float(np.square(values - mean).sum()),
+                 "max": float(values.max())}
+        moments.update(merge_moments(moments, batch))
+
+
+def merge_moments(*moments: dict) -> dict:
+    """Moments of the union of the spins behind each of ``moments`` (Chan et al.'s pairwise update)."""
+    merged = new_moments()
+    for other in moments:
+        if other["count"] == 0:
+            continue
+        count = merged["count"] + other["count"]
+        delta = other["mean"] - merged["mean"]
+        merged["m2"] += other["m2"] + delta * delta * merged["count"] * other["count"] / count
+        merged["mean"] += delta * other["count"] / count
+        merged["count"] = count
+        merged["max"] = max(merged["max"], other.get("max", 0.0))
+    return merged
+
+
+def return_bucket(value: float) -> int:
+    """Win multiplier histogram bucket of one return."""
+    if value <= 0:
+        return 0
+    bucket = math.floor(math.log2(value / HISTOGRAM_MIN_RETURN) * HISTOGRAM_BUCKETS_PER_DOUBLING) + 1
+    return min(max(bucket, 1), HISTOGRAM_BUCKETS - 1)
+
+
+def return_buckets(values: np.ndarray) -> np.ndarray:
+    """``return_bucket`` of every value of an array."""
+    buckets = np.zeros(values.shape, dtype=np.int64)
+    positive = values > 0
+    scaled = np.floor(np.log2(values[positive] / HISTOGRAM_MIN_RETURN) * HISTOGRAM_BUCKETS_PER_DOUBLING) + 1
+    buckets[positive] = np.clip(scaled, 1, HISTOGRAM_BUCKETS - 1)
+    return buckets
+
+
+def add_to_histogram(histogram: dict, values: np.ndarray):
+    """Count a batch of returns into a ``{bucket: spins}`` histogram in place."""
+    counts = np.bincount(return_buckets(values))
+    for bucket in np.flatnonzero(counts).tolist():
+        histogram[bucket] = histogram.get(bucket, 0) + int(counts[bucket])
+
+
+def bucket_upper_bound(bucket: int) -> float:
+    """Largest return a histogram bucket holds, 0 for the no-win bucket."""
+    if bucket == 0:
+        return 0.0
+    return HISTOGRAM_MIN_RETURN * 2.0 ** (bucket / HISTOGRAM_BUCKETS_PER_DOUBLING)
+
+
+def return_percentiles(histogram: dict, maximum: float, quantiles=DEFAULT_QUANTILES) -> dict:
+    """
+    Win multiplier quantiles from a ``{bucket: spins}`` histogram, named like
+    ``p99.9``. Each is the upper bound of the bucket it falls in, so at most
+    one bucket width (about 9%) above the exact value, and never above the
+    largest return seen.
+    """
+    counts = sorted((int(bucket), spins) for bucket, spins in histogram.items())
+    total = sum(spins for _, spins in counts)
+    percentiles = {}
+    for quantile in quantiles:
+        name = f"p{quantile * 100:g}"
+        if total == 0:
+            percentiles[name] = None
+            continue
+        cumulative = 0
+        for bucket, spins in counts:
+            cumulative += spins
+            if cumulative >= quantile * total:
+                # The last bucket is open-ended
+                percentiles[name] = maximum if bucket == HISTOGRAM_BUCKETS - 1 else \
+                    min(bucket_upper_bound(bucket), maximum)
+                break
+    return percentiles
+
+
+def return_statistics(moments: dict, histogram: dict) -> dict:
+    """Per-spin return summary, in multiples of the bet: mean, spread, largest win and win quantiles."""
+    variance = moments_variance(moments)
+    return {
+        "spins": moments["count"],
+        "mean": moments["mean"],
+        "variance": variance,
+        "std_dev": math.sqrt(variance),
+        "max": moments["max"],
+        "percentiles": return_percentiles(histogram, moments["max"]),
+    }
+
+
+def moments_variance(moments: dict) -> float:
+    """Sample variance of the returns, 0 with fewer than two spins."""
+    return moments["m2"] / (moments["count"] - 1) if moments["count"] > 1 else 0.0
+
+
+def z_value(confidence: float) -> float:
+    """Two-sided normal quantile of ``confidence``, e.g. 1.96 for 0.95."""
+    if not 0 < confidence < 1:
+        raise ValueError(f"Confidence must be between 0 and 1, got {confidence}")
+    return NormalDist().inv_cdf((1 + confidence) / 2)
+
+
+def new_round() -> dict:
+    """
+    An empty round: a paid spin and the free spins it leads to, which
+    follow each other and so are not independent. Rounds are, so RTP
+    intervals come from round moments rather than spin moments.
+    """
+    return {"spins": 0, "value": 0.0, "control": 0.0}
+
+
+def close_round(open_round: dict, moments: dict, control_moments: Optional[dict] = None):
+    """Add a finished round to the round ``moments`` (and ``control_moments``) and empty it."""
+    add_return(moments, open_round["value"])
+    if control_moments is not None:
+        add_control(control_moments, open_round["value"], open_round["control"])
+    open_round.update(new_round())
+
+
+def with_open_round(moments: dict, open_round: dict, control: bool = False) -> dict:
+    """Round moments (``control`` for co-moments) that also count the round still in play."""
+    if not open_round["spins"]:
+        return dict(moments)
+    if control:
+        return merge_control_moments(moments, {"count": 1, "mean": open_round["value"],
+                                               "control_mean": open_round["control"], "m2": 0.0,
+                                               "control_m2": 0.0, "comoment": 0.0})
+    return merge_moments(moments, {"count": 1, "mean": open_round["value"], "m2": 0.0,
+                                   "max": open_round["value"]})
+
+
+def rtp_half_width(moments: dict, total_bets: float, bet_amount: float, confidence: float) -> float:
+    """
+    Half-width, in RTP percentage points, of the normal confidence interval
+    of a run's RTP from the moments of its per-round returns (winnings /
+    bet). Rounds are independent and have one bet each, so their mean return
+    is the RTP. Infinite before two rounds are played.
+    """
+    if moments["count"] < 2 or total_bets <= 0:
+        return math.inf
+    standard_error = math.sqrt(moments_variance(moments) / moments["count"])
+    return 100 * z_value(confidence) * standard_error * moments["count"] * bet_amount / total_bets
+
+
+def new_control_moments() -> dict:
+    """
+    Empty running co-moments of returns and a zero-mean control: count, both
+    means, both sums of squared deviations and the sum of cross deviations.
+    """
+    return {"count": 0, "mean": 0.0, "control_mean": 0.0, "m2": 0.0, "control_m2": 0.0, "comoment": 0.0}
+
+
+def add_control(moments: dict, value: float, control: float):
+    """Welford update of ``moments`` in place with one return and its control."""
+    count = moments["count"] + 1
+    delta = value - moments["mean"]
+    control_delta = control - moments["control_mean"]
+    moments["count"] = count
+    moments["mean"] += delta / count
+    moments["control_mean"] += control_delta / count
+    moments["m2"] += delta * (value - moments["mean"])
+    moments["control_m2"] += control_delta * (control - moments["control_mean"])
+    moments["comoment"] += delta * (control - moments["control_mean"])
+
+
+def add_controls(moments: dict, values: np.ndarray, controls: np.ndarray):
+    """Add a batch of returns and controls to ``moments`` in place."""
+    if values.size:
+        mean, control_mean = float(values.mean()), float(controls.mean())
+        deviations, control_deviations = values - mean, controls - control_mean
+        batch = {"count": int(values.size), "mean": mean, "control_mean": control_mean,
+                 "m2": float(np.dot(deviations, deviations)),
+                 "control_m2": float(np.dot(control_deviations, control_deviations)),
+                 "comoment": float(np.dot(deviations, control_deviations))}
+        moments.update(merge_control_moments(moments, batch))
+
+
+def merge_control_moments(*moments: dict) -> dict:
+    """Co-moments of the union of the spins behind each of ``moments``."""
+    merged = new_control_moments()
+    for other in moments:
+        if other["count"] == 0:
+            continue
+        count = merged["count"] + other["count"]
+        weight = merged["count"] * other["count"] / count
+        delta = other["mean"] - merged["mean"]
+        control_delta = other["control_mean"] - merged["control_mean"]
+        merged["m2"] += other["m2"] + delta * delta * weight
+        merged["control_m2"] += other["control_m2"] + control_delta * control_delta * weight
+        merged["comoment"] += other["comoment"] + delta * control_delta * weight
+        merged["mean"] += delta * other["count"] / count
+        merged["control_mean"] += control_delta * other["count"] / count
+        merged["count"] = count
+    return merged
+
+
+def control_variate_estimate(moments: dict, total_bets: float, bet_amount: float) -> Optional[dict]:
+    """
+    RTP adjusted with a zero-mean control, with the optimal coefficient
+    (the regression slope of the returns on the control) estimated from the
+    same rounds, next to the raw RTP. Standard errors are in RTP percentage
+    points, scaled like ``rtp_half_width``; ``variance_reduction`` is how
+    many times fewer rounds the adjusted estimate needs for the raw one's
+    precision. None before three rounds.
+    """
+    count = moments["count"]
+    if count < 3 or total_bets <= 0:
+        return None
+    scale = 100 * count * bet_amount / total_bets
+    coefficient = moments["comoment"] / moments["control_m2"] if moments["control_m2"] > 0 else 0.0
+    residual_m2 = max(moments["m2"] - coefficient * moments["comoment"], 0.0)
+    raw_variance = moments["m2"] / (count - 1)
+    # One degree of freedom more goes to the fitted coefficient
+    variance = residual_m2 / (count - 2)
+    return {
+        "coefficient": coefficient,
+        "rtp": (moments["mean"] - coefficient * moments["control_mean"]) * scale,
+        "rtp_standard_error": math.sqrt(variance / count) * scale,
+        "raw_rtp": moments["mean"] * scale,
+        "raw_rtp_standard_error": math.sqrt(raw_variance / count) * scale,
+        "variance_reduction": raw_variance / variance if variance > 0 else None,
+    }
+
+
+def replicate_rtp_half_width(moments: dict, confidence: float) -> float:
+    """
+    Half-width, in RTP percentage points, of the normal confidence interval
+    of an RTP estimated by the mean of independent replicates, such as full
+    stratified batches, from the moments of the replicates' mean returns.
+    Infinite before two replicates.
+    """
+    if moments["count"] < 2:
+        return math.inf
+    return 100 * z_value(confidence) * math.sqrt(moments_variance(moments) / moments["count"])
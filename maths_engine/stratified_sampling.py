@@ -0,0 +1,67 @@
+# maths_engine/stratified_sampling.py
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from maths_engine.exact_rtp import ExactRtpCalculator
+from maths_engine.isaac_rng_v2 import mod
+
+# Leading reels whose joint column outcomes may be stratified
+MAX_STRATIFIED_REELS = 2
+# Largest number of joint column outcomes kept as strata
+MAX_STRATA = 1 << 21
+
+
+class ColumnStrata:
+    """
+    Joint column outcomes of a game's first ``reels`` reels, the strata of
+    stratified sampling, with their exact probabilities.
+
+    The outcomes and probabilities are those ``get_weighted_reels`` draws
+    from (as computed by ``ExactRtpCalculator.column_distribution``), and a
+    sample of ``n`` columns takes one point from each of the ``n`` equal
+    slices of ``[0, 1)`` through the outcomes' cumulative probabilities.
+    Every outcome thus appears within two of ``n`` times its probability,
+    and the sample is shuffled, so any single draw, or any prefix of the
+    sample, still follows the column distribution exactly.
+    """
+
+    def __init__(self, engine, reels: int, icon: Optional[int] = None, blocked_reels: Optional[List[int]] = None):
+        if not 1 <= reels <= min(MAX_STRATIFIED_REELS, engine.config.columns - 1):
+            raise ValueError(f"Stratified reels must be between 1 and "
+                             f"{min(MAX_STRATIFIED_REELS, engine.config.columns - 1)}, got {reels}")
+        calculator = ExactRtpCalculator(engine, icon=icon, blocked_reels=blocked_reels)
+        columns = np.zeros((1, 0, engine.config.rows), dtype=np.uint8)
+        probabilities = np.ones(1)
+        for reel_idx in range(reels):
+            distribution = calculator.column_distribution(reel_idx)
+            reel_columns = np.array(list(distribution), dtype=np.uint8)
+            if probabilities.size * reel_columns.shape[0] > MAX_STRATA:
+                raise ValueError(f"Too many strata over {reels} reels: more than {MAX_STRATA}")
+            # Every outcome so far followed by every column of this reel
+            columns = np.concatenate([np.repeat(columns, reel_columns.shape[0], axis=0),
+                                      np.tile(reel_columns[:, None, :], (columns.shape[0], 1, 1))], axis=1)
+            probabilities = np.multiply.outer(probabilities, np.fromiter(distribution.values(), float)).ravel()
+
+        self.reels = reels
+        self.columns = columns
+        self.probabilities = probabilities
+        self.cumulative = np.cumsum(probabilities)
+        self.size = probabilities.size
+
+    def sample(self, rng, n: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Stratified draw of ``n`` leading columns with ``rng`` (a generator
+        with ``randbelow_batch``).
+
+        Returns:
+            tuple: ``(columns, strata)``, the ``(n, reels, rows)`` columns and
+            each draw's stratum, the index of its outcome.
+        """
+        # A random order of the slices, then a uniform point within each
+        order = np.argsort(rng.randbelow_batch(n, mod), kind="stable")
+        offsets = (rng.randbelow_batch(n, mod) + 0.5) / mod
+        strata = np.searchsorted(self.cumulative, (order + offsets) / n, side="right")
+        # The cumulative sum may end a rounding error short of 1
+        np.minimum(strata, self.size - 1, out=strata)
+        return self.columns[strata], strata
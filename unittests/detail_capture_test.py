@@ -0,0 +1,117 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+
+from fastapi import HTTPException
+
+from unittests.base_test import BaseTest
+from api.routes_simulation import download_detailed_results
+from maths_engine.configuration import Configuration
+from maths_engine.detail_capture import DetailCapture, detail_stream_path, prune_detail_streams
+from maths_engine.simulation import Simulation
+from maths_engine.state_manager import StateManager
+
+
+class DetailCaptureTest(BaseTest, unittest.TestCase):
+
+    def _run(self, num_spins, detail_capture=None):
+        config = Configuration()
+        state_manager = StateManager(initial_state={"config": config})
+        simulation = Simulation(config=config, bet_amount=1, num_spins=num_spins, capital=10**6,
+                                plugins_with_params={}, state_manager=state_manager, seed=5,
+                                detail_capture=detail_capture)
+        simulation.run()
+        return simulation.get_results(detail_level="detailed")
+
+    def test_default_keeps_nothing(self):
+        self.assertEqual(self._run(50)["detailed_results"], [])
+
+    def test_ring_keeps_last_spins(self):
+        results = self._run(50, DetailCapture(mode="ring", size=10))
+        self.assertEqual([record["spin"] for record in results["detailed_results"]], list(range(40, 50)))
+
+    def test_every_and_threshold(self):
+        results = self._run(50, DetailCapture(mode="every", every=20))
+        self.assertEqual([record["spin"] for record in results["detailed_results"]], [0, 20, 40])
+
+        capture = DetailCapture(mode="threshold", size=3, threshold=0.5)
+        results = self._run(200, capture)
+        self.assertEqual(len(results["detailed_results"]), 3)
+
+        # A threshold of 0 keeps the winning spins only
+        capture = DetailCapture(mode="threshold")
+        self.assertFalse(capture.wants(0, 0.0, 1))
+        self.assertTrue(capture.wants(0, 0.05, 1))
+
+    def test_stream_writes_every_spin(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "detail.jsonl")
+            results = self._run(30, DetailCapture(mode="stream", path=path))
+            self.assertEqual(results["detailed_results"], [])
+            self.assertEqual(results["detailed_results_path"], path)
+            with open(path) as stream:
+                spins = [json.loads(line)["spin"] for line in stream]
+        self.assertEqual(spins, list(range(30)))
+
+    def test_streams_are_served_by_id(self):
+        stream_id = "0123456789abcdef" * 2
+        results = self._run(30, DetailCapture(mode="stream", stream_id=stream_id))
+        path = detail_stream_path(stream_id)
+        try:
+            self.assertEqual(results["detailed_results_id"], stream_id)
+            self.assertNotIn("detailed_results_path", results)
+            response = asyncio.run(download_detailed_results(stream_id))
+            self.assertEqual(response.path, path)
+        finally:
+            os.remove(path)
+        for missing in (stream_id, "../simulation_cache"):
+            with self.assertRaises(HTTPException) as refused:
+                asyncio.run(download_detailed_results(missing))
+            self.assertEqual(refused.exception.status_code, 404)
+
+    def test_streams_are_bounded(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "detail.jsonl")
+            results = self._run(30, DetailCapture(mode="stream", path=path, max_bytes=2000))
+            self.assertTrue(results["detailed_results_truncated"])
+            self.assertLessEqual(os.path.getsize(path), 2000)
+
+        # The oldest streams go first
+        with tempfile.TemporaryDirectory() as directory:
+            for index in range(5):
+                with open(detail_stream_path(f"{index:032x}", directory), "w") as stream:
+                    stream.write("{}\n")
+                os.utime(stream.name, ns=(index * 10**9, index * 10**9))
+            prune_detail_streams(directory, keep=2)
+            self.assertEqual(sorted(os.listdir(directory)), [f"{3:032x}.jsonl", f"{4:032x}.jsonl"])
+
+    def test_rejects_bad_settings(self):
+        with self.assertRaises(ValueError):
+            DetailCapture(mode="all")
+        with self.assertRaises(ValueError):
+            DetailCapture(mode="stream")
+
+    def run_test(self):
+        try:
+            self.test_default_keeps_nothing()
+            self.test_ring_keeps_last_spins()
+            self.test_every_and_threshold()
+            self.test_stream_writes_every_spin()
+            self.test_streams_are_served_by_id()
+            self.test_streams_are_bounded()
+            self.test_rejects_bad_settings()
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e),
+            }
+        return {
+            'success': True,
+        }
+
+
+def run_test():
+    test = DetailCaptureTest()
+    return test.run_test()
@@ -0,0 +1,62 @@
+import itertools
+import unittest
+
+from unittests.base_test import BaseTest
+from maths_engine.configuration import Configuration
+from maths_engine.exact_rtp import ExactRtpCalculator
+from maths_engine.slot_machine_engine import SlotMachineEngine, UNIQUE_REEL_SYMBOL
+from maths_engine.state_manager import StateManager
+
+
+class ExactRtpTest(BaseTest, unittest.TestCase):
+
+    def _engine(self, **config_params):
+        config = Configuration(**config_params)
+        state_manager = StateManager(initial_state={"config": config})
+        return SlotMachineEngine(config=config, state_manager=state_manager, seed=1)
+
+    def test_matches_brute_force_enumeration(self):
+        # One row keeps the full grid space small enough to enumerate.
+        engine = self._engine(rows=1, symbols=4, wild_symbol=3,
+                              custom_paylines={"line_1": [(0, 0), (1, 0), (2, 0), (3, 0), (4, 0)]})
+        engine.bet_amount = 20
+        calculator = ExactRtpCalculator(engine)
+        reels = [calculator.column_distribution(reel_idx) for reel_idx in range(5)]
+
+        expected = 0.0
+        for grid in itertools.product(*(reel.items() for reel in reels)):
+            probability = 1.0
+            for _, column_probability in grid:
+                probability *= column_probability
+            slot_results = [list(column) for column, _ in grid]
+            payout = sum(engine.check_payline(line) for line in engine.check_wins(slot_results))
+            expected += probability * payout
+
+        self.assertAlmostEqual(calculator.calculate()["rtp"], expected / 20 * 100, places=9)
+
+    def test_column_distribution_rules(self):
+        engine = self._engine()
+        calculator = ExactRtpCalculator(engine, icon=10, blocked_reels=[4])
+        first = calculator.column_distribution(0)
+        self.assertAlmostEqual(sum(first.values()), 1.0)
+        self.assertFalse(any(engine.config.wild_symbol in column for column in first))
+        self.assertFalse(any(column.count(UNIQUE_REEL_SYMBOL) > 1 for column in first))
+        self.assertFalse(any(10 in column for column in calculator.column_distribution(4)))
+
+    def run_test(self):
+        try:
+            self.test_matches_brute_force_enumeration()
+            self.test_column_distribution_rules()
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e),
+            }
+        return {
+            'success': True,
+        }
+
+
+def run_test():
+    test = ExactRtpTest()
+    return test.run_test()
@@ -0,0 +1,55 @@
+import unittest
+
+from unittests.base_test import BaseTest
+from maths_engine.configuration import Configuration
+from maths_engine.simulation import Simulation
+from maths_engine.state_manager import StateManager
+
+FREE_SPINS = {"free_spins": {"blocked_reels": [0, 4], "icon": 10, "multiplier": 1}}
+
+
+class FreeSpinsPluginTest(BaseTest, unittest.TestCase):
+
+    def _run(self, num_spins, fast=False):
+        config = Configuration()
+        state_manager = StateManager(initial_state={"config": config})
+        simulation = Simulation(config=config, bet_amount=1, num_spins=num_spins, capital=10**6,
+                                plugins_with_params=FREE_SPINS, state_manager=state_manager, seed=21, fast=fast)
+        simulation.run()
+        return simulation
+
+    def _check_counters(self, simulation):
+        results = simulation.get_results()
+        spin_count = simulation.state_manager.get("spin_count")
+        self.assertEqual(sum(results["free_spins_icon_counts"].values()), spin_count)
+        self.assertEqual(results["free_spins_played"],
+                         results["total_free_spins_won"] - results["current_free_spins"])
+        self.assertGreater(results["free_spins_triggers"], 0)
+        # Only the last spin's icon positions are kept
+        self.assertEqual(len(results["free_spins_detail"]), 1)
+
+    def test_per_spin_state_is_reset(self):
+        simulation = self._run(3000)
+        self._check_counters(simulation)
+        self.assertLessEqual(len(simulation.engine.winning_lines), len(simulation.engine.paylines))
+
+    def test_fast_kernel_keeps_the_same_counters(self):
+        self._check_counters(self._run(20_000, fast=True))
+
+    def run_test(self):
+        try:
+            self.test_per_spin_state_is_reset()
+            self.test_fast_kernel_keeps_the_same_counters()
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e),
+            }
+        return {
+            'success': True,
+        }
+
+
+def run_test():
+    test = FreeSpinsPluginTest()
+    return test.run_test()
@@ -0,0 +1,102 @@
+import math
+import unittest
+
+import numpy as np
+
+from unittests.base_test import BaseTest
+from maths_engine.configuration import Configuration
+from maths_engine.free_spins_solver import FreeSpinsSolver
+from maths_engine.plugins.free_spins import FreeSpinsPlugin
+from maths_engine.simulation_pool import build_configuration, build_simulation
+from maths_engine.slot_machine_engine import SlotMachineEngine
+from maths_engine.state_manager import StateManager
+from unittests.simulation_pool_test import PARAMS
+
+
+class FreeSpinsSolverTest(BaseTest, unittest.TestCase):
+
+    def setUp(self):
+        self.config = Configuration()
+        self.engine = SlotMachineEngine(config=self.config,
+                                        state_manager=StateManager(initial_state={"config": self.config}),
+                                        seed=3)
+        self.solver = FreeSpinsSolver(self.engine, icon=10, blocked_reels=[0, 4])
+
+    def test_awards_follow_plugin_rules(self):
+        self.assertEqual([FreeSpinsPlugin.free_spins_awarded(count, False) for count in range(5)],
+                         [0, 0, 0, 10, 10])
+        self.assertEqual([FreeSpinsPlugin.free_spins_awarded(count, True) for count in range(5)],
+                         [0, 2, 4, 10, 10])
+
+    def test_icon_counts_skip_blocked_reels(self):
+        counts = self.solver.icon_count_distribution()
+        self.assertAlmostEqual(counts.sum(), 1.0)
+        # Symbol 10 lands at most once per reel and only reels 1-3 count.
+        self.assertEqual(np.count_nonzero(counts), 4)
+
+    def test_chain_matches_wald_identity(self):
+        # The balance falls by exactly one per spin, so from r spins the feature lasts r / (1 - E[award]).
+        retrigger = {0: 0.7, 2: 0.25, 4: 0.04, 10: 0.01}
+        expected_award = sum(won * probability for won, probability in retrigger.items())
+        remaining_spins = self.solver.expected_remaining_spins(retrigger)
+        for remaining in (1, 10, 25):
+            self.assertAlmostEqual(remaining_spins[remaining - 1], remaining / (1 - expected_award), places=6)
+
+        with self.assertRaises(ValueError):
+            self.solver.expected_remaining_spins({0: 0.5, 4: 0.5})
+
+    def test_feature_breakdown_adds_up(self):
+        result = self.solver.calculate()
+        self.assertAlmostEqual(result["rtp"], result["base_rtp"] + result["feature_rtp"])
+        self.assertAlmostEqual(result["expected_feature_spins"], 10 / (1 - result["expected_retrigger_spins"]),
+                               places=6)
+        self.assertAlmostEqual(result["feature_rtp"],
+                               result["trigger_probability"] * result["expected_feature_payout"] * 100)
+
+    def test_matches_simulation(self):
+        config = build_configuration(PARAMS)
+        engine = SlotMachineEngine(config=config, state_manager=StateManager(initial_state={"config": config}))
+        exact = FreeSpinsSolver(engine, icon=10, blocked_reels=[0, 4]).calculate()
+        simulation = build_simulation({**PARAMS, "num_spins": 200_000})
+        simulation.run()
+        results = simulation.get_results()
+        rounds = simulation.round_moments()
+        paid_spins = rounds["count"]
+
+        rtp_error = 100 * math.sqrt(rounds["m2"] / (paid_spins - 1) / paid_spins)
+        self.assertLess(abs(results["rtp"] - exact["rtp"]), 4 * rtp_error)
+
+        trigger_probability = results["free_spins_triggers"] / paid_spins
+        trigger_error = math.sqrt(trigger_probability * (1 - trigger_probability) / paid_spins)
+        self.assertLess(abs(trigger_probability - exact["trigger_probability"]), 4 * trigger_error)
+
+        # A feature lasts 10 / (1 - mean award per free spin); its error follows the awards' spread
+        award = exact["expected_retrigger_spins"]
+        award_variance = sum(won ** 2 * probability
+                             for won, probability in exact["retrigger_probabilities"].items()) - award ** 2
+        feature_error = 10 / (1 - award) ** 2 * math.sqrt(award_variance / results["free_spins_played"])
+        self.assertEqual(results["current_free_spins"], 0)
+        feature_spins = results["free_spins_played"] / results["free_spins_triggers"]
+        self.assertLess(abs(feature_spins - exact["expected_feature_spins"]), 4 * feature_error)
+
+    def run_test(self):
+        try:
+            self.setUp()
+            self.test_awards_follow_plugin_rules()
+            self.test_icon_counts_skip_blocked_reels()
+            self.test_chain_matches_wald_identity()
+            self.test_feature_breakdown_adds_up()
+            self.test_matches_simulation()
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e),
+            }
+        return {
+            'success': True,
+        }
+
+
+def run_test():
+    test = FreeSpinsSolverTest()
+    return test.run_test()
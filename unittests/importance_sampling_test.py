@@ -0,0 +1,121 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+from fastapi import HTTPException
+
+from unittests.base_test import BaseTest
+from api.routes_simulation import ImportanceSamplingRequest, run_importance_sampling
+from maths_engine.configuration import Configuration
+from maths_engine.exact_rtp import ExactRtpCalculator
+from maths_engine.importance_sampling import MAX_IMPORTANCE_SPINS, ImportanceSampler
+from maths_engine.isaac_rng_v2 import IsaacLanes
+from maths_engine.payout_distribution import PayoutDistributionCalculator
+from maths_engine.simulation_pool import SimulationPool, build_simulation
+from maths_engine.slot_machine_engine import SlotMachineEngine
+from maths_engine.state_manager import StateManager
+from unittests.simulation_pool_test import PARAMS
+
+# Two rows and three reels keep the exact payout distribution quick to solve
+PAYLINES = {
+    "line_1": [(0, 0), (1, 0), (2, 0)],
+    "line_2": [(0, 1), (1, 1), (2, 1)],
+    "line_3": [(0, 0), (1, 1), (2, 0)],
+}
+
+
+class ImportanceSamplingTest(BaseTest, unittest.TestCase):
+
+    def _engine(self):
+        config = Configuration(rows=2, columns=3, custom_paylines=PAYLINES)
+        return SlotMachineEngine(config=config, state_manager=StateManager(initial_state={"config": config}))
+
+    def test_likelihood_ratios_are_exact(self):
+        engine = self._engine()
+        sampler = ImportanceSampler(engine, {9: 4.0, 10: 3.0, 1: 0.5}, seed=1)
+        grids = sampler.tilted.generate_grids(300, rng=IsaacLanes(list(range(8))))
+        nominal, tilted = ExactRtpCalculator(engine), ExactRtpCalculator(sampler.tilted)
+        expected = [np.prod([nominal.column_distribution(reel_idx)[tuple(column)]
+                             / tilted.column_distribution(reel_idx)[tuple(column)]
+                             for reel_idx, column in enumerate(grid.tolist())]) for grid in grids]
+        np.testing.assert_allclose(sampler.likelihood_ratios(grids), expected, rtol=1e-9)
+
+        untilted = ImportanceSampler(engine, {}, seed=1)
+        untilted.run(1000)
+        results = untilted.results()
+        self.assertAlmostEqual(results["mean_likelihood_ratio"], 1.0)
+        self.assertAlmostEqual(results["effective_sample_size"], 1000)
+
+    def test_estimates_match_exact_distribution(self):
+        engine = self._engine()
+        distribution = PayoutDistributionCalculator(engine).calculate()
+        # The largest win of the game, rare under its own weights
+        multiplier = float(distribution.multipliers.max())
+        sampler = ImportanceSampler(engine, {9: 4.0, 8: 4.0}, seed=5, tail_multipliers=(multiplier,))
+        sampler.run(100_000)
+        results = sampler.results()
+        tail = results["tails"][0]
+        exact = distribution.probability_at_least(multiplier)
+        self.assertLess(abs(tail["probability"] - exact), 4 * tail["standard_error"])
+        self.assertGreater(tail["variance_reduction"], 1)
+        self.assertLess(abs(results["rtp"] - 100 * distribution.mean()), 4 * results["rtp_standard_error"])
+
+    def test_invalid_runs_are_refused(self):
+        engine = self._engine()
+        for tilt, multipliers in (({11: 2.0}, (10,)), ({9: 0.0}, (10,)), ({9: 2.0}, (0,))):
+            with self.assertRaises(ValueError):
+                ImportanceSampler(engine, tilt, tail_multipliers=multipliers)
+        request = ImportanceSamplingRequest(**{**PARAMS, "tilt": {9: 2.0}})
+        with self.assertRaises(HTTPException) as refused:
+            asyncio.run(run_importance_sampling(request, SimpleNamespace()))
+        self.assertEqual(refused.exception.status_code, 422)
+        with self.assertRaises(ValueError):
+            ImportanceSamplingRequest(**{**PARAMS, "plugins": {}, "num_spins": MAX_IMPORTANCE_SPINS + 1})
+
+    def test_runs_in_pool(self):
+        params = {**PARAMS, "plugins": {}, "num_spins": 3000, "rows": 2, "columns": 3, "custom_paylines": PAYLINES}
+        pool = SimulationPool(max_workers=1)
+        try:
+            app_request = SimpleNamespace(app=SimpleNamespace(state=SimpleNamespace(simulation_pool=pool)))
+            results = asyncio.run(run_importance_sampling(ImportanceSamplingRequest(**params, tilt={9: 2.0}),
+                                                          app_request))
+            sampler = ImportanceSampler(self._engine(), {9: 2.0}, seed=PARAMS["seed"])
+            sampler.run(3000)
+            self.assertEqual(results["rtp"], sampler.results()["rtp"])
+
+            # Errors found by the worker come back as a 422
+            with self.assertRaises(HTTPException) as refused:
+                asyncio.run(run_importance_sampling(ImportanceSamplingRequest(**params, tilt={11: 2.0}),
+                                                    app_request))
+            self.assertEqual(refused.exception.status_code, 422)
+        finally:
+            pool.shutdown()
+
+    def test_big_win_threshold(self):
+        simulation = build_simulation({**PARAMS, "plugins": {}, "fast": False}, big_win_multiplier=1e-6)
+        spins = [simulation.single_spin() for _ in range(50)]
+        self.assertTrue(all(spin["big_win"] == (spin["spin_results"]["total_payout"] > 0) for spin in spins))
+        with self.assertRaises(ValueError):
+            build_simulation(PARAMS, big_win_multiplier=0)
+
+    def run_test(self):
+        try:
+            self.test_likelihood_ratios_are_exact()
+            self.test_estimates_match_exact_distribution()
+            self.test_invalid_runs_are_refused()
+            self.test_runs_in_pool()
+            self.test_big_win_threshold()
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e),
+            }
+        return {
+            'success': True,
+        }
+
+
+def run_test():
+    test = ImportanceSamplingTest()
+    return test.run_test()
@@ -0,0 +1,119 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+from fastapi import HTTPException
+
+from unittests.base_test import BaseTest
+from api.routes_simulation import SweepRequest, run_sweep
+from maths_engine.exact_rtp import ExactRtpCalculator
+from maths_engine.parameter_sweep import MAX_SWEEP_SPINS, MAX_SWEEP_VARIANTS, ParameterSweep, sweep_variants
+from maths_engine.simulation_pool import SimulationPool
+from unittests.simulation_pool_test import PARAMS
+
+BASE_GAME = {**PARAMS, "plugins": {}}
+
+
+class ParameterSweepTest(BaseTest, unittest.TestCase):
+
+    def test_grids_follow_reel_weights(self):
+        sweep = ParameterSweep(BASE_GAME, [{}], seed=2)
+        engine = sweep.engines[0]
+        words = sweep.rng.raw_batch(50_000 * 15).reshape(50_000, 5, 3)
+        grids = sweep.generate_grids(engine, words)
+        self.assertFalse((grids[:, 0, :] == engine.config.wild_symbol).any())
+        self.assertTrue(((grids == 10).sum(axis=2) <= 1).all())
+        # First row of each reel: the full table, to sampling error
+        for reel_idx in range(5):
+            table = engine.get_alias_table(reel_idx)
+            counts = np.bincount(grids[:, reel_idx, 0], minlength=11)
+            for symbol, probability in table.probabilities().items():
+                error = np.sqrt(probability * (1 - probability) / 50_000)
+                self.assertLess(abs(counts[symbol] / 50_000 - probability), 5 * error)
+
+    def test_paired_differences(self):
+        variants = [{}, {"payout_formula": "1.5 * x"}, {"payout_formula": "3 * x"},
+                    {"weight_formula": "math.exp(-x / 10)"}]
+        sweep = ParameterSweep(BASE_GAME, variants, seed=4)
+        sweep.run(60_000)
+        results = sweep.results()
+        self.assertEqual(results["weight_groups"], 2)
+        base, same, double, weights = results["variants"]
+        self.assertEqual(same["difference"], 0.0)
+        self.assertEqual(same["difference_standard_error"], 0.0)
+        # Same grids, every payout doubled
+        self.assertAlmostEqual(double["rtp"], 2 * base["rtp"])
+        self.assertAlmostEqual(double["difference"], base["rtp"])
+        exact = [ExactRtpCalculator(engine).calculate()["rtp"] for engine in sweep.engines]
+        self.assertLess(abs(base["rtp"] - exact[0]), 4 * base["rtp_standard_error"])
+        self.assertLess(abs(weights["rtp"] - exact[3]), 4 * weights["rtp_standard_error"])
+        self.assertLess(abs(weights["difference"] - (exact[3] - exact[0])), 4 * weights["difference_standard_error"])
+        self.assertGreater(weights["variance_reduction"], 1)
+
+        # The same seed replays the same spins
+        again = ParameterSweep(BASE_GAME, variants, seed=4)
+        again.run(60_000)
+        self.assertEqual(again.results()["variants"][3]["rtp"], weights["rtp"])
+
+    def test_invalid_sweeps_are_refused(self):
+        for grid in ({"rows": [4]}, {"payout_formula": []},
+                     {"payout_formula": [f"{k} * x" for k in range(8)], "weight_resolution": list(range(1, 9))}):
+            with self.assertRaises(ValueError):
+                sweep_variants(grid)
+        self.assertEqual(len(sweep_variants({"payout_formula": ["x", "2 * x"], "wild_symbol": [8, 9]})), 5)
+        self.assertLess(5, MAX_SWEEP_VARIANTS)
+        with self.assertRaises(ValueError):
+            ParameterSweep(PARAMS, [{}])
+        request = SweepRequest(**{**PARAMS, "grid": {"payout_formula": ["2 * x"]}})
+        with self.assertRaises(HTTPException) as refused:
+            asyncio.run(run_sweep(request, SimpleNamespace()))
+        self.assertEqual(refused.exception.status_code, 422)
+
+        request = SweepRequest(**{**BASE_GAME, "num_spins": MAX_SWEEP_SPINS // 2 + 1,
+                                  "grid": {"payout_formula": ["2 * x"]}})
+        with self.assertRaises(HTTPException) as refused:
+            asyncio.run(run_sweep(request, SimpleNamespace()))
+        self.assertEqual(refused.exception.status_code, 422)
+
+    def test_sweeps_run_in_pool(self):
+        pool = SimulationPool(max_workers=1)
+        try:
+            app_request = SimpleNamespace(app=SimpleNamespace(state=SimpleNamespace(simulation_pool=pool)))
+            # Overrides take the request fields' types, as JSON keys would
+            payouts = {str(symbol): 2.0 * symbol for symbol in range(1, 11)}
+            request = SweepRequest(**{**BASE_GAME, "num_spins": 2000, "grid": {"custom_symbol_payouts": [payouts]}})
+            results = asyncio.run(run_sweep(request, app_request))
+            self.assertEqual(results["spins"], 2000)
+            self.assertEqual(results["variants"][1]["overrides"]["custom_symbol_payouts"][10], 20.0)
+            local = ParameterSweep({**BASE_GAME, "num_spins": 2000}, [{}], seed=BASE_GAME["seed"])
+            local.run(2000)
+            self.assertEqual(results["variants"][0]["rtp"], local.results()["variants"][0]["rtp"])
+
+            # Errors found by the worker come back as a 422
+            request = SweepRequest(**{**BASE_GAME, "grid": {"custom_paylines": [{"line_1": [(9, 0)]}]}})
+            with self.assertRaises(HTTPException) as refused:
+                asyncio.run(run_sweep(request, app_request))
+            self.assertEqual(refused.exception.status_code, 422)
+        finally:
+            pool.shutdown()
+
+    def run_test(self):
+        try:
+            self.test_grids_follow_reel_weights()
+            self.test_paired_differences()
+            self.test_invalid_sweeps_are_refused()
+            self.test_sweeps_run_in_pool()
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e),
+            }
+        return {
+            'success': True,
+        }
+
+
+def run_test():
+    test = ParameterSweepTest()
+    return test.run_test()
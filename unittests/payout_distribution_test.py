@@ -0,0 +1,121 @@
+import asyncio
+import itertools
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+from fastapi import HTTPException
+
+from unittests.base_test import BaseTest
+from api.routes_calculations import ExactDistributionRequest, exact_distribution
+from api.routes_simulation import RunSimulationRequest, run_confidence_level_report
+from maths_engine.configuration import Configuration
+from maths_engine.payout_distribution import PayoutDistribution, PayoutDistributionCalculator
+from maths_engine.result_cache import ResultCache
+from maths_engine.simulation_pool import SimulationPool
+from maths_engine.slot_machine_engine import SlotMachineEngine
+from maths_engine.state_manager import StateManager
+
+
+# Two rows and three reels keep every grid enumerable; crossing lines share cells.
+PAYLINES = {
+    "line_1": [(0, 0), (1, 0), (2, 0)],
+    "line_2": [(0, 1), (1, 1), (2, 1)],
+    "line_3": [(0, 0), (1, 1), (2, 0)],
+    "line_4": [(0, 1), (1, 0), (2, 1)],
+}
+
+
+class PayoutDistributionTest(BaseTest, unittest.TestCase):
+
+    def _engine(self, **config_params):
+        config = Configuration(**config_params)
+        state_manager = StateManager(initial_state={"config": config})
+        return SlotMachineEngine(config=config, state_manager=state_manager, seed=1)
+
+    def test_matches_brute_force_enumeration(self):
+        engine = self._engine(rows=2, columns=3, custom_paylines=PAYLINES)
+        # A tiny block size also exercises solving the frontier in pieces.
+        calculator = PayoutDistributionCalculator(engine, icon=10, blocked_reels=[2], block_size=50)
+        distribution = calculator.calculate()
+
+        reels = [list(calculator.rtp_calculator.column_distribution(reel_idx).items()) for reel_idx in range(3)]
+        grids, probabilities = [], []
+        for grid in itertools.product(*reels):
+            grids.append([list(column) for column, _ in grid])
+            probabilities.append(np.prod([probability for _, probability in grid]))
+        payouts = calculator.evaluator.evaluate(np.array(grids, dtype=np.uint8), 1.0)
+        values, group = np.unique(np.round(payouts, 9), return_inverse=True)
+        expected = np.bincount(group.ravel(), weights=probabilities)
+
+        np.testing.assert_allclose(distribution.multipliers, values)
+        np.testing.assert_allclose(distribution.probabilities, expected, atol=1e-12)
+        self.assertAlmostEqual(distribution.mean() * 100, calculator.rtp_calculator.calculate()["rtp"], places=9)
+
+    def test_summary_statistics(self):
+        distribution = PayoutDistribution(np.array([5.0, 0.0, 1.0]), np.array([0.1, 0.6, 0.3]))
+        summary = distribution.summary(thresholds=[1, 5])
+        self.assertAlmostEqual(summary["rtp"], 80.0)
+        self.assertAlmostEqual(summary["hit_frequency"], 40.0)
+        self.assertAlmostEqual(summary["variance"], 2.8 - 0.8 ** 2)
+        self.assertAlmostEqual(summary["win_probabilities"][1], 0.4)
+        self.assertAlmostEqual(summary["win_probabilities"][5], 0.1)
+        self.assertEqual(distribution.percentile(50), 0.0)
+        self.assertEqual(distribution.percentile(95), 5.0)
+
+    def test_rejects_paylines_out_of_reel_order(self):
+        engine = self._engine(custom_paylines={"line_1": [(1, 0), (0, 0), (2, 0), (3, 0), (4, 0)]})
+        with self.assertRaises(ValueError):
+            PayoutDistributionCalculator(engine)
+
+    def test_solved_in_pool_and_used_by_reports(self):
+        game = {"rows": 2, "columns": 3, "custom_paylines": PAYLINES}
+        expected = PayoutDistributionCalculator(self._engine(**game)).calculate()
+        pool = SimulationPool(max_workers=1)
+        cache = ResultCache(directory=None)
+        try:
+            app_request = SimpleNamespace(app=SimpleNamespace(state=SimpleNamespace(simulation_pool=pool,
+                                                                                    result_cache=cache)))
+            response = asyncio.run(exact_distribution(ExactDistributionRequest(**game), app_request))
+            self.assertAlmostEqual(response.rtp, expected.mean() * 100)
+            self.assertAlmostEqual(response.variance, expected.variance())
+            asyncio.run(exact_distribution(ExactDistributionRequest(**game), app_request))
+            self.assertEqual(cache.stats()["hits"], 1)
+
+            request = RunSimulationRequest(**game, plugins={}, num_spins=4000, batch=2, seed=1, fast=True, bet_amount=1,
+                                           starting_capital=10**6,
+                                           exact_reference=True)
+            report = asyncio.run(run_confidence_level_report(request, app_request))
+            exact = report["confidence_interval"]["exact_base_game"]
+            self.assertAlmostEqual(exact["rtp"], response.rtp)
+            self.assertNotIn("histogram", exact)
+            self.assertAlmostEqual(exact["margin_of_error"],
+                                   1.959964 * 100 * expected.standard_deviation() / np.sqrt(4000), places=4)
+
+            bad_lines = {"line_1": [(1, 0), (0, 0), (2, 0)]}
+            with self.assertRaises(HTTPException) as refused:
+                asyncio.run(exact_distribution(ExactDistributionRequest(**{**game, "custom_paylines": bad_lines}),
+                                               app_request))
+            self.assertEqual(refused.exception.status_code, 422)
+        finally:
+            pool.shutdown()
+
+    def run_test(self):
+        try:
+            self.test_matches_brute_force_enumeration()
+            self.test_summary_statistics()
+            self.test_rejects_paylines_out_of_reel_order()
+            self.test_solved_in_pool_and_used_by_reports()
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e),
+            }
+        return {
+            'success': True,
+        }
+
+
+def run_test():
+    test = PayoutDistributionTest()
+    return test.run_test()
@@ -0,0 +1,87 @@
+import os
+import tempfile
+import unittest
+
+from unittests.base_test import BaseTest
+from maths_engine.result_cache import ResultCache
+from maths_engine.simulation_pool import SimulationPool, cacheable, simulation_cache_key
+from unittests.simulation_pool_test import PARAMS
+
+
+class ResultCacheTest(BaseTest, unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_memory_tier_is_lru(self):
+        cache = ResultCache(memory_entries=2, directory=None)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+        self.assertEqual((cache.get("a"), cache.get("b"), cache.get("c")), (1, None, 3))
+
+    def test_disk_tier_outlives_memory(self):
+        cache = ResultCache(memory_entries=1, directory=self.directory.name, disk_entries=2)
+        for key in "abc":
+            cache.put(key, {"key": key})
+            if key == "a":
+                # File times can tie within a test, so make "a" the oldest outright
+                os.utime(os.path.join(self.directory.name, "a.pkl"), (1, 1))
+        self.assertEqual(len(os.listdir(self.directory.name)), 2)
+        fresh = ResultCache(directory=self.directory.name)
+        self.assertEqual(fresh.get("c"), {"key": "c"})
+        self.assertIsNone(fresh.get("a"))
+        # Values are copies: changing one does not change the cache
+        fresh.get("c")["key"] = "changed"
+        self.assertEqual(fresh.get("c"), {"key": "c"})
+
+    def test_key_follows_effective_game(self):
+        key = simulation_cache_key(PARAMS)
+        # The same payouts written differently build the same paytable
+        self.assertEqual(key, simulation_cache_key({**PARAMS, "payout_formula": "x * 1.5"}))
+        for change in ({"seed": 4}, {"num_spins": 5001}, {"bet_amount": 2}, {"payout_formula": "2 * x"},
+                       {"plugins": {}}, {"fast": False}, {"sticky_duration": 2}, {"control_variate": True},
+                       {"stratified_reels": 2}):
+            self.assertNotEqual(key, simulation_cache_key({**PARAMS, **change}), change)
+        self.assertFalse(cacheable({**PARAMS, "seed": None}))
+        self.assertFalse(cacheable({**PARAMS, "cache": False}))
+        self.assertFalse(cacheable({**PARAMS, "detail_capture": "ring"}))
+
+    def test_pool_answers_cached_runs(self):
+        cache = ResultCache(directory=self.directory.name)
+        pool = SimulationPool(max_workers=1, cache=cache)
+        try:
+            first = pool.submit(PARAMS).result()
+            second = pool.submit(PARAMS)
+            self.assertTrue(second.done())
+            self.assertEqual(second.result()["counts"].tolist(), first["counts"].tolist())
+            self.assertEqual(cache.stats()["hits"], 1)
+        finally:
+            pool.shutdown()
+
+    def run_test(self):
+        try:
+            for test in (self.test_memory_tier_is_lru, self.test_disk_tier_outlives_memory,
+                         self.test_key_follows_effective_game, self.test_pool_answers_cached_runs):
+                self.setUp()
+                try:
+                    test()
+                finally:
+                    self.tearDown()
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e),
+            }
+        return {
+            'success': True,
+        }
+
+
+def run_test():
+    test = ResultCacheTest()
+    return test.run_test()
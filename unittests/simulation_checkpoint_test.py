@@ -0,0 +1,91 @@
+import unittest
+
+from pydantic import ValidationError
+
+from unittests.base_test import BaseTest
+from api.routes_simulation import RunSimulationRequest, SimulationJobRequest
+from maths_engine.simulation import MAX_FAST_SIMULATION_SPINS, MAX_SIMULATION_SPINS
+from maths_engine.simulation_pool import build_simulation
+from unittests.simulation_pool_test import PARAMS
+
+
+def resumed(params: dict, first: int, more: int, **overrides):
+    """A run of ``first`` spins continued for ``more`` from its checkpoint."""
+    simulation = build_simulation({**params, "num_spins": first}, **overrides)
+    simulation.run()
+    extension = build_simulation({**params, "num_spins": more}, **overrides)
+    extension.restore(simulation.checkpoint())
+    extension.run()
+    return extension
+
+
+class SimulationCheckpointTest(BaseTest, unittest.TestCase):
+
+    def _assert_continues(self, params: dict, first: int, more: int, exact: bool):
+        whole = build_simulation({**params, "num_spins": first + more})
+        whole.run()
+        extension = resumed(params, first, more)
+        expected, results = whole.get_results(), extension.get_results()
+        self.assertEqual(extension.state_manager.get("spin_count"), first + more)
+        self._assert_matches(results, expected, exact)
+
+    def _assert_matches(self, results, expected, exact: bool, key=None):
+        if isinstance(expected, dict):
+            self.assertEqual(set(results), set(expected), key)
+            for name, value in expected.items():
+                self._assert_matches(results[name], value, exact, name)
+        elif isinstance(expected, float) and not exact:
+            # The kernel sums per batch, so float totals may differ in the last place
+            self.assertAlmostEqual(results, expected, places=6, msg=key)
+        else:
+            self.assertEqual(results, expected, key)
+
+    def test_spin_loop_continues_exactly(self):
+        self._assert_continues({**PARAMS, "fast": False}, 1200, 800, exact=True)
+
+    def test_kernel_continues_mid_batch(self):
+        # 30_000 spins end inside the kernel's second batch
+        self._assert_continues(PARAMS, 30_000, 25_000, exact=False)
+        self._assert_continues({**PARAMS, "plugins": {}}, 30_000, 25_000, exact=False)
+
+    def test_restore_checks_the_run(self):
+        simulation = build_simulation({**PARAMS, "num_spins": 100})
+        simulation.run()
+        checkpoint = simulation.checkpoint()
+        for change in ({"seed": 4}, {"bet_amount": 2}, {"fast": False}):
+            with self.assertRaises(ValueError):
+                build_simulation({**PARAMS, **change}).restore(checkpoint)
+        with self.assertRaises(ValueError):
+            build_simulation(PARAMS).restore({**checkpoint, "version": 0})
+
+    def test_requests_bound_their_spins(self):
+        RunSimulationRequest(**{**PARAMS, "num_spins": MAX_FAST_SIMULATION_SPINS})
+        for spins, fast in ((MAX_SIMULATION_SPINS + 1, False), (MAX_FAST_SIMULATION_SPINS + 1, True)):
+            with self.assertRaises(ValidationError):
+                RunSimulationRequest(**{**PARAMS, "num_spins": spins, "fast": fast})
+            # Longer runs go through simulation jobs
+            SimulationJobRequest(**{**PARAMS, "num_spins": spins, "fast": fast})
+        # fast is False when left out
+        params = {name: value for name, value in PARAMS.items() if name != "fast"}
+        with self.assertRaises(ValidationError):
+            RunSimulationRequest(**{**params, "num_spins": MAX_SIMULATION_SPINS + 1})
+
+    def run_test(self):
+        try:
+            self.test_spin_loop_continues_exactly()
+            self.test_kernel_continues_mid_batch()
+            self.test_restore_checks_the_run()
+            self.test_requests_bound_their_spins()
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e),
+            }
+        return {
+            'success': True,
+        }
+
+
+def run_test():
+    test = SimulationCheckpointTest()
+    return test.run_test()
@@ -0,0 +1,122 @@
+import asyncio
+import unittest
+
+from unittests.base_test import BaseTest
+from maths_engine.simulation_jobs import SimulationJobManager
+from maths_engine.result_cache import ResultCache
+from maths_engine.simulation_pool import SimulationPool, merge_summaries, run_simulation_task, summary_value
+from unittests.simulation_pool_test import PARAMS
+
+
+class SimulationJobsTest(BaseTest, unittest.TestCase):
+
+    def _run(self, scenario, cache=None, **manager_options):
+        """Run ``scenario(manager)`` on a one-worker pool inside an event loop."""
+        pool = SimulationPool(max_workers=1, cache=cache)
+
+        async def main():
+            manager = SimulationJobManager(pool, **manager_options)
+            try:
+                return await scenario(manager)
+            finally:
+                manager.shutdown()
+
+        try:
+            return asyncio.run(main())
+        finally:
+            pool.shutdown()
+
+    def test_job_streams_progress_and_merges_slices(self):
+        async def scenario(manager):
+            job = manager.submit({**PARAMS, "num_spins": 5000}, slice_spins=2000)
+            return job, [progress async for progress in manager.updates(job)]
+
+        job, updates = self._run(scenario)
+        final = updates[-1]
+        self.assertEqual(final["status"], "completed")
+        self.assertEqual(final["spins_done"], 5000)
+        self.assertEqual(final["master_seed"], 3)
+        progress_values = [progress["progress"] for progress in updates]
+        self.assertEqual(progress_values, sorted(progress_values))
+        self.assertEqual(progress_values[-1], 1.0)
+        self.assertEqual(summary_value(job.summary, "free_spins_played"),
+                         summary_value(job.summary, "total_free_spins_won")
+                         - summary_value(job.summary, "current_free_spins"))
+
+    def test_slices_continue_one_run(self):
+        cache = ResultCache(directory=None)
+        for params, slice_spins in (({**PARAMS, "fast": False}, 700), (PARAMS, 30_000)):
+            params = {**params, "num_spins": 75_000 if params["fast"] else 2000}
+
+            async def scenario(manager):
+                job = manager.submit(params, slice_spins=slice_spins)
+                await job.task
+                return job
+
+            job = self._run(scenario, cache=cache)
+            whole = run_simulation_task(params)
+            for name in ("spin_count", "hits", "free_spins_played", "current_free_spins", "total_free_spins_won"):
+                self.assertEqual(summary_value(job.summary, name), summary_value(whole, name), name)
+            # The kernel sums per batch, so float totals may differ in the last place
+            for name in ("total_winnings", "capital"):
+                self.assertAlmostEqual(summary_value(job.summary, name), summary_value(whole, name), places=6)
+        # Slices are not worth caching on their own
+        self.assertEqual(cache.stats()["memory_entries"], 0)
+
+    def test_job_stops_with_the_capital(self):
+        async def scenario(manager):
+            job = manager.submit({**PARAMS, "num_spins": 50_000, "starting_capital": 30}, slice_spins=1000)
+            await job.task
+            return job
+
+        job = self._run(scenario)
+        self.assertEqual(job.status, "completed")
+        self.assertLess(job.progress()["spins_done"], 50_000)
+        self.assertLess(summary_value(job.summary, "capital"), PARAMS["bet_amount"])
+
+    def test_cancel_and_bounded_queue(self):
+        async def scenario(manager):
+            job = manager.submit({**PARAMS, "num_spins": 10**6}, slice_spins=1000)
+            with self.assertRaises(RuntimeError):
+                manager.submit(PARAMS)
+            updates = manager.updates(job)
+            while (await updates.__anext__())["spins_done"] == 0:
+                pass
+            await manager.cancel(job.id)
+            return job
+
+        job = self._run(scenario, max_queued=1)
+        progress = job.progress()
+        self.assertEqual(progress["status"], "cancelled")
+        self.assertGreater(progress["spins_done"], 0)
+        self.assertLess(progress["spins_done"], 10**6)
+
+    def test_merge_summaries_adds_up(self):
+        first = run_simulation_task({**PARAMS, "num_spins": 1000, "seed": 1})
+        second = run_simulation_task({**PARAMS, "num_spins": 2000, "seed": 2})
+        merged = merge_summaries(first, second)
+        self.assertEqual(summary_value(merged, "spin_count"), 3000)
+        self.assertAlmostEqual(summary_value(merged, "total_winnings"),
+                               summary_value(first, "total_winnings") + summary_value(second, "total_winnings"))
+        self.assertEqual(merged["histograms"]["free_spins_icon_counts"].sum(), 3000)
+
+    def run_test(self):
+        try:
+            self.test_job_streams_progress_and_merges_slices()
+            self.test_slices_continue_one_run()
+            self.test_job_stops_with_the_capital()
+            self.test_cancel_and_bounded_queue()
+            self.test_merge_summaries_adds_up()
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e),
+            }
+        return {
+            'success': True,
+        }
+
+
+def run_test():
+    test = SimulationJobsTest()
+    return test.run_test()
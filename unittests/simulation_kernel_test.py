@@ -0,0 +1,75 @@
+import unittest
+
+from unittests.base_test import BaseTest
+from maths_engine.configuration import Configuration
+from maths_engine.exact_rtp import ExactRtpCalculator
+from maths_engine.simulation import Simulation
+from maths_engine.state_manager import StateManager
+
+FREE_SPINS = {"free_spins": {"blocked_reels": [0, 4], "icon": 10, "multiplier": 1}}
+
+
+class SimulationKernelTest(BaseTest, unittest.TestCase):
+
+    def _simulation(self, num_spins, capital=10**9, plugins=None, seed=11):
+        config = Configuration()
+        state_manager = StateManager(initial_state={"config": config})
+        return Simulation(config=config, bet_amount=1, num_spins=num_spins, capital=capital,
+                          plugins_with_params=plugins or {}, state_manager=state_manager, seed=seed, fast=True)
+
+    def test_base_game_matches_exact_rtp(self):
+        simulation = self._simulation(200_000)
+        simulation.run()
+        results = simulation.get_results()
+        self.assertEqual(results["status"], "success")
+        self.assertEqual(results["total_bets"], 200_000)
+        self.assertEqual(simulation.state_manager.get("spin_count"), 200_000)
+        # About six standard errors of a 200k-spin estimate
+        self.assertAlmostEqual(results["rtp"], ExactRtpCalculator(simulation.engine).calculate()["rtp"], delta=1.5)
+
+    def test_same_seed_same_results(self):
+        first, second = self._simulation(20_000, plugins=FREE_SPINS), self._simulation(20_000, plugins=FREE_SPINS)
+        first.run()
+        second.run()
+        self.assertEqual(first.get_results(), second.get_results())
+
+    def test_stops_when_capital_runs_out(self):
+        simulation = self._simulation(100_000, capital=20)
+        simulation.run()
+        state = simulation.state_manager
+        self.assertLess(state.get("spin_count"), 100_000)
+        self.assertLess(state.get("capital"), 1)
+        self.assertAlmostEqual(state.get("capital"), 20 - state.get("total_bets") + state.get("total_winnings"))
+
+    def test_free_spins_are_not_charged(self):
+        simulation = self._simulation(50_000, plugins=FREE_SPINS)
+        simulation.run()
+        state = simulation.state_manager
+        played_free = state.get("total_free_spins_won") - state.get("current_free_spins")
+        self.assertGreater(played_free, 0)
+        self.assertEqual(state.get("total_bets"), state.get("spin_count") - played_free)
+
+    def test_rejects_unsupported_plugins(self):
+        with self.assertRaises(ValueError):
+            self._simulation(10, plugins={"multiplier_wilds": {}})
+
+    def run_test(self):
+        try:
+            self.test_base_game_matches_exact_rtp()
+            self.test_same_seed_same_results()
+            self.test_stops_when_capital_runs_out()
+            self.test_free_spins_are_not_charged()
+            self.test_rejects_unsupported_plugins()
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e),
+            }
+        return {
+            'success': True,
+        }
+
+
+def run_test():
+    test = SimulationKernelTest()
+    return test.run_test()
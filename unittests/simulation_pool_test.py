@@ -0,0 +1,87 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+
+from unittests.base_test import BaseTest
+from api.routes_simulation import (RunSimulationRequest, batch_seed, merged_totals, run_pooled_simulations,
+                                   summary_response)
+from maths_engine.simulation_pool import SimulationPool, run_simulation_task
+
+PARAMS = {
+    "rows": 3, "columns": 5, "symbols": 10, "wild_symbol": 9,
+    "weight_formula": "math.exp(-x / 15)", "payout_formula": "1.5 * x", "weight_resolution": 1_000_000,
+    "custom_symbol_payouts": {}, "custom_paylines": None,
+    "plugins": {"free_spins": {"blocked_reels": [0, 4], "icon": 10, "multiplier": 1}},
+    "bet_amount": 1, "num_spins": 5000, "starting_capital": 10**6, "seed": 3, "fast": True,
+}
+
+
+class SimulationPoolTest(BaseTest, unittest.TestCase):
+
+    def test_summary_is_compact_and_complete(self):
+        summary = run_simulation_task(PARAMS)
+        counts = dict(zip(summary["count_names"], summary["counts"].tolist()))
+        amounts = dict(zip(summary["amount_names"], summary["amounts"].tolist()))
+        self.assertEqual(summary["seed"], 3)
+        self.assertEqual(counts["spin_count"], 5000)
+        self.assertIn("total_winnings", amounts)
+        self.assertEqual(counts["free_spins_played"], counts["total_free_spins_won"] - counts["current_free_spins"])
+        self.assertEqual(summary["histograms"]["free_spins_icon_counts"].sum(), 5000)
+        self.assertEqual(summary["errors"], [])
+
+    def test_pool_matches_in_process_run(self):
+        pool = SimulationPool(max_workers=1)
+        try:
+            pooled = pool.submit(PARAMS).result()
+        finally:
+            pool.shutdown()
+        local = run_simulation_task(PARAMS)
+        self.assertEqual(pooled["counts"].tolist(), local["counts"].tolist())
+        self.assertEqual(pooled["amounts"].tolist(), local["amounts"].tolist())
+
+    def test_batches_merge_by_bets(self):
+        # Unequal batches: averaging their RTPs would differ from the pooled ratio
+        results = [summary_response(run_simulation_task({**PARAMS, "num_spins": spins, "seed": batch_seed(3, index)}),
+                                    None) for index, spins in enumerate((500, 4500))]
+        totals = merged_totals(results)
+        self.assertEqual(totals["spin_count"], 5000)
+        self.assertAlmostEqual(totals["rtp"], sum(result.total_winnings for result in results)
+                               / sum(result.total_bets for result in results) * 100)
+        self.assertNotEqual(batch_seed(3, 1), batch_seed(4, 0))
+
+    def test_batch_reruns_alone(self):
+        request = RunSimulationRequest(**{**PARAMS, "seed": None})
+        pool = SimulationPool(max_workers=1)
+        try:
+            app_request = SimpleNamespace(app=SimpleNamespace(state=SimpleNamespace(simulation_pool=pool)))
+            master_seed, results = asyncio.run(run_pooled_simulations(
+                app_request, request, [{"num_spins": 2000}, {"num_spins": 3000, "starting_capital": 500}]))
+        finally:
+            pool.shutdown()
+        batch = results[1].additional_results
+        self.assertEqual((batch["master_seed"], batch["batch_index"]), (master_seed, 1))
+        self.assertEqual(batch["seed"], batch_seed(master_seed, 1))
+        rerun = summary_response(run_simulation_task({**PARAMS, "seed": batch["seed"], "num_spins": batch["num_spins"],
+                                                      "starting_capital": batch["starting_capital"]}), None)
+        self.assertEqual((rerun.total_bets, rerun.total_winnings), (results[1].total_bets, results[1].total_winnings))
+        self.assertEqual(rerun.additional_results["spin_count"], batch["spin_count"])
+
+    def run_test(self):
+        try:
+            self.test_summary_is_compact_and_complete()
+            self.test_pool_matches_in_process_run()
+            self.test_batches_merge_by_bets()
+            self.test_batch_reruns_alone()
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e),
+            }
+        return {
+            'success': True,
+        }
+
+
+def run_test():
+    test = SimulationPoolTest()
+    return test.run_test()
@@ -0,0 +1,144 @@
+import unittest
+from collections import Counter
+
+import numpy as np
+
+from unittests.base_test import BaseTest
+from api.routes_simulation import RunSimulationRequest
+from maths_engine.alias_table import AliasTable
+from maths_engine.configuration import Configuration
+from maths_engine.payline_evaluator import _LINE_TABLE_CACHE, MAX_CACHED_LINE_TABLES, get_line_outcome_table
+from maths_engine.slot_machine_engine import SlotMachineEngine, UNIQUE_REEL_SYMBOL
+from maths_engine.state_manager import StateManager
+
+
+class SlotMachineEngineTest(BaseTest, unittest.TestCase):
+
+    def setUp(self):
+        self.config = Configuration()
+        self.state_manager = StateManager(initial_state={"config": self.config})
+        self.engine = SlotMachineEngine(config=self.config,
+                                        state_manager=self.state_manager,
+                                        seed=7)
+
+    def test_alias_table_is_exact(self):
+        weights = self.config.get_symbol_weights(resolution=self.config.weight_resolution)
+        symbols = list(range(1, self.config.symbols + 1))
+        table = AliasTable(symbols, weights)
+
+        # Units each symbol owns across all buckets must equal weight * n.
+        mass = Counter()
+        for bucket in range(table.size):
+            mass[table.symbols[bucket]] += table.threshold[bucket]
+            mass[table.alias[bucket]] += table.total - table.threshold[bucket]
+        for symbol, weight in zip(symbols, weights):
+            self.assertEqual(mass[symbol], weight * table.size)
+
+    def test_weighted_reels_follow_reel_rules(self):
+        for _ in range(300):
+            reels = self.engine.get_weighted_reels(self.engine.rng, icon=10, blocked_reels=[0, 4])
+            self.assertNotIn(self.config.wild_symbol, reels[0])
+            self.assertNotIn(10, reels[0])
+            self.assertNotIn(10, reels[4])
+            for reel in reels:
+                self.assertLessEqual(reel.count(UNIQUE_REEL_SYMBOL), 1)
+
+    def test_generate_grids_follow_reel_rules(self):
+        grids = self.engine.generate_grids(5000, icon=10, blocked_reels=[0, 4])
+        self.assertEqual(grids.shape, (5000, self.config.columns, self.config.rows))
+        self.assertEqual(grids.dtype, np.uint8)
+        self.assertFalse((grids[:, 0, :] == self.config.wild_symbol).any())
+        self.assertFalse((grids[:, [0, 4], :] == 10).any())
+        self.assertLessEqual(int((grids == UNIQUE_REEL_SYMBOL).sum(axis=2).max()), 1)
+
+    def test_generate_grids_match_weights(self):
+        grids = self.engine.generate_grids(40000)
+        weights = np.array(self.engine.reel_weights[1], dtype=float)
+        expected = weights / weights.sum()
+        observed = np.bincount(grids[:, 1, 0], minlength=self.config.symbols + 1)[1:] / len(grids)
+        np.testing.assert_allclose(observed, expected, atol=0.01)
+
+    def test_payline_evaluator_matches_check_wins(self):
+        self.state_manager.set("icon", 10)
+        self.engine.bet_amount = 100
+        evaluator = self.engine.get_payline_evaluator(10)
+        # Wild- and scatter-heavy grids exercise the interference rules.
+        rng = np.random.default_rng(11)
+        heavy = rng.choice([1, 2, 9, 9, 10, 3], size=(500, 5, 3)).astype(np.uint8)
+        table_wins = self.engine.check_wins
+        for grids in (heavy, self.engine.generate_grids(500)):
+            payouts = evaluator.evaluate(grids, 100)
+            direct = evaluator.match(evaluator.line_symbols(grids))
+            # Without the outcome table check_wins applies its line rules directly.
+            self.engine.get_line_outcome_table = lambda scatter_symbol=None: None
+            expected_wins = [self.engine.check_wins(grid) for grid in grids.tolist()]
+            del self.engine.get_line_outcome_table
+            expected = [
+                sum(self.engine.check_payline(win_line) for win_line in wins)
+                for wins in expected_wins
+            ]
+            np.testing.assert_allclose(payouts, expected)
+            np.testing.assert_allclose(evaluator.multipliers[direct].sum(axis=1) * 100 / 20, expected)
+            self.assertEqual([table_wins(grid) for grid in grids.tolist()], expected_wins)
+
+    def test_set_reel_weights_invalidates_only_changed_reel(self):
+        self.engine.get_weighted_reels(self.engine.rng)
+        cached_reels = {key[0] for key in self.engine._alias_tables}
+        self.assertEqual(cached_reels, set(range(self.config.columns)))
+
+        weights = list(self.engine.reel_weights[2])
+        self.engine.set_reel_weights(2, weights)
+        self.assertIn(2, {key[0] for key in self.engine._alias_tables})
+
+        weights[0] = 0
+        self.engine.set_reel_weights(2, weights)
+        self.assertNotIn(2, {key[0] for key in self.engine._alias_tables})
+        self.assertIn(3, {key[0] for key in self.engine._alias_tables})
+
+    def test_line_table_cache_is_bounded(self):
+        evaluators = []
+        for k in range(MAX_CACHED_LINE_TABLES + 4):
+            config = Configuration(rows=2, columns=3, payout_formula=f"{k + 1} * x",
+                                   custom_paylines={"line_1": [(0, 0), (1, 0), (2, 0)]})
+            engine = SlotMachineEngine(config=config, state_manager=StateManager(initial_state={"config": config}))
+            evaluators.append(engine.get_payline_evaluator())
+        self.assertLessEqual(len(_LINE_TABLE_CACHE), MAX_CACHED_LINE_TABLES)
+        # Evicted tables stay with the evaluators that built them
+        self.assertTrue(all(evaluator.outcome_table is not None for evaluator in evaluators))
+        self.assertIs(evaluators[-1].outcome_table, get_line_outcome_table(evaluators[-1]))
+
+    def test_weight_resolution_is_validated(self):
+        for resolution in (0, 10**9):
+            with self.assertRaises(ValueError):
+                Configuration(weight_resolution=resolution)
+            with self.assertRaises(ValueError):
+                RunSimulationRequest(bet_amount=1, num_spins=10, starting_capital=100, weight_resolution=resolution)
+        # The largest resolution allowed still draws
+        config = Configuration(weight_resolution=2**32 // 10)
+        engine = SlotMachineEngine(config=config, state_manager=StateManager(initial_state={"config": config}))
+        self.assertEqual(engine.generate_grids(10).shape, (10, 5, 3))
+
+    def run_test(self):
+        try:
+            self.setUp()
+            self.test_alias_table_is_exact()
+            self.test_weighted_reels_follow_reel_rules()
+            self.test_generate_grids_follow_reel_rules()
+            self.test_generate_grids_match_weights()
+            self.test_payline_evaluator_matches_check_wins()
+            self.test_set_reel_weights_invalidates_only_changed_reel()
+            self.test_line_table_cache_is_bounded()
+            self.test_weight_resolution_is_validated()
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e),
+            }
+        return {
+            'success': True,
+        }
+
+
+def run_test():
+    test = SlotMachineEngineTest()
+    return test.run_test()
@@ -0,0 +1,172 @@
+import unittest
+
+import numpy as np
+
+from unittests.base_test import BaseTest
+from maths_engine.simulation_pool import build_simulation, merge_summaries, run_simulation_task, summary_value
+from maths_engine.exact_rtp import ExactRtpCalculator
+from maths_engine.simulation import MIN_PRECISION_ROUNDS, MIN_PRECISION_WINS
+from maths_engine.spin_statistics import (HISTOGRAM_BUCKETS, HISTOGRAM_BUCKETS_PER_DOUBLING, add_control,
+                                          add_controls, add_return, add_returns, add_to_histogram,
+                                          merge_control_moments, merge_moments, moments_variance,
+                                          new_control_moments, new_moments, return_bucket, return_percentiles)
+from unittests.simulation_pool_test import PARAMS
+
+
+class SpinStatisticsTest(BaseTest, unittest.TestCase):
+
+    def test_moments_merge_like_one_pass(self):
+        values = np.random.default_rng(5).exponential(3.0, 1001)
+        one_by_one, batched = new_moments(), new_moments()
+        for value in values:
+            add_return(one_by_one, float(value))
+        add_returns(batched, values[:400])
+        add_returns(batched, values[400:])
+        merged = merge_moments(batched, new_moments())
+        for moments in (one_by_one, batched, merged):
+            self.assertEqual(moments["count"], 1001)
+            self.assertAlmostEqual(moments["mean"], values.mean())
+            self.assertAlmostEqual(moments_variance(moments), values.var(ddof=1))
+
+    def test_runs_track_their_returns(self):
+        for fast, plugins in ((True, {}), (True, PARAMS["plugins"]), (False, PARAMS["plugins"])):
+            simulation = build_simulation({**PARAMS, "num_spins": 3000, "fast": fast, "plugins": plugins})
+            simulation.run()
+            state = simulation.state_manager
+            moments = state.get("return_moments")
+            mean = state.get("total_winnings") / PARAMS["bet_amount"] / 3000
+            self.assertEqual(moments["count"], 3000)
+            self.assertAlmostEqual(moments["mean"], mean)
+            self.assertAlmostEqual(moments_variance(moments),
+                                   (state.get("sum_squared_winnings") / PARAMS["bet_amount"] ** 2
+                                    - 3000 * mean * mean) / 2999)
+            self.assertEqual(sum(state.get("return_histogram").values()), 3000)
+            self.assertEqual(state.get("return_histogram").get(0, 0), 3000 - state.get("hits"))
+
+    def test_histogram_percentiles(self):
+        values = np.concatenate([np.zeros(900), np.full(90, 0.5), np.full(9, 10.0), [500.0]])
+        histogram = {}
+        add_to_histogram(histogram, values)
+        self.assertEqual(histogram, {return_bucket(value): spins for value, spins in
+                                     ((0.0, 900), (0.5, 90), (10.0, 9), (500.0, 1))})
+        percentiles = return_percentiles(histogram, 500.0)
+        self.assertEqual(percentiles["p50"], 0.0)
+        self.assertLessEqual(0.5, percentiles["p99"])
+        self.assertLessEqual(percentiles["p99"], 0.5 * 2 ** (1 / HISTOGRAM_BUCKETS_PER_DOUBLING))
+        self.assertLess(10.0, percentiles["p99.9"])
+        self.assertEqual(return_percentiles(histogram, 500.0, quantiles=(1.0,)), {"p100": 500.0})
+        self.assertEqual(return_bucket(2.0 ** 40), HISTOGRAM_BUCKETS - 1)
+
+    def test_statistics_merge_across_workers(self):
+        first = run_simulation_task({**PARAMS, "seed": 1, "num_spins": 4000})
+        second = run_simulation_task({**PARAMS, "seed": 2, "num_spins": 6000})
+        merged = merge_summaries(first, second)
+        self.assertEqual(merged["return_moments"]["count"], 10_000)
+        self.assertEqual(merged["histograms"]["return_histogram"].sum(), 10_000)
+        self.assertEqual(merged["return_moments"]["max"],
+                         max(first["return_moments"]["max"], second["return_moments"]["max"]))
+        self.assertAlmostEqual(merged["return_moments"]["mean"] * 10_000,
+                               summary_value(merged, "total_winnings") / PARAMS["bet_amount"])
+
+    def test_sequential_stopping(self):
+        params = {**PARAMS, "num_spins": 200_000, "plugins": {}}
+        loose = build_simulation(params, target_half_width=5.0, check_every=10_000)
+        loose.run()
+        stopping = loose.get_results()["sequential_stopping"]
+        self.assertTrue(stopping["target_met"])
+        self.assertLessEqual(stopping["rtp_half_width"], 5.0)
+        self.assertEqual(stopping["spins_played"], 10_000)
+
+        tight = build_simulation(params, target_half_width=0.01, check_every=50_000)
+        tight.run()
+        stopping = tight.get_results()["sequential_stopping"]
+        self.assertFalse(stopping["target_met"])
+        self.assertEqual(stopping["spins_played"], 200_000)
+        # Playing in checked rounds does not change the run
+        whole = build_simulation(params)
+        whole.run()
+        self.assertEqual(tight.state_manager.get("hits"), whole.state_manager.get("hits"))
+        self.assertAlmostEqual(tight.state_manager.get("total_winnings"), whole.state_manager.get("total_winnings"))
+
+        # A target is never met from the first few spins, whose spread may be nil before the first win
+        early = build_simulation(params, target_half_width=1000.0, check_every=10)
+        early.run()
+        stopping = early.get_results()["sequential_stopping"]
+        self.assertTrue(stopping["target_met"])
+        self.assertEqual(stopping["spins_played"], MIN_PRECISION_ROUNDS)
+        self.assertGreaterEqual(early.state_manager.get("hits"), MIN_PRECISION_WINS)
+
+        with self.assertRaises(ValueError):
+            build_simulation(params, target_half_width=0)
+        with self.assertRaises(ValueError):
+            build_simulation(params, target_half_width=1, confidence=1.0)
+
+    def test_rounds_group_free_spins(self):
+        for fast in (True, False):
+            simulation = build_simulation({**PARAMS, "num_spins": 5000, "fast": fast})
+            simulation.run()
+            state = simulation.state_manager
+            rounds = simulation.round_moments()
+            # Every paid spin starts a round; the free spins it leads to belong to it
+            self.assertEqual(rounds["count"], 5000 - state.get("free_spins_played"))
+            self.assertAlmostEqual(rounds["mean"] * rounds["count"],
+                                   state.get("total_winnings") / PARAMS["bet_amount"])
+
+    def test_control_moments_merge_like_one_pass(self):
+        generator = np.random.default_rng(7)
+        controls = generator.normal(0.0, 1.0, 1001)
+        values = 2 * controls + generator.exponential(1.0, 1001)
+        one_by_one, batched = new_control_moments(), new_control_moments()
+        for value, control in zip(values, controls):
+            add_control(one_by_one, float(value), float(control))
+        add_controls(batched, values[:300], controls[:300])
+        add_controls(batched, values[300:], controls[300:])
+        merged = merge_control_moments(new_control_moments(), batched)
+        for moments in (one_by_one, batched, merged):
+            self.assertEqual(moments["count"], 1001)
+            self.assertAlmostEqual(moments["control_mean"], controls.mean())
+            self.assertAlmostEqual(moments["comoment"] / 1000, np.cov(values, controls)[0, 1])
+
+    def test_control_variate(self):
+        # Without free spins a spin's return is its line return, so the adjusted RTP is the exact one
+        base = build_simulation({**PARAMS, "num_spins": 20_000, "plugins": {}, "control_variate": True})
+        base.run()
+        estimate = base.get_results()["control_variate"]
+        exact_rtp = ExactRtpCalculator(base.engine).calculate()["rtp"]
+        self.assertAlmostEqual(estimate["rtp"], exact_rtp, places=6)
+        self.assertAlmostEqual(estimate["rtp_standard_error"], 0.0, places=6)
+
+        for fast in (True, False):
+            simulation = build_simulation({**PARAMS, "num_spins": 50_000, "fast": fast, "control_variate": True})
+            simulation.run()
+            estimate = simulation.get_results()["control_variate"]
+            self.assertAlmostEqual(estimate["raw_rtp"], simulation.get_results()["rtp"])
+            self.assertLess(estimate["rtp_standard_error"], estimate["raw_rtp_standard_error"])
+            self.assertLess(abs(estimate["rtp"] - estimate["raw_rtp"]), 4 * estimate["raw_rtp_standard_error"])
+
+        with self.assertRaises(ValueError):
+            build_simulation({**PARAMS, "plugins": {"multiplier_wilds": {}}, "control_variate": True})
+
+    def run_test(self):
+        try:
+            self.test_moments_merge_like_one_pass()
+            self.test_runs_track_their_returns()
+            self.test_histogram_percentiles()
+            self.test_statistics_merge_across_workers()
+            self.test_sequential_stopping()
+            self.test_rounds_group_free_spins()
+            self.test_control_moments_merge_like_one_pass()
+            self.test_control_variate()
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e),
+            }
+        return {
+            'success': True,
+        }
+
+
+def run_test():
+    test = SpinStatisticsTest()
+    return test.run_test()
@@ -0,0 +1,81 @@
+import unittest
+
+import numpy as np
+
+from unittests.base_test import BaseTest
+from maths_engine.exact_rtp import ExactRtpCalculator
+from maths_engine.isaac_rng_v2 import IsaacLanes
+from maths_engine.simulation_pool import build_simulation
+from maths_engine.stratified_sampling import ColumnStrata
+from unittests.simulation_checkpoint_test import resumed
+from unittests.simulation_pool_test import PARAMS
+
+BASE_GAME = {**PARAMS, "plugins": {}}
+
+
+class StratifiedSamplingTest(BaseTest, unittest.TestCase):
+
+    def test_strata_follow_column_distribution(self):
+        engine = build_simulation(BASE_GAME).engine
+        strata = ColumnStrata(engine, 2)
+        self.assertAlmostEqual(strata.probabilities.sum(), 1.0)
+        columns, drawn = strata.sample(IsaacLanes(list(range(16))), 20_000)
+        self.assertEqual(columns.shape, (20_000, 2, engine.config.rows))
+        self.assertTrue(np.array_equal(columns, strata.columns[drawn]))
+        # Proportional allocation: every outcome within two draws of its share
+        counts = np.bincount(drawn, minlength=strata.size)
+        self.assertLessEqual(np.abs(counts - 20_000 * strata.probabilities).max(), 2.0)
+        self.assertFalse((columns[:, 0, :] == engine.config.wild_symbol).any())
+
+        grids = engine.generate_grids(20_000, leading_columns=columns)
+        self.assertTrue(np.array_equal(grids[:, :2, :], columns))
+
+    def test_stratified_runs(self):
+        params = {**BASE_GAME, "num_spins": 100_000}
+        simulation = build_simulation(params, stratified_reels=2)
+        simulation.run()
+        results = simulation.get_results()
+        report = results["stratified_sampling"]
+        self.assertEqual(report["batches"], 100_000 // simulation.kernel.chunk_size)
+        exact_rtp = ExactRtpCalculator(simulation.engine).calculate()["rtp"]
+        self.assertLess(abs(results["rtp"] - exact_rtp), 4 * report["unstratified_rtp_standard_error"])
+        self.assertGreater(report["rtp_standard_error"], 0)
+
+        # The batch in play carries over a checkpoint
+        extension = resumed(params, 60_000, 40_000, stratified_reels=2)
+        batches, expected = extension.state_manager.get("batch_moments"), simulation.state_manager.get("batch_moments")
+        self.assertEqual(batches["count"], expected["count"])
+        self.assertAlmostEqual(batches["m2"], expected["m2"])
+        self.assertAlmostEqual(extension.get_results()["rtp"], results["rtp"])
+
+        free_spins = build_simulation({**PARAMS, "num_spins": 20_000}, stratified_reels=1)
+        free_spins.run()
+        report = free_spins.get_results()["stratified_sampling"]
+        self.assertIsNone(report["rtp_standard_error"])
+        self.assertIsNotNone(report["unstratified_rtp_standard_error"])
+
+    def test_stratification_is_validated(self):
+        for params, overrides in (({**BASE_GAME, "fast": False}, {"stratified_reels": 1}),
+                                  (BASE_GAME, {"stratified_reels": 3}),
+                                  (BASE_GAME, {"stratified_reels": 1, "control_variate": True})):
+            with self.assertRaises(ValueError):
+                build_simulation(params, **overrides)
+
+    def run_test(self):
+        try:
+            self.test_strata_follow_column_distribution()
+            self.test_stratified_runs()
+            self.test_stratification_is_validated()
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e),
+            }
+        return {
+            'success': True,
+        }
+
+
+def run_test():
+    test = StratifiedSamplingTest()
+    return test.run_test()
@@ -6,6 +6,22 @@ class TestManager:
         self.modules = []
         self.test_names = test_names or [
             'isaac_rng_test',
+            'isaac_rng_v2_test',
+            'slot_machine_engine_test',
+            'exact_rtp_test',
+            'payout_distribution_test',
+            'free_spins_solver_test',
+            'simulation_kernel_test',
+            'detail_capture_test',
+            'free_spins_plugin_test',
+            'simulation_pool_test',
+            'simulation_jobs_test',
+            'result_cache_test',
+            'simulation_checkpoint_test',
+            'spin_statistics_test',
+            'stratified_sampling_test',
+            'importance_sampling_test',
+            'parameter_sweep_test',
         ]
     def load_tests(self):
         for test_name in self.test_names: